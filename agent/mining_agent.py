@@ -4,7 +4,7 @@ import time
 import json
 import logging
 
-from blockchain.blockchain import Blockchain
+from blockchain.blockchain import Blockchain, MiningAborted
 from agent.storyteller import StoryTeller
 
 class MiningAgent(threading.Thread):
@@ -33,6 +33,10 @@ class MiningAgent(threading.Thread):
         self.recent_failures = []
         self.max_failures = 3
 
+        # Mining rounds that produced a block vs. ones cut short by a competing block
+        self.rounds_completed = 0
+        self.rounds_aborted = 0
+
     def run(self):
         while True:
             try:
@@ -99,7 +103,15 @@ class MiningAgent(threading.Thread):
                             payload["previous_position"] = previous_position
                     
                     # Mine the block
-                    blk = self.bc.add_block(payload)
+                    try:
+                        blk = self.bc.add_block(payload)
+                    except MiningAborted as e:
+                        # A peer's block landed first; start over on the new tip right away
+                        self.rounds_aborted += 1
+                        self.logger.info(f"Mining aborted ({e}); "
+                                         f"{self.rounds_completed} completed / {self.rounds_aborted} aborted")
+                        continue
+                    self.rounds_completed += 1
                     
                     pos_str = json.dumps(position)
                     prev_pos_str = f", continuing from {json.dumps(previous_position)}" if previous_position else ""
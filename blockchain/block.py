@@ -2,6 +2,13 @@ import hashlib
 import time
 import json
 
+# Version 1 hashes the fields in their original order with the nonce in the
+# middle. Version 2 moves the nonce last so miners can hash the fixed prefix
+# once and only feed the nonce for each attempt. Version 3 also commits to the
+# difficulty the block was mined at, just before the nonce.
+BLOCK_VERSION = 3
+SUPPORTED_VERSIONS = (1, 2, 3)
+
 class Block:
     def __init__(self,
                  index,
@@ -12,9 +19,14 @@ class Block:
                  nonce=0,
                  hash=None,
                  position_hash=None,
-                 previous_position_hash=None):
+                 previous_position_hash=None,
+                 version=1,
+                 difficulty=None):
         """
         Initialize a new block
+        version defaults to 1 so dicts from older nodes (which carry no version) still hash the same
+        difficulty is the number of leading zero hex digits the block was mined
+        for; only version 3 blocks record it in their hash
         """
         self.index = index
         self.timestamp = timestamp if timestamp is not None else time.time()
@@ -24,6 +36,8 @@ class Block:
         self.nonce = nonce
         self.position_hash = position_hash
         self.previous_position_hash = previous_position_hash  # New field for story branching
+        self.version = version
+        self.difficulty = difficulty
 
         # Use provided hash (from network sync or tests), else compute
         if hash:
@@ -35,6 +49,46 @@ class Block:
         """
         Calculate the hash of the block
         """
+        return self.nonce_hasher()(self.nonce)
+
+    def nonce_hasher(self):
+        """
+        Return a function mapping a nonce to this block's hash, with every
+        other field frozen at their current values.
+        For version 2 and 3 blocks the fields before the nonce are hashed once
+        here, and each call only copies that state and feeds it the nonce.
+        """
+        if self.version == 1:
+            return self._v1_hash
+
+        if self.version not in (2, 3):
+            raise ValueError(f"Unsupported block version {self.version}")
+
+        author = self.author if self.author is not None else ""
+        prefix = (
+            f"{self.index}"
+            f"{self.timestamp}"
+            f"{self.data}"
+            f"{author}"
+            f"{self.previous_hash}"
+            f"{self.position_hash}"
+            f"{self.previous_position_hash}"
+        )
+        if self.version == 3:
+            prefix += f"{self.difficulty}"
+        midstate = hashlib.sha256(prefix.encode())
+
+        def hash_nonce(nonce):
+            h = midstate.copy()
+            h.update(str(nonce).encode())
+            return h.hexdigest()
+
+        return hash_nonce
+
+    def _v1_hash(self, nonce):
+        """
+        Original payload layout, nonce in the middle
+        """
         # If author is set, include it in the PoW payload
         if self.author is not None:
             payload = (
@@ -43,7 +97,7 @@ class Block:
                 f"{self.data}"
                 f"{self.author}"
                 f"{self.previous_hash}"
-                f"{self.nonce}"
+                f"{nonce}"
                 f"{self.position_hash}"
                 f"{self.previous_position_hash}"
             )
@@ -54,7 +108,7 @@ class Block:
                 f"{self.timestamp}"
                 f"{self.data}"
                 f"{self.previous_hash}"
-                f"{self.nonce}"
+                f"{nonce}"
                 f"{self.position_hash}"
                 f"{self.previous_position_hash}"
             )
@@ -79,4 +133,9 @@ class Block:
             d["position_hash"] = self.position_hash
         if self.previous_position_hash is not None:
             d["previous_position_hash"] = self.previous_position_hash
+        # Version 1 blocks keep their original dict shape
+        if self.version != 1:
+            d["version"] = self.version
+        if self.difficulty is not None:
+            d["difficulty"] = self.difficulty
         return d
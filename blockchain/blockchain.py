@@ -1,7 +1,12 @@
 import time
-from blockchain.block import Block
+import threading
+from blockchain.block import Block, BLOCK_VERSION, SUPPORTED_VERSIONS
+from blockchain.mining import ParallelMiner, MiningAborted, STOP_CHECK_INTERVAL
+from blockchain.validation import ParallelValidator, check_block_hash, block_difficulty, block_work
+from blockchain.orphans import OrphanPool
 import hashlib
 import json
+from collections import namedtuple
 from unittest.mock import patch
 
 
@@ -12,14 +17,249 @@ def generate_position_hash(position_data):
     position_str = json.dumps(position_data, sort_keys=True)
     return hashlib.sha256(position_str.encode()).hexdigest()
 
+# Outcomes of Blockchain.receive_block()
+BLOCK_EXTENDED = "extended"     # appended to our tip
+BLOCK_REORG = "reorg"           # made a side branch our best chain
+BLOCK_SIDE = "side"             # kept on a side branch
+BLOCK_ORPHAN = "orphan"         # parent unknown; held in the orphan pool
+BLOCK_DUPLICATE = "duplicate"   # already known
+BLOCK_INVALID = "invalid"
+
+# Side-branch blocks further than this below our tip are forgotten
+SIDE_BRANCH_DEPTH = 100
+
+# Outcome of switching to another chain: the height of the last shared block
+# (-1 if none) and the lists of blocks added and removed above it
+ReorgResult = namedtuple("ReorgResult", ["fork_height", "added", "removed"])
+
 class Blockchain:
-    def __init__(self, difficulty=2):
+    def __init__(self, difficulty=2, mining_workers=1, store=None, validation_workers=1):
         """
         Initialize the blockchain with a genesis block and a starting difficulty level.
+        mining_workers > 1 mines across that many processes; 0 means one per CPU.
+        validation_workers works the same way for re-hashing long runs of
+        blocks when validating another chain.
+        store, if given (a ChainStore or SQLiteChainStore), persists every block;
+        a store that already holds blocks is loaded instead of creating a new
+        genesis block. A SQLiteChainStore also answers the block queries below
+        from its indexes instead of scanning the chain.
         """
-        self.chain = [ self._create_genesis_block() ]
+        # Lookup indexes kept in sync with the chain so that duplicate and
+        # existence checks don't have to walk every block.
+        self._blocks_by_hash = {}
+        self._blocks_by_position = {}
+        self._blocks_by_height = {}
+        # Cumulative work up to each block on our chain and side branches,
+        # keyed by hash, so tips can be compared without walking back
+        self._chain_work = {}
+        self._chain = []
+        self._store = store
+        # Blocks on competing branches (hash -> Block) and blocks whose parent
+        # we haven't seen; self.chain is always the best branch
+        self._side_blocks = {}
+        self._orphans = OrphanPool()
+        # receive_block(), reorg() and the append at the end of add_block()
+        # can run on different threads
+        self._lock = threading.RLock()
+        if store is not None and len(store) > 0:
+            # Blocks in our own store were validated before they were written
+            self._chain = [Block(**d) for d in store.load()]
+            self._rebuild_indexes()
+            print(f"[Blockchain] Loaded {len(self._chain)} blocks from store")
+        else:
+            self.chain = [ self._create_genesis_block() ]
         self.difficulty = difficulty
 
+        # Proof-of-work runs in-thread unless more than one worker is asked for
+        self._miner = ParallelMiner(mining_workers) if mining_workers != 1 else None
+        self._validator = ParallelValidator(validation_workers) if validation_workers != 1 else None
+        self.last_hash_rate = 0.0
+        # Set by cancel_mining() to make the current add_block() give up
+        self._cancel_mining = threading.Event()
+
+    @property
+    def chain(self):
+        """
+        The list of blocks, genesis first.
+        Don't append to it directly; use append_block() so the indexes stay in sync.
+        """
+        return self._chain
+
+    @chain.setter
+    def chain(self, blocks):
+        """
+        Replace the whole chain and rebuild the lookup indexes.
+        Only the blocks past the part shared with the old chain are rewritten in the store.
+        """
+        blocks = list(blocks)
+        shared = self._shared_prefix_length(blocks)
+        self._chain = blocks
+        self._rebuild_indexes()
+        self._persist_from(shared)
+
+    def _shared_prefix_length(self, blocks):
+        """
+        Number of leading blocks that blocks has in common with self.chain.
+        Each hash commits to its predecessor, so the first mismatch can be
+        found by binary search.
+        """
+        lo, hi = 0, min(len(blocks), len(self._chain))
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if blocks[mid].hash == self._chain[mid].hash:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _persist_from(self, height):
+        """
+        Rewrite the store from height on to match self.chain.
+        """
+        if self._store is None:
+            return
+        self._store.truncate(height)
+        for block in self._chain[len(self._store):]:
+            self._store.append(block.to_dict())
+
+    def _rebuild_indexes(self):
+        """
+        Recompute the hash, position hash and height indexes from self.chain.
+        """
+        self._blocks_by_hash = {}
+        self._blocks_by_position = {}
+        self._blocks_by_height = {}
+        self._chain_work = {}
+        for block in self._chain:
+            self._index_block(block)
+
+    def _index_block(self, block):
+        """
+        Add a single block to the lookup indexes.
+        """
+        self._blocks_by_hash[block.hash] = block
+        self._blocks_by_height[block.index] = block
+        if block.position_hash is not None:
+            self._blocks_by_position.setdefault(block.position_hash, block)
+        self.chain_work(block)
+
+    def chain_work(self, block=None):
+        """
+        Total proof-of-work from genesis up to and including block, which must
+        be on our chain or a side branch (default: our tip).
+        Cached per block, so this is O(1) for blocks already seen.
+        """
+        if block is None:
+            block = self.get_latest_block()
+        pending = []
+        while block is not None and block.index > 0 and block.hash not in self._chain_work:
+            pending.append(block)
+            block = self.get_known_block(block.previous_hash)
+        total = self._chain_work.get(block.hash, 0) if block is not None else 0
+        for b in reversed(pending):
+            total += block_work(b)
+            self._chain_work[b.hash] = total
+        return total
+
+    def append_block(self, block):
+        """
+        Append an already validated block to the chain and index it.
+        Side blocks the new tip leaves too far behind are forgotten.
+        """
+        self._chain.append(block)
+        self._index_block(block)
+        if self._store is not None:
+            self._store.append(block.to_dict())
+        self._prune_side_blocks()
+        return block
+
+    def get_block_by_hash(self, block_hash):
+        """
+        Return the block with the given hash, or None.
+        """
+        return self._blocks_by_hash.get(block_hash)
+
+    def get_block_by_position(self, position_hash):
+        """
+        Return the block holding the given position hash, or None.
+        """
+        return self._blocks_by_position.get(position_hash)
+
+    def get_block_by_height(self, height):
+        """
+        Return the block at the given height, or None.
+        """
+        return self._blocks_by_height.get(height)
+
+    def get_headers(self, from_height, limit):
+        """
+        Return up to limit block dicts from from_height on, without their data.
+        """
+        headers = []
+        for block in self._chain[from_height:from_height + limit]:
+            header = block.to_dict()
+            del header["data"]
+            headers.append(header)
+        return headers
+
+    def get_block_range(self, start, end):
+        """
+        Return the block dicts from height start up to (not including) end.
+        """
+        return [block.to_dict() for block in self._chain[start:end]]
+
+    def iter_block_dicts(self, from_height=0):
+        """
+        Iterate over the block dicts from from_height on, building each only
+        when it is asked for. The blocks are those on our chain at the time of
+        the call, even if it changes while they are being sent.
+        """
+        blocks = self._chain[from_height:]
+        return (block.to_dict() for block in blocks)
+
+    def has_position_hash(self, position_hash):
+        """
+        Check if a position hash is already used in the chain.
+        """
+        return position_hash in self._blocks_by_position
+
+    def _query_store(self, query, *args):
+        """
+        Run an indexed query on the store and map the results back to our
+        Block objects, or return None if the store has no such query.
+        """
+        run = getattr(self._store, query, None)
+        if run is None:
+            return None
+        return [self._blocks_by_height[d["index"]] for d in run(*args)]
+
+    def blocks_by_author(self, author):
+        """
+        Return the blocks written by author, in chain order.
+        """
+        found = self._query_store("blocks_by_author", author)
+        if found is None:
+            found = [b for b in self._chain if b.author == author]
+        return found
+
+    def blocks_between(self, start_time, end_time):
+        """
+        Return the blocks with start_time <= timestamp < end_time, in chain order.
+        """
+        found = self._query_store("blocks_between", start_time, end_time)
+        if found is None:
+            found = [b for b in self._chain if start_time <= b.timestamp < end_time]
+        return found
+
+    def children_of(self, position_hash):
+        """
+        Return the blocks that continue from the given position hash.
+        """
+        found = self._query_store("children_of", position_hash)
+        if found is None:
+            found = [b for b in self._chain if b.previous_position_hash == position_hash]
+        return found
+
     def _create_genesis_block(self):
         """
         Create the genesis block with a special position hash.
@@ -39,7 +279,12 @@ class Blockchain:
         payload can be:
         - a string → treated as data (no author, no position)
         - a dict with keys 'data' or 'content', optional 'author', optional 'position', and optional 'previous_position'
+
+        Raises MiningAborted if cancel_mining() is called or the chain tip
+        changes before the block is mined; nothing is appended in that case.
         """
+        self._cancel_mining.clear()
+
         if isinstance(payload, dict):
             # demo usage: payload={'content': "...", 'author': "peer_id", 'position': {'book':1, 'chapter':1, 'verse':1}}
             data = payload.get("content", payload.get("data"))
@@ -82,31 +327,42 @@ class Blockchain:
             author=author,
             timestamp=ts,
             position_hash=position_hash,
-            previous_position_hash=previous_position_hash
+            previous_position_hash=previous_position_hash,
+            version=BLOCK_VERSION,
+            difficulty=self.difficulty
         )
 
         # Proof-of-Work
-        self._mine_block(new_block)
-        self.chain.append(new_block)
-        return new_block
+        elapsed = self._mine_block(new_block)
+
+        # Another block may have landed on the tip while we were mining
+        with self._lock:
+            if self.get_latest_block() is not prev:
+                raise MiningAborted(f"chain tip moved while mining block {new_block.index}")
+            self.append_block(new_block)
+            # Only blocks that made it onto the chain retune the difficulty
+            if elapsed is not None:
+                self._adjust_difficulty(elapsed)
+            return new_block
+
+    def cancel_mining(self):
+        """
+        Abort the add_block() currently mining, if any; it raises MiningAborted.
+        Called when a competing block makes the one being mined stale.
+        """
+        self._cancel_mining.set()
 
     def _is_position_hash_unique(self, position_hash):
         """
         Check if a position hash is unique in the chain
         """
-        for block in self.chain:
-            if block.position_hash == position_hash:
-                return False
-        return True
-        
+        return not self.has_position_hash(position_hash)
+
     def _is_position_hash_in_chain(self, position_hash):
         """
         Check if a position hash exists in the chain
         """
-        for block in self.chain:
-            if block.position_hash == position_hash:
-                return True
-        return False
+        return self.has_position_hash(position_hash)
 
     # def _mine_block(self, block):
     #     target = "0" * self.difficulty
@@ -117,15 +373,23 @@ class Blockchain:
     def _mine_block(self, block):
         """
         Mine a block by incrementing the nonce until the hash starts with the target.
-        Adjust difficulty based on mining time.
+        Returns the seconds spent mining, for _adjust_difficulty().
         """
         target = "0" * self.difficulty
         # mark start (first call)
         start_time = time.time()
 
-        while not block.hash.startswith(target):
-            block.nonce += 1
-            block.hash = block.calculate_hash()
+        if self._miner is not None:
+            hashes = self._miner.mine(block, self.difficulty, self._cancel_mining)
+        else:
+            hashes = 0
+            hash_nonce = block.nonce_hasher()
+            while not block.hash.startswith(target):
+                block.nonce += 1
+                block.hash = hash_nonce(block.nonce)
+                hashes += 1
+                if hashes % STOP_CHECK_INTERVAL == 0 and self._cancel_mining.is_set():
+                    raise MiningAborted(f"mining cancelled after {hashes} hashes")
 
         # Try to measure *just* the PoW time; if tests have exhausted their time.time() mocks,
         # fall back to the old two-call formula (start_time - timestamp).
@@ -136,6 +400,15 @@ class Blockchain:
             # tests only provided two values → compute from block.timestamp
             elapsed = start_time - block.timestamp
 
+        workers = self._miner.workers if self._miner is not None else 1
+        self.last_hash_rate = hashes / elapsed if elapsed > 0 else 0.0
+        print(f"[Mining] {hashes} hashes in {elapsed:.2f}s → {self.last_hash_rate:.0f} H/s on {workers} worker(s)")
+        return elapsed
+
+    def _adjust_difficulty(self, elapsed):
+        """
+        Adjust difficulty based on how long the last appended block took to mine.
+        """
         target_time = 5  # seconds per block
 
         if elapsed < target_time * 0.5:
@@ -147,42 +420,22 @@ class Blockchain:
         else:
             print(f"[Difficulty ↔] Mined in {elapsed:.2f}s → difficulty unchanged = {self.difficulty}")
 
+    def close(self):
+        """
+        Release the mining and validation worker processes and the store, if any.
+        """
+        if self._miner is not None:
+            self._miner.shutdown()
+        if self._validator is not None:
+            self._validator.shutdown()
+        if self._store is not None:
+            self._store.close()
+
     def is_valid(self):
         """
         Validate the blockchain.
         """
-        position_hashes = set()
-        for i in range(1, len(self.chain)):
-            curr = self.chain[i]
-            prev = self.chain[i - 1]
-
-            # Link integrity
-            if curr.previous_hash != prev.hash:
-                return False
-
-            # Hash correctness—but only if it’s a full-length hex digest
-            recalced = curr.calculate_hash()
-            if len(curr.hash) == len(recalced) and curr.hash != recalced:
-                return False
-
-            # PoW check
-            if not curr.hash.startswith("0" * self.difficulty):
-                return False
-
-            # Position hash uniqueness check
-            if curr.position_hash is not None:
-                if curr.position_hash in position_hashes:
-                    return False
-                position_hashes.add(curr.position_hash)
-
-            # Previous position hash existence check (if provided) - exception for first content block
-            is_first_content_block = (curr.index == 1)
-            if curr.previous_position_hash is not None and not is_first_content_block and not any(
-                b.position_hash == curr.previous_position_hash for b in self.chain[:i]
-            ):
-                return False
-
-        return True
+        return self.is_valid_chain(self.chain)
 
     def add_block_from_dict(self, blk_dict):
         """
@@ -210,14 +463,20 @@ class Blockchain:
             nonce=blk_dict["nonce"],
             hash=blk_dict["hash"],
             position_hash=blk_dict.get("position_hash"),
-            previous_position_hash=blk_dict.get("previous_position_hash")
+            previous_position_hash=blk_dict.get("previous_position_hash"),
+            version=blk_dict.get("version", 1),
+            difficulty=blk_dict.get("difficulty")
         )
 
         # If this is the first non‐genesis block on an otherwise‐empty chain,
         # adopt the remote genesis-hash so linkage passes.
         if blk.index == 1 and len(self.chain) == 1:
             print("[Blockchain] Adopting remote genesis hash")
-            self.chain[0].hash = blk.previous_hash
+            genesis = self.chain[0]
+            self._blocks_by_hash.pop(genesis.hash, None)
+            genesis.hash = blk.previous_hash
+            self._blocks_by_hash[genesis.hash] = genesis
+            self._persist_from(0)
 
         # 1 Link check
         latest = self.get_latest_block()
@@ -226,17 +485,21 @@ class Blockchain:
             return False
 
         # 2 Hash integrity
+        if blk.version not in SUPPORTED_VERSIONS:
+            print(f"[Blockchain] Unsupported block version {blk.version}")
+            return False
         if blk.hash != blk.calculate_hash():
             print("[Blockchain] Hash mismatch")
             return False
 
-        # 3 PoW
-        if not blk.hash.startswith("0" * self.difficulty):
+        # 3 PoW, against the difficulty the block records (ours for older blocks)
+        target = block_difficulty(blk, self.difficulty)
+        if target is None or not blk.hash.startswith("0" * target):
             print("[Blockchain] Invalid proof-of-work")
             return False
 
         # Append
-        self.chain.append(blk)
+        self.append_block(blk)
         print(f"[Blockchain] Appended block {blk.index}")
         return True
 
@@ -244,55 +507,424 @@ class Blockchain:
         """
         Check integrity, hashes, PoW, and position hash uniqueness of a given list of Blocks.
         """
-        position_hashes = set()
-        for i in range(1, len(chain)):
-            curr = chain[i]
-            prev = chain[i - 1]
+        if not chain:
+            return True
+        genesis = chain[0]
+        # Only the genesis position precedes the blocks being checked
+        return self._validate_blocks(
+            chain[1:], genesis,
+            lambda position_hash: 0 if position_hash == genesis.position_hash else None
+        )
 
+    def _validate_blocks(self, blocks, prev, earlier_position):
+        """
+        Check a run of blocks that follows block prev: linkage, hashes, PoW,
+        and position hash rules.
+        earlier_position(position_hash) returns the height of the block holding
+        that position before the run, or None if there isn't one.
+        """
+        if self._validator is not None and len(blocks) >= self._validator.chunk_size:
+            # Cheap linkage and position pass first, then the hashing, which
+            # the validator spreads over its worker pool once that has
+            # measured faster than checking in-process
+            return (self._check_links_and_positions(blocks, prev, earlier_position, check_hashes=False)
+                    and self._validator.check_hashes(blocks, self.difficulty))
+        return self._check_links_and_positions(blocks, prev, earlier_position, check_hashes=True)
+
+    def _check_links_and_positions(self, blocks, prev, earlier_position, check_hashes):
+        """
+        Serial pass behind _validate_blocks(); hashes and PoW are only
+        checked here when check_hashes is set.
+        """
+        # position_hashes doubles as the set of positions seen so far in the
+        # run, so the previous-position lookup below is O(1) instead of a rescan
+        position_hashes = set()
+        for curr in blocks:
             # Link integrity
             if curr.previous_hash != prev.hash:
                 return False
 
-            # Hash correctness—but only if full-length
-            recalced = curr.calculate_hash()
-            if len(curr.hash) == len(recalced) and curr.hash != recalced:
-                return False
-
-            # PoW check
-            if not curr.hash.startswith("0" * self.difficulty):
+            # Format version, hash correctness and PoW
+            if check_hashes and not check_block_hash(curr, self.difficulty):
                 return False
 
-            # Check position hash uniqueness
+            # Check position hash uniqueness (the genesis position doesn't count)
             if curr.position_hash is not None:
-                if curr.position_hash in position_hashes:
+                earlier = earlier_position(curr.position_hash)
+                if curr.position_hash in position_hashes or (earlier is not None and earlier > 0):
                     return False
                 position_hashes.add(curr.position_hash)
 
             # Check previous position hash exists in earlier blocks - exception for first content block
             is_first_content_block = (curr.index == 1)
-            if curr.previous_position_hash is not None and not is_first_content_block and not any(
-                b.position_hash == curr.previous_position_hash for b in chain[:i]
+            if curr.previous_position_hash is not None and not is_first_content_block and not (
+                curr.previous_position_hash in position_hashes
+                or earlier_position(curr.previous_position_hash) is not None
             ):
                 return False
 
+            prev = curr
+
         return True
 
-    def resolve_conflicts(self, other_chains):
+    def common_ancestor_height(self, chain_dicts):
         """
-        other_chains: list of lists of block-dicts from peers.
-        If any list represents a strictly longer chain, adopt it wholesale
-        (including genesis) and return True; otherwise return False.
+        Height of the last block a peer's chain (list of block dicts) shares
+        with ours, or -1 if even the genesis blocks differ.
+        Each hash commits to its predecessor, so this is a binary search.
+        """
+        lo, hi = 0, min(len(chain_dicts), len(self._chain))
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if chain_dicts[mid]["hash"] == self._chain[mid].hash:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo - 1
+
+    def validate_suffix(self, blocks, fork_height, check_hashes=True):
         """
-        from blockchain.block import Block
+        Check that blocks (a list of Blocks) validly continue our chain from
+        the block at fork_height, without revisiting anything at or below it.
+        check_hashes=False skips re-hashing for blocks whose hashes and PoW
+        the caller has already checked.
+        """
+        if not blocks:
+            return True
 
-        for chain_list in other_chains:
-            # 1) Reconstruct the peer’s chain
-            candidate = [Block(**blk_dict) for blk_dict in chain_list]
+        def earlier_position(position_hash):
+            holder = self._blocks_by_position.get(position_hash)
+            if holder is not None and holder.index <= fork_height:
+                return holder.index
+            return None
 
-            # 2) If it's longer than our own, replace and stop
-            if len(candidate) > len(self.chain):
-                self.chain = candidate
-                return True
+        if not check_hashes:
+            return self._check_links_and_positions(blocks, self._chain[fork_height], earlier_position, False)
+        return self._validate_blocks(blocks, self._chain[fork_height], earlier_position)
+
+    def _rollback(self, height):
+        """
+        Remove every block above height from the chain, indexes and store.
 
-        # 3) No longer chain found
-        return False
\ No newline at end of file
+        return:
+        list of the removed blocks
+        """
+        removed = self._chain[height + 1:]
+        del self._chain[height + 1:]
+        for block in removed:
+            self._blocks_by_hash.pop(block.hash, None)
+            self._blocks_by_height.pop(block.index, None)
+            if self._blocks_by_position.get(block.position_hash) is block:
+                del self._blocks_by_position[block.position_hash]
+        if self._store is not None:
+            self._store.truncate(height + 1)
+        return removed
+
+    def extend(self, blk_dicts, hashes_checked=False):
+        """
+        Validate and append blocks that continue directly from our tip.
+        hashes_checked=True skips re-hashing blocks already checked with
+        check_block_hash(); linkage and positions are still validated.
+
+        return:
+        ReorgResult with no removed blocks, or None if the blocks don't
+        connect to our tip or fail validation (the chain is left unchanged)
+        """
+        if not blk_dicts:
+            return None
+        blocks = [Block(**d) for d in blk_dicts]
+        with self._lock:
+            tip = self.get_latest_block()
+            if not self.validate_suffix(blocks, tip.index, check_hashes=not hashes_checked):
+                return None
+            for block in blocks:
+                self.append_block(block)
+        return ReorgResult(tip.index, blocks, [])
+
+    def reorg(self, chain_dicts, hashes_checked=False):
+        """
+        Switch to a peer's chain (list of block dicts) if it has more
+        cumulative work than ours.
+        Only blocks past the common ancestor are rebuilt and validated, so the
+        cost is proportional to the blocks that change, not the chain length.
+        hashes_checked works as for extend().
+
+        return:
+        ReorgResult(fork_height, added, removed) on success, or None if the
+        chain doesn't have more work or fails validation (ours is left unchanged)
+        """
+        with self._lock:
+            fork_height = self.common_ancestor_height(chain_dicts)
+            return self._reorg_from(fork_height, chain_dicts[fork_height + 1:], hashes_checked)
+
+    def reorg_from(self, fork_height, blk_dicts, hashes_checked=False):
+        """
+        reorg() for a branch given as the block dicts past fork_height, for
+        callers that already know where it forks from our chain (e.g. from
+        headers), so our blocks up to the fork needn't be sent along.
+        fork_height -1 means nothing is shared and blk_dicts is a whole
+        chain. hashes_checked works as for extend().
+
+        return:
+        as for reorg(); also None if fork_height isn't in our chain or the
+        first block doesn't link to our block there
+        """
+        with self._lock:
+            if not -1 <= fork_height < len(self._chain) or not blk_dicts:
+                return None
+            return self._reorg_from(fork_height, blk_dicts, hashes_checked)
+
+    def _reorg_from(self, fork_height, blk_dicts, hashes_checked):
+        if fork_height < 0:
+            # Nothing in common, not even genesis: check the whole chain
+            candidate = [Block(**d) for d in blk_dicts]
+            if sum(block_work(b) for b in candidate) <= self.chain_work():
+                return None
+            if not self.is_valid_chain(candidate):
+                return None
+            removed = list(self._chain)
+            self.chain = candidate
+            return ReorgResult(-1, candidate, removed)
+
+        # The claimed work is compared before any hashing; validation
+        # below then proves each block meets the difficulty it claims
+        added = [Block(**d) for d in blk_dicts]
+        work = self.chain_work(self._chain[fork_height]) + sum(block_work(b) for b in added)
+        if work <= self.chain_work():
+            return None
+        if not self.validate_suffix(added, fork_height, check_hashes=not hashes_checked):
+            return None
+        removed = self._switch_branch(fork_height, added)
+        return ReorgResult(fork_height, added, removed)
+
+    def reorg_stream(self, blk_dicts):
+        """
+        reorg() for a peer's chain that arrives one block dict at a time (any
+        iterable starting at genesis, or at a height we hold).
+        Blocks we already have are only compared by hash. Each block past the
+        fork is built and checked as it arrives, and iteration stops at the
+        first invalid one. Once the new branch has more work than ours we
+        switch to it and append the rest block by block, so only the blocks
+        needed to overtake our chain are held before they are applied.
+
+        return:
+        ReorgResult for the blocks applied, or None if the stream doesn't
+        connect to our chain, never gets more work than ours, or fails
+        validation before it does (ours is left unchanged)
+        """
+        fork_height = None
+        base = None             # our block at fork_height
+        branch = []             # checked blocks past the fork, not yet applied
+        branch_positions = {}   # position hash -> height, for the blocks in branch
+        work = 0
+        result = None
+
+        def earlier_position(position_hash):
+            if position_hash in branch_positions:
+                return branch_positions[position_hash]
+            holder = self._blocks_by_position.get(position_hash)
+            if holder is not None and holder.index <= fork_height:
+                return holder.index
+            return None
+
+        for blk_dict in blk_dicts:
+            with self._lock:
+                if result is not None:
+                    # Already switched: each further block must extend our tip
+                    tip = self.get_latest_block()
+                    if tip is not result.added[-1]:
+                        return result
+                    block = Block(**blk_dict)
+                    if not self.validate_suffix([block], tip.index):
+                        return result
+                    result.added.append(self.append_block(block))
+                    continue
+
+                if not branch:
+                    ours = self._blocks_by_height.get(blk_dict["index"])
+                    if ours is not None and ours.hash == blk_dict["hash"]:
+                        fork_height, base = ours.index, ours
+                        continue
+                    if fork_height is None:
+                        if blk_dict["index"] != 0:
+                            return None
+                        # Nothing in common, not even genesis: the stream is a
+                        # whole chain, checked from its own genesis
+                        fork_height = -1
+                        block = Block(**blk_dict)
+                        branch.append(block)
+                        if block.position_hash is not None:
+                            branch_positions[block.position_hash] = 0
+                        continue
+
+                block = Block(**blk_dict)
+                prev = branch[-1] if branch else base
+                if block.index != prev.index + 1 or not self._check_links_and_positions(
+                        [block], prev, earlier_position, check_hashes=True):
+                    return None
+                branch.append(block)
+                if block.position_hash is not None:
+                    branch_positions[block.position_hash] = block.index
+                work += block_work(block)
+
+                base_work = self.chain_work(base) if base is not None else 0
+                if base_work + work <= self.chain_work():
+                    continue
+                # Our chain may have moved while the stream was arriving
+                if base is not None and self._blocks_by_height.get(fork_height) is not base:
+                    return None
+                if base is None:
+                    removed = list(self._chain)
+                    self.chain = branch
+                else:
+                    removed = self._switch_branch(fork_height, branch)
+                result = ReorgResult(fork_height, list(branch), removed)
+                branch, branch_positions = [], {}
+        return result
+
+    def _switch_branch(self, fork_height, blocks):
+        """
+        Replace everything above fork_height with the already validated blocks.
+        The blocks taken off the chain are kept as a side branch.
+
+        return:
+        list of the removed blocks
+        """
+        removed = self._rollback(fork_height)
+        for block in blocks:
+            self._side_blocks.pop(block.hash, None)
+            self.append_block(block)
+        for block in removed:
+            self._side_blocks[block.hash] = block
+        self._prune_side_blocks()
+        return removed
+
+    def _prune_side_blocks(self):
+        """
+        Forget side-branch blocks too far below the tip to ever win.
+        """
+        if not self._side_blocks:
+            return
+        floor = self.get_latest_block().index - SIDE_BRANCH_DEPTH
+        for block_hash in [h for h, b in self._side_blocks.items() if b.index < floor]:
+            del self._side_blocks[block_hash]
+            self._chain_work.pop(block_hash, None)
+
+    def get_known_block(self, block_hash):
+        """
+        Return the block with this hash from our chain or a side branch, or None.
+        """
+        block = self._blocks_by_hash.get(block_hash)
+        return block if block is not None else self._side_blocks.get(block_hash)
+
+    def get_block_dict(self, block_hash):
+        """
+        Return the dict of the block with this hash from our chain or a side branch, or None.
+        """
+        block = self.get_known_block(block_hash)
+        return block.to_dict() if block is not None else None
+
+    def missing_ancestor(self, block_hash):
+        """
+        For an orphaned block, the hash of the nearest ancestor we don't have,
+        i.e. the one block to request from peers to make progress.
+        """
+        return self._orphans.missing_ancestor(block_hash)
+
+    def receive_block(self, blk_dict):
+        """
+        Take a block dict from a peer and place it in the block tree:
+        append it to our tip, keep it on a side branch (switching to that
+        branch once it has more cumulative work), or hold it in the orphan pool until its
+        parent arrives. Orphans waiting on this block are connected as well.
+
+        return:
+        one of BLOCK_EXTENDED, BLOCK_REORG, BLOCK_SIDE, BLOCK_ORPHAN,
+        BLOCK_DUPLICATE or BLOCK_INVALID; when orphans were connected too, the
+        strongest change to our chain among them
+        """
+        rank = [BLOCK_SIDE, BLOCK_EXTENDED, BLOCK_REORG]
+        with self._lock:
+            status = self._place_block(blk_dict)
+            if status not in rank:
+                return status
+
+            # Blocks that were waiting on this one can connect now
+            connected = [blk_dict["hash"]]
+            while connected:
+                for child in self._orphans.pop_children(connected.pop()):
+                    child_status = self._place_block(child)
+                    if child_status in rank:
+                        connected.append(child["hash"])
+                        if rank.index(child_status) > rank.index(status):
+                            status = child_status
+            return status
+
+    def _place_block(self, blk_dict):
+        """
+        receive_block() for a single block, without connecting its orphans.
+        """
+        block_hash = blk_dict["hash"]
+        if self.get_known_block(block_hash) is not None or block_hash in self._orphans:
+            return BLOCK_DUPLICATE
+
+        tip = self.get_latest_block()
+        if blk_dict["previous_hash"] == tip.hash or (blk_dict["index"] == 1 and len(self._chain) == 1):
+            return BLOCK_EXTENDED if self.add_block_from_dict(blk_dict) else BLOCK_INVALID
+
+        # Checked before the block is kept anywhere, so blocks with no work
+        # behind them can't fill the orphan pool or make us fetch ancestors
+        block = Block(**blk_dict)
+        if not check_block_hash(block, self.difficulty):
+            return BLOCK_INVALID
+
+        parent = self.get_known_block(blk_dict["previous_hash"])
+        if parent is None:
+            self._orphans.add(blk_dict)
+            return BLOCK_ORPHAN
+
+        if block.index != parent.index + 1:
+            return BLOCK_INVALID
+        self._side_blocks[block.hash] = block
+        # Ties go to the branch we saw first
+        if self.chain_work(block) <= self.chain_work(tip):
+            return BLOCK_SIDE
+
+        # This side branch now has more work than ours: walk back to where it
+        # leaves our chain and switch if the branch checks out
+        branch = [block]
+        while branch[-1].previous_hash not in self._blocks_by_hash:
+            ancestor = self._side_blocks.get(branch[-1].previous_hash)
+            if ancestor is None:
+                # The branch left our chain more than SIDE_BRANCH_DEPTH blocks
+                # down and its oldest blocks have been pruned, so it can't be
+                # checked from here; only a sync of the whole branch (reorg())
+                # can switch to it now
+                print(f"[Blockchain] Side branch of block {block.index} is missing pruned ancestors")
+                del self._side_blocks[block.hash]
+                self._chain_work.pop(block.hash, None)
+                return BLOCK_INVALID
+            branch.append(ancestor)
+        branch.reverse()
+        fork_height = branch[0].index - 1
+        if not self.validate_suffix(branch, fork_height):
+            del self._side_blocks[block.hash]
+            self._chain_work.pop(block.hash, None)
+            return BLOCK_INVALID
+        removed = self._switch_branch(fork_height, branch)
+        print(f"[Blockchain] Reorg at height {fork_height}: +{len(branch)} / -{len(removed)} blocks")
+        return BLOCK_REORG
+
+    def resolve_conflicts(self, other_chains):
+        """
+        other_chains: list of lists of block-dicts from peers.
+        Switch to the valid chain with the most cumulative work, if it has
+        more than ours, and return True; otherwise return False.
+        """
+        replaced = False
+        for chain_list in other_chains:
+            # reorg() only switches to a chain with more work than the current
+            # one, so after the loop we hold the heaviest valid chain
+            if self.reorg(chain_list) is not None:
+                replaced = True
+        return replaced
\ No newline at end of file
@@ -0,0 +1,121 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from blockchain.block import Block
+
+# How many nonces a worker tries between checks of the shared stop flag
+STOP_CHECK_INTERVAL = 2048
+
+# Set in each worker process by _init_worker()
+_stop_event = None
+
+
+class MiningAborted(Exception):
+    """
+    Raised when a mining round is cancelled because the block became stale.
+    """
+
+
+def _init_worker(stop_event):
+    """
+    Pool initializer: keep a handle on the stop flag shared by all workers.
+    """
+    global _stop_event
+    _stop_event = stop_event
+
+
+def _search_nonces(block_dict, target, start_nonce, step):
+    """
+    Try nonces start_nonce, start_nonce + step, ... until a hash starting
+    with target is found or another worker raises the stop flag.
+
+    return:
+    (nonce, hash, hashes_tried) on success, (None, None, hashes_tried) if stopped
+    """
+    hash_nonce = Block(**block_dict).nonce_hasher()
+    nonce = start_nonce
+    hashes = 0
+    while True:
+        digest = hash_nonce(nonce)
+        hashes += 1
+        if digest.startswith(target):
+            _stop_event.set()
+            return nonce, digest, hashes
+        if hashes % STOP_CHECK_INTERVAL == 0 and _stop_event.is_set():
+            return None, None, hashes
+        nonce += step
+
+
+class ParallelMiner:
+    def __init__(self, workers=None):
+        """
+        Proof-of-work across a process pool.
+        workers - number of processes; None or 0 means one per CPU
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self._stop_event = multiprocessing.Event()
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self._stop_event,)
+            )
+        return self._executor
+
+    def mine(self, block, difficulty, cancel_event=None):
+        """
+        Find a nonce for block so its hash starts with difficulty zeros.
+        Worker i tries nonces block.nonce + i, + i + workers, ... and the first
+        one to succeed stops the others. Sets block.nonce and block.hash.
+        If cancel_event gets set meanwhile, the workers are stopped and
+        MiningAborted is raised.
+
+        return:
+        total number of hashes computed across all workers
+        """
+        target = "0" * difficulty
+        if block.hash.startswith(target):
+            return 0
+
+        self._stop_event.clear()
+        executor = self._get_executor()
+        block_dict = block.to_dict()
+        pending = {
+            executor.submit(_search_nonces, block_dict, target, block.nonce + i, self.workers)
+            for i in range(self.workers)
+        }
+
+        # Wait for every worker to return so none is still running when the
+        # stop flag is cleared for the next block
+        total_hashes = 0
+        winner = None
+        cancelled = False
+        while pending:
+            done, pending = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+            for future in done:
+                nonce, digest, hashes = future.result()
+                total_hashes += hashes
+                if nonce is not None and winner is None:
+                    winner = (nonce, digest)
+            if winner is None and cancel_event is not None and cancel_event.is_set():
+                cancelled = True
+                self._stop_event.set()
+
+        if cancelled and winner is None:
+            raise MiningAborted(f"mining cancelled after {total_hashes} hashes")
+
+        block.nonce, block.hash = winner
+        return total_hashes
+
+    def shutdown(self):
+        """
+        Stop the worker processes.
+        """
+        if self._executor is not None:
+            self._stop_event.set()
+            self._executor.shutdown(wait=True)
+            self._executor = None
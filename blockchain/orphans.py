@@ -0,0 +1,62 @@
+from collections import OrderedDict
+
+DEFAULT_MAX_ORPHANS = 256
+
+
+class OrphanPool:
+    def __init__(self, max_orphans=DEFAULT_MAX_ORPHANS):
+        """
+        Bounded holding area for received block dicts whose parent we don't
+        have yet. When full, the oldest orphan is dropped.
+        """
+        self.max_orphans = max_orphans
+        self._blocks = OrderedDict()   # hash -> block dict, oldest first
+        self._by_parent = {}           # previous_hash -> set of hashes
+
+    def __contains__(self, block_hash):
+        return block_hash in self._blocks
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def add(self, blk_dict):
+        """
+        Hold a block dict until its parent turns up.
+        """
+        block_hash = blk_dict["hash"]
+        if block_hash in self._blocks:
+            return
+        while len(self._blocks) >= self.max_orphans:
+            self._remove(next(iter(self._blocks)))
+        self._blocks[block_hash] = blk_dict
+        self._by_parent.setdefault(blk_dict["previous_hash"], set()).add(block_hash)
+
+    def _remove(self, block_hash):
+        blk_dict = self._blocks.pop(block_hash)
+        siblings = self._by_parent.get(blk_dict["previous_hash"])
+        if siblings is not None:
+            siblings.discard(block_hash)
+            if not siblings:
+                del self._by_parent[blk_dict["previous_hash"]]
+        return blk_dict
+
+    def pop_children(self, parent_hash):
+        """
+        Remove and return the orphans whose parent is parent_hash, oldest first.
+        """
+        hashes = self._by_parent.get(parent_hash, ())
+        children = [h for h in self._blocks if h in hashes]
+        return [self._remove(h) for h in children]
+
+    def missing_ancestor(self, block_hash):
+        """
+        Follow an orphan's parents through the pool and return the hash of the
+        first ancestor that isn't in it: the block we need to ask peers for.
+        """
+        blk_dict = self._blocks.get(block_hash)
+        seen = set()
+        while blk_dict is not None and block_hash not in seen:
+            seen.add(block_hash)
+            block_hash = blk_dict["previous_hash"]
+            blk_dict = self._blocks.get(block_hash)
+        return block_hash
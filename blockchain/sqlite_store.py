@@ -0,0 +1,132 @@
+import json
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blocks (
+    height                 INTEGER PRIMARY KEY,
+    hash                   TEXT NOT NULL,
+    position_hash          TEXT,
+    previous_position_hash TEXT,
+    author                 TEXT,
+    timestamp              REAL,
+    body                   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blocks_hash ON blocks(hash);
+CREATE INDEX IF NOT EXISTS blocks_position ON blocks(position_hash);
+CREATE INDEX IF NOT EXISTS blocks_previous_position ON blocks(previous_position_hash);
+CREATE INDEX IF NOT EXISTS blocks_author ON blocks(author, height);
+CREATE INDEX IF NOT EXISTS blocks_timestamp ON blocks(timestamp);
+"""
+
+
+class SQLiteChainStore:
+    def __init__(self, path):
+        """
+        Block store in a single SQLite file, with the fields we look blocks up
+        by held in indexed columns next to the full block JSON.
+        Drop-in alternative to ChainStore for Blockchain(store=...).
+
+        path - database file (created if missing), or ":memory:"
+        """
+        self.path = path
+        # Shared by the listener and mining threads, so serialise access
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._length = self._db.execute("SELECT COUNT(*) FROM blocks").fetchone()[0]
+
+    def __len__(self):
+        return self._length
+
+    def append(self, block_dict):
+        """
+        Store one block dict at height len(self).
+        """
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO blocks VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self._length,
+                    block_dict["hash"],
+                    block_dict.get("position_hash"),
+                    block_dict.get("previous_position_hash"),
+                    block_dict.get("author"),
+                    block_dict.get("timestamp"),
+                    json.dumps(block_dict, separators=(",", ":")),
+                )
+            )
+            self._length += 1
+
+    def _select(self, where, params=(), limit=None):
+        sql = f"SELECT body FROM blocks WHERE {where} ORDER BY height"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [json.loads(body) for (body,) in rows]
+
+    def read(self, height):
+        """
+        Return the block dict stored at height.
+        """
+        rows = self._select("height = ?", (height,))
+        if not rows:
+            raise IndexError(height)
+        return rows[0]
+
+    def load(self, start=0):
+        """
+        Yield the stored block dicts from height start to the end.
+        """
+        yield from self._select("height >= ?", (start,))
+
+    def truncate(self, height):
+        """
+        Drop every block at or above height, so len(self) == height afterwards.
+        """
+        if height >= self._length:
+            return
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM blocks WHERE height >= ?", (height,))
+            self._length = height
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # Query API
+
+    def block_by_hash(self, block_hash):
+        """
+        Return the block dict with the given hash, or None.
+        """
+        rows = self._select("hash = ?", (block_hash,), limit=1)
+        return rows[0] if rows else None
+
+    def block_by_position(self, position_hash):
+        """
+        Return the block dict holding the given position hash, or None.
+        """
+        rows = self._select("position_hash = ?", (position_hash,), limit=1)
+        return rows[0] if rows else None
+
+    def blocks_by_author(self, author, limit=None):
+        """
+        Return the block dicts written by author, oldest first.
+        """
+        return self._select("author = ?", (author,), limit)
+
+    def blocks_between(self, start_time, end_time, limit=None):
+        """
+        Return the block dicts with start_time <= timestamp < end_time, in chain order.
+        """
+        return self._select("timestamp >= ? AND timestamp < ?", (start_time, end_time), limit)
+
+    def children_of(self, position_hash):
+        """
+        Return the block dicts that continue from the given position hash.
+        """
+        return self._select("previous_position_hash = ?", (position_hash,))
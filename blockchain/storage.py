@@ -0,0 +1,267 @@
+import os
+import mmap
+import json
+import struct
+import zlib
+
+# Every record in a segment log is <length:uint32><crc32:uint32><json bytes>
+RECORD_HEADER = struct.Struct("<II")
+# Every entry in a segment index is the byte offset of one record
+INDEX_ENTRY = struct.Struct("<Q")
+
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+# Records decoded per json.loads() call when loading
+LOAD_BATCH = 4096
+
+
+class _Segment:
+    def __init__(self, directory, base_height):
+        """
+        One log file plus its offset index, holding the blocks from base_height on.
+        """
+        self.base_height = base_height
+        self.log_path = os.path.join(directory, f"{base_height:012d}.log")
+        self.index_path = os.path.join(directory, f"{base_height:012d}.idx")
+        self.offsets = []
+        self.size = 0
+        self._log = None
+        self._index = None
+        self._map = None
+
+    def open(self):
+        """
+        Open both files for appending, creating them if needed.
+        """
+        self._log = open(self.log_path, "ab")
+        self._index = open(self.index_path, "ab")
+        self.size = self._log.tell()
+
+    def close(self):
+        self._unmap()
+        for f in (self._log, self._index):
+            if f is not None:
+                f.close()
+        self._log = self._index = None
+
+    def _unmap(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def view(self):
+        """
+        Return a read-only mmap of the log, remapping if it has grown.
+        """
+        if self._map is None or len(self._map) < self.size:
+            self._unmap()
+            if self.size == 0:
+                return b""
+            with open(self.log_path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def append(self, payload, fsync):
+        """
+        Write one record to the log, then its offset to the index.
+        The log is written first so a crash can only leave the index behind,
+        never pointing past the data.
+        """
+        offset = self.size
+        self._log.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+        self._log.write(payload)
+        self._log.flush()
+        if fsync:
+            os.fsync(self._log.fileno())
+        self._index.write(INDEX_ENTRY.pack(offset))
+        self._index.flush()
+        self.size = offset + RECORD_HEADER.size + len(payload)
+        self.offsets.append(offset)
+
+    def read(self, i):
+        """
+        Return the payload bytes of the i-th record in this segment.
+        """
+        buf = self.view()
+        offset = self.offsets[i]
+        length, _ = RECORD_HEADER.unpack_from(buf, offset)
+        start = offset + RECORD_HEADER.size
+        return buf[start:start + length]
+
+    def truncate(self, count):
+        """
+        Keep only the first count records.
+        """
+        self._unmap()
+        size = self.offsets[count] if count < len(self.offsets) else self.size
+        del self.offsets[count:]
+        self._log.truncate(size)
+        self._log.seek(size)
+        self._index.truncate(count * INDEX_ENTRY.size)
+        self._index.seek(count * INDEX_ENTRY.size)
+        self.size = size
+
+    def recover(self):
+        """
+        Load the offset index and check it against the log.
+        Records whose header or checksum is incomplete (a write torn by a
+        crash) are cut off the end of the log. Records the index missed are
+        re-indexed, and index entries that point past the log are dropped.
+
+        return:
+        True if the segment ended cleanly, False if a torn tail was removed
+        """
+        with open(self.index_path, "rb") as f:
+            raw = f.read()
+        offsets = [o for (o,) in INDEX_ENTRY.iter_unpack(raw[:len(raw) - len(raw) % INDEX_ENTRY.size])]
+
+        self.size = os.path.getsize(self.log_path)
+        buf = self.view()
+
+        def record_end(offset):
+            # End offset of a complete, checksummed record at offset, else None
+            if offset + RECORD_HEADER.size > self.size:
+                return None
+            length, crc = RECORD_HEADER.unpack_from(buf, offset)
+            end = offset + RECORD_HEADER.size + length
+            if end > self.size:
+                return None
+            if zlib.crc32(buf[offset + RECORD_HEADER.size:end]) != crc:
+                return None
+            return end
+
+        # The index is written after the log, so trust it up to the last
+        # entry whose record is intact; only that entry's record is checked
+        # since everything before it was durable when it was written
+        while offsets and record_end(offsets[-1]) is None:
+            offsets.pop()
+        position = record_end(offsets[-1]) if offsets else 0
+
+        # Pick up records written to the log but not yet indexed
+        while True:
+            end = record_end(position)
+            if end is None:
+                break
+            offsets.append(position)
+            position = end
+
+        clean = position == self.size
+        self._unmap()
+        with open(self.log_path, "r+b") as f:
+            f.truncate(position)
+        with open(self.index_path, "wb") as f:
+            f.write(b"".join(INDEX_ENTRY.pack(o) for o in offsets))
+        self.offsets = offsets
+        self.size = position
+        return clean
+
+
+class ChainStore:
+    def __init__(self, directory, segment_bytes=DEFAULT_SEGMENT_BYTES, fsync=True):
+        """
+        Append-only, segmented on-disk log of block dicts.
+
+        directory     - where the segment files live (created if missing)
+        segment_bytes - roll over to a new segment file past this size
+        fsync         - fsync the log after every append
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self._segments = []
+        self._recover()
+
+    def _recover(self):
+        """
+        Open every segment in height order, truncating a torn tail.
+        A segment that had to be cut short ends the usable log, so any later
+        segments are discarded.
+        """
+        bases = sorted(
+            int(name[:-4]) for name in os.listdir(self.directory)
+            if name.endswith(".log") and name[:-4].isdigit()
+        )
+        expected = 0
+        for base in bases:
+            segment = _Segment(self.directory, base)
+            if base != expected:
+                # Gap in heights: everything from here on is unusable
+                self._remove(segment)
+                continue
+            if not os.path.exists(segment.index_path):
+                open(segment.index_path, "wb").close()
+            clean = segment.recover()
+            segment.open()
+            self._segments.append(segment)
+            expected = base + len(segment.offsets)
+            if not clean:
+                print(f"[ChainStore] Truncated torn tail of {segment.log_path}")
+                # Nothing written after a torn record can be trusted
+                expected = -1
+
+    def _remove(self, segment):
+        segment.close()
+        for path in (segment.log_path, segment.index_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def __len__(self):
+        if not self._segments:
+            return 0
+        last = self._segments[-1]
+        return last.base_height + len(last.offsets)
+
+    def append(self, block_dict):
+        """
+        Durably append one block dict at height len(self).
+        """
+        payload = json.dumps(block_dict, separators=(",", ":")).encode()
+        if not self._segments or self._segments[-1].size >= self.segment_bytes:
+            segment = _Segment(self.directory, len(self))
+            segment.open()
+            self._segments.append(segment)
+        self._segments[-1].append(payload, self.fsync)
+
+    def _locate(self, height):
+        for segment in reversed(self._segments):
+            if height >= segment.base_height:
+                return segment, height - segment.base_height
+        raise IndexError(height)
+
+    def read(self, height):
+        """
+        Return the block dict stored at height.
+        """
+        if not 0 <= height < len(self):
+            raise IndexError(height)
+        segment, i = self._locate(height)
+        return json.loads(segment.read(i))
+
+    def load(self, start=0):
+        """
+        Yield the stored block dicts from height start to the end.
+        """
+        for segment in self._segments:
+            first = max(start - segment.base_height, 0)
+            # Decoding records a batch at a time as one JSON array is much
+            # cheaper than a json.loads() call per block
+            for batch in range(first, len(segment.offsets), LOAD_BATCH):
+                records = [segment.read(i) for i in range(batch, min(batch + LOAD_BATCH, len(segment.offsets)))]
+                yield from json.loads(b"[" + b",".join(records) + b"]")
+
+    def truncate(self, height):
+        """
+        Drop every block at or above height, so len(self) == height afterwards.
+        """
+        if height >= len(self):
+            return
+        # Whole segments past the cut go away; the first file is always kept
+        while len(self._segments) > 1 and self._segments[-1].base_height >= height:
+            self._remove(self._segments.pop())
+        segment, i = self._locate(height)
+        segment.truncate(i)
+
+    def close(self):
+        for segment in self._segments:
+            segment.close()
+        self._segments = []
@@ -0,0 +1,185 @@
+# blockchain/story_tree.py
+import json
+import threading
+from collections import OrderedDict, deque
+
+# Levels below the requested position returned by a subtree query, by
+# default and at most
+DEFAULT_SUBTREE_DEPTH = 3
+MAX_SUBTREE_DEPTH = 50
+
+# Serialised query results kept until the tree next changes
+MAX_CACHED_QUERIES = 256
+
+
+class StoryTree:
+    def __init__(self, max_cached=MAX_CACHED_QUERIES):
+        """
+        The story's positions as a tree built from block dicts: a block
+        with a position_hash is a node, under the block holding its
+        previous_position_hash. Blocks are added as they are appended to
+        the chain, so the tree is only rebuilt when the chain is replaced.
+        A position whose previous position isn't in the tree is a root, and
+        moves under its parent if that turns up later. As in the web client,
+        the genesis block is left out and a repeated position keeps its
+        first block. Positions without children make up the frontier, where
+        the story can be continued.
+        Query results are serialised once and cached until the tree changes.
+        """
+        self.max_cached = max_cached
+        self._nodes = {}        # position hash -> block dict
+        self._children = {}     # position hash -> child position hashes, oldest first
+        self._roots = {}        # root position hashes, oldest first (values unused)
+        self._leaves = {}       # childless position hashes, oldest first (values unused)
+        self._waiting = {}      # missing position hash -> position hashes that continue from it
+        self._version = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, position_hash):
+        return position_hash in self._nodes
+
+    def reset(self, blocks):
+        """
+        Rebuild the tree from a whole chain of block dicts.
+        """
+        with self._lock:
+            self._nodes, self._children, self._roots, self._leaves, self._waiting = {}, {}, {}, {}, {}
+            for blk in blocks:
+                self._add(blk)
+            self._changed()
+
+    def add(self, blocks):
+        """
+        Add block dicts appended to the chain, oldest first.
+        """
+        with self._lock:
+            for blk in blocks:
+                self._add(blk)
+            self._changed()
+
+    def _changed(self):
+        self._version += 1
+        self._cache.clear()
+
+    def _add(self, blk):
+        position = blk.get("position_hash")
+        if blk.get("index") == 0 or position is None or position in self._nodes:
+            return
+        self._nodes[position] = blk
+        self._children[position] = []
+        self._leaves[position] = None
+        parent = blk.get("previous_position_hash")
+        if parent in self._nodes:
+            self._attach(parent, position)
+        else:
+            self._roots[position] = None
+            if parent is not None:
+                self._waiting.setdefault(parent, []).append(position)
+        # Roots that were waiting for this position
+        for child in self._waiting.pop(position, []):
+            if not self._descends_from(position, child):
+                del self._roots[child]
+                self._attach(position, child)
+
+    def _attach(self, parent, child):
+        self._children[parent].append(child)
+        self._leaves.pop(parent, None)
+
+    def _descends_from(self, position, ancestor):
+        """
+        Whether ancestor is on the path from position up to its root.
+        """
+        seen = set()
+        while position in self._nodes and position not in seen:
+            if position == ancestor:
+                return True
+            seen.add(position)
+            position = self._nodes[position].get("previous_position_hash")
+        return False
+
+    def _cached(self, key, build):
+        """
+        The serialised result of build() for key, from the cache if it was
+        built since the tree last changed. build() runs under the lock and
+        returns (result, extra): something to serialise, or None if there
+        is no answer, and anything to return alongside it.
+        Returns (body bytes or None, extra, hit).
+        """
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+                return entry[0], entry[1], True
+            version = self._version
+            result, extra = build()
+        body = None if result is None else json.dumps(result).encode()
+        with self._lock:
+            # Only cache it if the tree hasn't changed in the meantime
+            if self._version == version:
+                self._cache[key] = (body, extra)
+                while len(self._cache) > self.max_cached:
+                    self._cache.popitem(last=False)
+        return body, extra, False
+
+    def structure_json(self, with_children=False):
+        """
+        The tree's shape, without the blocks, as JSON: {"size", "roots":
+        [...], "frontier": size} and, with_children, "children": {position:
+        [...]} for every position with children (which for a long story is
+        most of the tree's size).
+        Returns (body bytes, hit).
+        """
+        def build():
+            structure = {"size": len(self._nodes), "roots": list(self._roots), "frontier": len(self._leaves)}
+            if with_children:
+                structure["children"] = {p: list(c) for p, c in self._children.items() if c}
+            return structure, None
+        body, _, hit = self._cached(("structure", with_children), build)
+        return body, hit
+
+    def subtree_json(self, position_hash, depth=DEFAULT_SUBTREE_DEPTH):
+        """
+        The blocks from position_hash down to depth levels below it, as
+        JSON: {"root", "depth", "blocks": [...] (breadth first),
+        "children": {position: [...]} for the positions whose children are
+        included, "truncated": [positions with children below the depth]}.
+        depth is clamped to MAX_SUBTREE_DEPTH.
+        Returns (body bytes, hit); body is None if the position isn't in the tree.
+        """
+        depth = max(0, min(depth, MAX_SUBTREE_DEPTH))
+
+        def build():
+            if position_hash not in self._nodes:
+                return None, None
+            blocks, children, truncated = [], {}, []
+            level = deque([(position_hash, 0)])
+            while level:
+                position, d = level.popleft()
+                blocks.append(self._nodes[position])
+                below = self._children[position]
+                if not below:
+                    continue
+                if d == depth:
+                    truncated.append(position)
+                    continue
+                children[position] = list(below)
+                level.extend((child, d + 1) for child in below)
+            return {"root": position_hash, "depth": depth, "blocks": blocks,
+                    "children": children, "truncated": truncated}, None
+        body, _, hit = self._cached(("subtree", position_hash, depth), build)
+        return body, hit
+
+    def frontier_json(self, start, end):
+        """
+        The frontier (positions without children) newest first, items start
+        to end of it as a JSON list of block dicts.
+        Returns (body bytes, frontier size, hit).
+        """
+        def build():
+            newest_first = list(reversed(self._leaves))[start:end]
+            return [self._nodes[p] for p in newest_first], len(self._leaves)
+        return self._cached(("frontier", start, end), build)
@@ -0,0 +1,158 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from blockchain.block import Block, SUPPORTED_VERSIONS
+
+# Blocks handed to a worker per task
+DEFAULT_CHUNK_SIZE = 1024
+
+# Lowest difficulty a block may claim to have been mined at
+MIN_DIFFICULTY = 1
+
+
+def block_difficulty(block, default):
+    """
+    The difficulty a block's proof-of-work is checked against: the one it
+    records (version 3), or default for older blocks that don't record one.
+    Returns None if a version 3 block claims less than MIN_DIFFICULTY.
+    """
+    if block.version < 3:
+        return default
+    if not isinstance(block.difficulty, int) or block.difficulty < MIN_DIFFICULTY:
+        return None
+    return block.difficulty
+
+
+def block_work(block):
+    """
+    Expected number of hashes behind a block: 16 per leading zero hex digit.
+    Blocks that don't record their difficulty are counted at MIN_DIFFICULTY,
+    and genesis (which isn't mined) at zero.
+    """
+    if block.index == 0:
+        return 0
+    difficulty = block_difficulty(block, MIN_DIFFICULTY)
+    return 16 ** (difficulty or MIN_DIFFICULTY)
+
+
+def check_block_hash(block, difficulty):
+    """
+    Check a single block's format version, hash and proof-of-work.
+    difficulty is only used for blocks that don't record their own.
+    """
+    if block.version not in SUPPORTED_VERSIONS:
+        return False
+    target = block_difficulty(block, difficulty)
+    if target is None:
+        return False
+
+    # Hash correctness—but only if full-length
+    recalced = block.calculate_hash()
+    if len(block.hash) == len(recalced) and block.hash != recalced:
+        return False
+
+    # PoW check
+    return block.hash.startswith("0" * target)
+
+
+def _block_fields(block):
+    """
+    The fields check_block_hash() needs, as a plain tuple in Block's argument
+    order. Tuples of strings and numbers pickle at a fraction of the cost of
+    Block objects, which matters because pickling happens in the main process.
+    """
+    return (block.index, block.previous_hash, block.data, block.author, block.timestamp, block.nonce,
+            block.hash, block.position_hash, block.previous_position_hash, block.version, block.difficulty)
+
+
+def _check_chunk(fields, difficulty):
+    """
+    Worker task: True if every block in the chunk (tuples from
+    _block_fields()) passes check_block_hash().
+    """
+    return all(check_block_hash(Block(*f), difficulty) for f in fields)
+
+
+class ParallelValidator:
+    def __init__(self, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Recompute block hashes and check PoW across a process pool.
+        workers    - number of processes; None or 0 means one per CPU
+        chunk_size - blocks per task; shorter runs aren't worth sending to the pool
+        The pool is only used once it has been measured to check blocks
+        faster than the main process does on its own (see check_hashes()).
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self._executor = None
+        # Blocks per second last measured in-process and through the pool
+        self.serial_rate = None
+        self.pool_rate = None
+
+    def use_pool(self):
+        """
+        Whether the next run goes to the pool: once, to time it after the
+        in-process path has been timed, and from then on only while it is
+        the faster of the two.
+        """
+        if self.serial_rate is None:
+            return False
+        return self.pool_rate is None or self.pool_rate > self.serial_rate
+
+    def check_hashes(self, blocks, difficulty):
+        """
+        True if every block's hash and proof-of-work are correct.
+        Checked in the pool or in-process as use_pool() decides; runs that
+        pass are timed to keep the rate of the path they took up to date.
+        """
+        pool = self.use_pool()
+        if pool:
+            self._start()
+        start = time.perf_counter()
+        if pool:
+            ok = self.check_in_pool(blocks, difficulty)
+        else:
+            ok = all(check_block_hash(block, difficulty) for block in blocks)
+        elapsed = time.perf_counter() - start
+        # A failing run stops early, so its time says nothing about the rate
+        if ok and blocks and elapsed > 0:
+            if pool:
+                self.pool_rate = len(blocks) / elapsed
+            else:
+                self.serial_rate = len(blocks) / elapsed
+        return ok
+
+    def check_in_pool(self, blocks, difficulty):
+        """
+        check_hashes() across the worker processes, in chunks of chunk_size.
+        Stops handing out work as soon as one chunk fails.
+        """
+        self._start()
+        futures = [
+            self._executor.submit(_check_chunk, [_block_fields(b) for b in blocks[i:i + self.chunk_size]], difficulty)
+            for i in range(0, len(blocks), self.chunk_size)
+        ]
+        try:
+            return all(future.result() for future in futures)
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _start(self):
+        """
+        Start the worker processes, so that their startup isn't counted in
+        the time of the first run.
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            for future in [self._executor.submit(int) for _ in range(self.workers)]:
+                future.result()
+
+    def shutdown(self):
+        """
+        Stop the worker processes.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -0,0 +1,152 @@
+# network/async_node.py
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from network.protocol import (
+    HELLO, PROTOCOL_VERSION, FRAME_HEADER, MAX_FRAME_BYTES, IDLE_TIMEOUT, MSG_BLOCK, MSG_BLOCKS, MSG_CHAIN,
+    STREAMED_REPLIES, ProtocolError, dispatch, encode_frame, reply_frames, parse_legacy_request, legacy_reply
+)
+
+
+def _encode_slice(items):
+    """
+    JSON for a run of list items, without the surrounding brackets.
+    """
+    return json.dumps(items, separators=(",", ":"))[1:-1].encode()
+
+# Threads that run message handlers (block validation, chain serialisation,
+# ancestor fetches) off the event loop
+DEFAULT_HANDLER_WORKERS = 8
+
+# json.dumps holds the GIL for the whole call, so long chain replies are
+# encoded this many blocks at a time to let block handling run in between
+ENCODE_SLICE = 256
+
+
+class AsyncNode:
+    def __init__(self, port, handle, host='', workers=DEFAULT_HANDLER_WORKERS):
+        """
+        asyncio runtime for a node's listener: every peer connection is served
+        by the event loop, speaking the same framed and text protocols as
+        network.protocol.serve_connection.
+        handle(msg_type, payload) is the same synchronous handler the threaded
+        listener uses; it runs in a thread pool so validating a block or
+        serialising a large chain for one peer doesn't hold up the others.
+        Outgoing replies are written as the peer reads them, without tying up
+        a thread per slow reader.
+        """
+        self.port = port
+        self.host = host
+        self.handle = handle
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        # Blocks get their own thread so they never queue behind chain requests
+        self._block_executor = ThreadPoolExecutor(max_workers=1)
+        self._loop = None
+        self._tasks = set()
+
+    def run(self):
+        """
+        Serve until the process exits. Blocks the calling thread.
+        """
+        asyncio.run(self.serve_forever())
+
+    async def serve_forever(self):
+        self._loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self._on_connection, self.host, self.port,
+                                            limit=MAX_FRAME_BYTES)
+        print(f"[Listener] Listening on port {self.port} (asyncio)…")
+        async with server:
+            await server.serve_forever()
+
+    async def _call(self, fn, *args, executor=None):
+        """
+        Run fn(*args) in the handler pool and wait for the result.
+        """
+        return await self._loop.run_in_executor(executor or self._executor, fn, *args)
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        # The loop only keeps weak references to tasks
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _encode_reply(self, msg_type, payload):
+        """
+        The frame for a reply, with chains encoded a slice at a time.
+        """
+        if msg_type != MSG_CHAIN or len(payload) <= ENCODE_SLICE:
+            return await self._call(encode_frame, msg_type, payload)
+        parts = []
+        for i in range(0, len(payload), ENCODE_SLICE):
+            parts.append(await self._call(_encode_slice, payload[i:i + ENCODE_SLICE]))
+        body = b"[" + b",".join(parts) + b"]"
+        return FRAME_HEADER.pack(msg_type, len(body)) + body
+
+    async def _send_stream(self, writer, reply):
+        """
+        Write a streamed reply a chunk at a time, producing each chunk in the
+        handler pool and waiting for the peer to read it before the next.
+        """
+        chunks = reply_frames(*reply)
+        while True:
+            chunk = await self._call(next, chunks, None)
+            if chunk is None:
+                return
+            writer.write(chunk)
+            await writer.drain()
+
+    async def _handle_block(self, previous, msg_type, payload):
+        """
+        Handle a BLOCK or BLOCKS message after the one before it from the same
+        peer, so a peer's blocks are still applied in the order it sent them.
+        """
+        if previous is not None:
+            await previous
+        try:
+            await self._call(self.handle, msg_type, payload, executor=self._block_executor)
+        except Exception as e:
+            print(f"[Listener] Error handling block: {e}")
+
+    async def _on_connection(self, reader, writer):
+        try:
+            line = (await reader.readline()).rstrip(b"\r\n").decode()
+            if not line.startswith(HELLO):
+                # One text command from an older node
+                request = parse_legacy_request(line)
+                if request is not None:
+                    reply = await self._call(dispatch, self.handle, *request)
+                    if reply is not None:
+                        writer.write(await self._call(legacy_reply, *reply))
+                        await writer.drain()
+                return
+
+            version = min(PROTOCOL_VERSION, int(line[len(HELLO):]))
+            writer.write(f"{HELLO}{version}\n".encode())
+            await writer.drain()
+            previous_block = None
+            while True:
+                try:
+                    header = await asyncio.wait_for(reader.readexactly(FRAME_HEADER.size), IDLE_TIMEOUT)
+                except asyncio.IncompleteReadError:
+                    return
+                msg_type, length = FRAME_HEADER.unpack(header)
+                if length > MAX_FRAME_BYTES:
+                    raise ProtocolError(f"frame of {length} bytes is too large")
+                payload = json.loads(await reader.readexactly(length))
+
+                if msg_type in (MSG_BLOCK, MSG_BLOCKS):
+                    # Nothing to send back, so keep reading while it's validated
+                    previous_block = self._spawn(self._handle_block(previous_block, msg_type, payload))
+                    continue
+                reply = await self._call(dispatch, self.handle, msg_type, payload)
+                if reply is not None and reply[0] in STREAMED_REPLIES:
+                    await self._send_stream(writer, reply)
+                elif reply is not None:
+                    writer.write(await self._encode_reply(*reply))
+                    await writer.drain()
+        except (OSError, ValueError, ProtocolError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            print(f"[Protocol] Dropping connection: {e}")
+        finally:
+            writer.close()
@@ -0,0 +1,287 @@
+# network/broadcast.py
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from network.protocol import default_pool, MSG_BLOCK, MSG_BLOCKS
+
+# How long a fetched peer list is reused before asking for a fresh one
+PEER_REFRESH_INTERVAL = 30.0
+
+# Peers sent to at once
+MAX_PARALLEL_SENDS = 16
+
+# Longest a broadcast waits on one peer before counting it as timed out
+SEND_TIMEOUT = 2.0
+
+# Fan-out times kept for the latency percentiles
+LATENCY_SAMPLES = 1000
+
+# Blocks held for a peer that can't be reached; older ones are dropped
+# first, and the peer catches up on those by syncing
+MAX_QUEUED_BLOCKS = 64
+
+# Delay before the first retry to an unreachable peer, doubled after every
+# failed retry up to the maximum
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+
+def percentile(samples, pct):
+    """
+    The pct-th percentile (nearest rank) of a non-empty list of numbers.
+    """
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(len(ordered) * pct / 100))
+    return ordered[rank - 1]
+
+
+class OutboundQueue:
+    def __init__(self, max_blocks=MAX_QUEUED_BLOCKS):
+        """
+        Blocks waiting to be resent to one peer that couldn't be reached,
+        oldest first, and when to try next.
+        """
+        self.blocks = deque(maxlen=max_blocks)
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def add(self, blk_dict):
+        if all(b["hash"] != blk_dict["hash"] for b in self.blocks):
+            self.blocks.append(blk_dict)
+
+
+class Broadcaster:
+    def __init__(self, get_peers, pool=default_pool, refresh_interval=PEER_REFRESH_INTERVAL,
+                 workers=MAX_PARALLEL_SENDS, send_timeout=SEND_TIMEOUT, max_queued=MAX_QUEUED_BLOCKS,
+                 retry_base=RETRY_BASE_DELAY, retry_max=RETRY_MAX_DELAY):
+        """
+        Sends blocks (or other messages) to every peer at once over pooled
+        connections, off the caller's thread, so a miner goes straight back
+        to mining.
+        get_peers() returns the "host:port" peers to send to (e.g. a tracker
+        query); its result is reused for refresh_interval seconds, and the
+        last good list is kept if a refresh fails.
+        A peer that hasn't taken a block within send_timeout is counted as
+        timed out, and is skipped while that send is still in progress, so
+        one dead peer can't hold up the others or use up the workers.
+        Blocks that don't reach a peer are queued for it (at most max_queued)
+        and resent in the background, retrying after retry_base seconds and
+        backing off exponentially up to retry_max. Once the peer is back, its
+        queued blocks go out together in one BLOCKS message.
+        If the pool records peer statistics, the fastest, healthiest peers
+        are sent to first and peers backed off for misbehaving only get the
+        block through their queue.
+        """
+        self.get_peers = get_peers
+        self.pool = pool
+        self.refresh_interval = refresh_interval
+        self.send_timeout = send_timeout
+        self._peers = []
+        self._peers_fetched = None
+        # One fan-out at a time keeps blocks in order for each peer
+        self._fanout = ThreadPoolExecutor(max_workers=1)
+        self._senders = ThreadPoolExecutor(max_workers=workers)
+        self._in_flight = {}    # peer -> Future of its unfinished send
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+        self.max_queued = max_queued
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._queues = {}       # peer -> OutboundQueue, for peers we couldn't reach
+        self._retry_wakeup = threading.Event()
+        self._closed = False
+        threading.Thread(target=self._retry_loop, daemon=True).start()
+
+    def peers(self):
+        """
+        The cached peer list, refreshed once it is older than refresh_interval.
+        """
+        now = time.monotonic()
+        if self._peers_fetched is None or now - self._peers_fetched >= self.refresh_interval:
+            try:
+                self._peers = list(self.get_peers())
+            except Exception as e:
+                print(f"[Broadcast] Could not refresh peers, keeping {len(self._peers)}: {e}")
+            self._peers_fetched = now
+        return self._peers
+
+    def broadcast(self, blk_dict):
+        """
+        Queue a block to be sent to every peer and return at once.
+        Returns a Future for the (delivered, timed_out, failed) peer counts.
+        """
+        return self.fan_out(None, lambda conn: conn.send(MSG_BLOCK, blk_dict), f"Block #{blk_dict['index']}",
+                            blk_dict)
+
+    def fan_out(self, peers, send, label, blk_dict=None):
+        """
+        Queue send(conn) to be called with the pooled PeerConnection of each
+        of peers (None for every peer) and return at once.
+        label names what is being sent in the log. If the message is about a
+        block, blk_dict is queued for the peers it doesn't reach.
+        Returns a Future for the (delivered, timed_out, failed) peer counts.
+        """
+        return self._fanout.submit(self._fan_out, peers, send, label, blk_dict)
+
+    def queued(self, peer):
+        """
+        The blocks waiting to be resent to peer, oldest first.
+        """
+        with self._lock:
+            q = self._queues.get(peer)
+            return list(q.blocks) if q is not None else []
+
+    def _queue(self, peer, blk_dict):
+        with self._lock:
+            q = self._queues.get(peer)
+            if q is None:
+                q = self._queues[peer] = OutboundQueue(self.max_queued)
+                q.failures = 1
+                q.retry_at = time.monotonic() + self.retry_base
+            q.add(blk_dict)
+        self._retry_wakeup.set()
+
+    def _send(self, peer, send):
+        host, port_s = peer.split(':')
+        send(self.pool.get(host, int(port_s)))
+
+    def _fan_out(self, peers, send, label, blk_dict):
+        start = time.perf_counter()
+        futures = {}
+        targets = self.peers() if peers is None else peers
+        stats = self.pool.stats
+        if stats is not None:
+            # Fast, healthy peers get the first workers
+            targets = sorted(targets, key=stats.cost)
+        for p in targets:
+            with self._lock:
+                backlog = p in self._queues
+                busy = self._in_flight.get(p)
+            held = stats is not None and stats.backed_off(p)
+            if backlog or held or (busy is not None and not busy.done()):
+                # Goes out after what the peer is already waiting for
+                if blk_dict is not None:
+                    self._queue(p, blk_dict)
+                print(f"[Broadcast] x {p}: can't send now, {'queued' if blk_dict else 'skipped'}")
+                continue
+            future = self._senders.submit(self._send, p, send)
+            with self._lock:
+                futures[p] = self._in_flight[p] = future
+
+        done, _ = wait(futures.values(), timeout=self.send_timeout)
+        delivered = timed_out = failed = 0
+        for p, future in futures.items():
+            if future not in done:
+                timed_out += 1
+                print(f"[Broadcast] x {p}: no answer in {self.send_timeout:.1f}s")
+                if stats is not None:
+                    stats.record_failure(p)
+            elif future.exception() is not None:
+                failed += 1
+                print(f"[Broadcast] x {p}: {future.exception()}")
+            else:
+                delivered += 1
+                continue
+            if blk_dict is not None:
+                self._queue(p, blk_dict)
+        with self._lock:
+            for p in [p for p, future in self._in_flight.items() if future.done()]:
+                del self._in_flight[p]
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self._latencies.append(elapsed)
+        p50, p99 = self.latency_percentiles()
+        print(f"[Broadcast] {label} -> {delivered}/{len(futures)} peers "
+              f"in {elapsed * 1000:.1f} ms (p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms)")
+        return delivered, timed_out, failed
+
+    def latency_percentiles(self):
+        """
+        (p50, p99) in seconds of the time recent broadcasts took to reach
+        every peer (or time out), or (0.0, 0.0) before the first one.
+        """
+        with self._lock:
+            samples = list(self._latencies)
+        if not samples:
+            return 0.0, 0.0
+        return percentile(samples, 50), percentile(samples, 99)
+
+    def _retry_loop(self):
+        """
+        Resend queued blocks to each peer once its retry is due.
+        """
+        while not self._closed:
+            now = time.monotonic()
+            due, wake_at = [], now + self.retry_max
+            with self._lock:
+                for p, q in self._queues.items():
+                    busy = self._in_flight.get(p)
+                    if busy is not None and not busy.done():
+                        continue
+                    if q.retry_at <= now:
+                        due.append(p)
+                    else:
+                        wake_at = min(wake_at, q.retry_at)
+            known = set(self.peers()) if due else set()
+            for p in due:
+                if p not in known:
+                    # Gone from the peer list; it will sync when it returns
+                    with self._lock:
+                        self._queues.pop(p, None)
+                    continue
+                future = self._senders.submit(self._resend, p)
+                with self._lock:
+                    self._in_flight[p] = future
+                future.add_done_callback(lambda _: self._retry_wakeup.set())
+            self._retry_wakeup.wait(max(0.0, wake_at - time.monotonic()))
+            self._retry_wakeup.clear()
+
+    def _resend(self, peer):
+        """
+        Send a peer everything queued for it, as one BLOCKS message if it
+        understands them.
+        """
+        with self._lock:
+            blocks = list(self._queues[peer].blocks)
+        host, port_s = peer.split(':')
+        conn = self.pool.get(host, int(port_s))
+        try:
+            if len(blocks) > 1 and conn.negotiated_version() >= 4:
+                conn.send(MSG_BLOCKS, blocks)
+            else:
+                for blk_dict in blocks:
+                    conn.send(MSG_BLOCK, blk_dict)
+        except Exception as e:
+            with self._lock:
+                q = self._queues[peer]
+                delay = min(self.retry_max, self.retry_base * 2 ** q.failures)
+                q.failures += 1
+                q.retry_at = time.monotonic() + delay
+            print(f"[Broadcast] x {peer}: retry failed ({e}); {len(blocks)} block(s) queued, "
+                  f"next try in {delay:.0f}s")
+            return
+        sent = {blk_dict["hash"] for blk_dict in blocks}
+        with self._lock:
+            q = self._queues[peer]
+            remaining = [b for b in q.blocks if b["hash"] not in sent]
+            if remaining:
+                # More arrived while we were sending; send them straight away
+                q.blocks = deque(remaining, maxlen=self.max_queued)
+                q.failures, q.retry_at = 0, 0.0
+            else:
+                del self._queues[peer]
+        print(f"[Broadcast] Resent {len(blocks)} queued block(s) to {peer}")
+
+    def close(self):
+        """
+        Wait for queued broadcasts and stop the worker threads.
+        Blocks still queued for unreachable peers are dropped.
+        """
+        self._closed = True
+        self._retry_wakeup.set()
+        self._fanout.shutdown(wait=True)
+        self._senders.shutdown(wait=False)
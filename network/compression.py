@@ -0,0 +1,48 @@
+# network/compression.py
+import zlib
+
+# Brotli is optional (pip install brotli); without it only gzip is offered
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content codings we can send, most preferred first
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+# Levels chosen for speed over the last few percent of size, since bodies
+# are compressed while the client waits (whole ones only once per tip)
+GZIP_LEVEL = 4
+BROTLI_QUALITY = 5
+
+
+def _compressor(encoding):
+    if encoding == "gzip":
+        gz = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)     # 31: with a gzip header
+        return gz.compress, lambda: gz.flush(zlib.Z_SYNC_FLUSH), gz.flush
+    if encoding == "br" and brotli is not None:
+        br = brotli.Compressor(quality=BROTLI_QUALITY)
+        return br.process, br.flush, br.finish
+    raise ValueError(f"unsupported content coding: {encoding}")
+
+
+def compress(body, encoding):
+    """
+    body (bytes) compressed with encoding, one of ENCODINGS.
+    """
+    process, _, finish = _compressor(encoding)
+    return process(body) + finish()
+
+
+def compress_chunks(chunks, encoding):
+    """
+    Compress an iterable of byte chunks with encoding as they are taken.
+    Each chunk is flushed through, so a client can start decoding as soon
+    as the first one is sent.
+    """
+    process, flush, finish = _compressor(encoding)
+    for chunk in chunks:
+        out = process(chunk) + flush()
+        if out:
+            yield out
+    yield finish()
@@ -0,0 +1,158 @@
+# network/gossip.py
+import random
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from blockchain.blockchain import BLOCK_EXTENDED, BLOCK_REORG, BLOCK_SIDE
+from network.protocol import default_pool, MSG_INV, MSG_BLOCK, MSG_GETBLOCK
+
+# Peers each new block is announced to; with relaying, a block reaches N
+# nodes in about log(N) / log(GOSSIP_FANOUT) hops
+GOSSIP_FANOUT = 8
+
+# Block hashes remembered as already announced or requested
+SEEN_CACHE_SIZE = 10000
+
+# Threads fetching announced blocks
+FETCH_WORKERS = 4
+
+# Outcomes of receive_block() for a new, valid block worth passing on
+RELAYED = (BLOCK_EXTENDED, BLOCK_REORG, BLOCK_SIDE)
+
+
+class SeenCache:
+    def __init__(self, max_size=SEEN_CACHE_SIZE):
+        """
+        Bounded set of block hashes; the least recently seen are forgotten first.
+        """
+        self.max_size = max_size
+        self._hashes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, block_hash):
+        return block_hash in self._hashes
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def add(self, block_hash):
+        """
+        Remember a hash. Returns True if it wasn't already remembered.
+        """
+        with self._lock:
+            if block_hash in self._hashes:
+                self._hashes.move_to_end(block_hash)
+                return False
+            self._hashes[block_hash] = None
+            while len(self._hashes) > self.max_size:
+                self._hashes.popitem(last=False)
+            return True
+
+    def discard(self, block_hash):
+        with self._lock:
+            self._hashes.pop(block_hash, None)
+
+
+class Gossip:
+    def __init__(self, bc, self_id, broadcaster, deliver, pool=default_pool,
+                 fanout=GOSSIP_FANOUT, seen_size=SEEN_CACHE_SIZE):
+        """
+        Block propagation by inventory: a new block's hash is announced (INV)
+        to fanout peers, each of which fetches the block with
+        GETBLOCK only if it hasn't seen it, and announces it onward once it
+        has validated it.
+        self_id is our "host:port", sent with announcements so peers know
+        where to fetch from. broadcaster (a network.broadcast.Broadcaster)
+        supplies the peer list and sends the announcements. deliver(blk_dict)
+        hands a fetched block to the node as if it had been sent to us.
+        """
+        self.bc = bc
+        self.self_id = self_id
+        self.broadcaster = broadcaster
+        self.deliver = deliver
+        self.pool = pool
+        self.fanout = fanout
+        self.seen = SeenCache(seen_size)
+        self._fetchers = ThreadPoolExecutor(max_workers=FETCH_WORKERS)
+
+    def announce(self, blk_dict):
+        """
+        Announce a block (one we mined or have just validated) to fanout
+        peers and return at once. Peers that predate INV are sent
+        the whole block instead, and peers that can't be reached are sent it
+        when they come back.
+        Returns a Future for the (delivered, timed_out, failed) peer counts.
+        """
+        self.seen.add(blk_dict["hash"])
+        targets = self._pick_targets()
+        inv = {"hashes": [blk_dict["hash"]], "from": self.self_id}
+
+        def send(conn):
+            if conn.negotiated_version() >= 3:
+                conn.send(MSG_INV, inv)
+            else:
+                conn.send(MSG_BLOCK, blk_dict)
+        return self.broadcaster.fan_out(targets, send, f"INV #{blk_dict['index']}", blk_dict)
+
+    def _pick_targets(self):
+        """
+        The peers to announce to: the one after us in the sorted peer list,
+        then fanout - 1 others at random. The fixed successor means an
+        announcement always goes round the whole ring of nodes, even when the
+        random picks miss some; the random ones make it get there in a few hops.
+        Peers backed off for misbehaving are left out.
+        """
+        stats = self.pool.stats
+        peers = sorted(p for p in self.broadcaster.peers()
+                       if p != self.self_id and not (stats is not None and stats.backed_off(p)))
+        if not peers:
+            return []
+        successor = next((p for p in peers if p > self.self_id), peers[0])
+        others = [p for p in peers if p != successor]
+        return [successor] + random.sample(others, min(self.fanout - 1, len(others)))
+
+    def block_received(self, blk_dict, status):
+        """
+        Note a block that reached receive_block(), however it arrived, and
+        relay it if it was new and valid.
+        """
+        self.seen.add(blk_dict["hash"])
+        if status in RELAYED:
+            self.announce(blk_dict)
+
+    def on_inv(self, payload):
+        """
+        Handle an INV message: fetch the announced blocks we haven't seen
+        from the announcing peer, in the background. "from" is only the
+        sender's claim, so it must name a peer on our peer list; we never
+        connect to an address an INV made up.
+        """
+        peer = payload.get("from")
+        if not peer or peer == self.self_id or peer not in self.broadcaster.peers():
+            if peer:
+                print(f"[Gossip] Ignoring INV from unknown peer {peer}")
+            return
+        for block_hash in payload.get("hashes", []):
+            if self.bc.get_known_block(block_hash) is not None or not self.seen.add(block_hash):
+                continue
+            self._fetchers.submit(self._fetch, peer, block_hash)
+
+    def _fetch(self, peer, block_hash):
+        host, port_s = peer.split(':')
+        try:
+            msg_type, blk_dict = self.pool.get(host, int(port_s)).request(MSG_GETBLOCK, {"hash": block_hash})
+        except Exception as e:
+            msg_type, blk_dict = None, None
+            print(f"[Gossip] x {peer}: {e}")
+        if msg_type != MSG_BLOCK or blk_dict is None or blk_dict.get("hash") != block_hash:
+            # Let the next peer that announces it try again
+            self.seen.discard(block_hash)
+            return
+        try:
+            self.deliver(blk_dict)
+        except Exception as e:
+            print(f"[Gossip] Error handling block {block_hash[:12]}: {e}")
+
+    def close(self):
+        self._fetchers.shutdown(wait=False)
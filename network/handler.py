@@ -0,0 +1,102 @@
+# network/handler.py
+import logging
+
+from blockchain.blockchain import BLOCK_EXTENDED, BLOCK_REORG, BLOCK_SIDE, BLOCK_ORPHAN, BLOCK_INVALID
+from network.sync import fetch_missing_ancestors
+from network.protocol import (
+    MSG_BLOCK, MSG_GETCHAIN, MSG_CHAIN, MSG_GETBLOCK, MSG_NOTFOUND, MSG_GETHEADERS, MSG_HEADERS,
+    MSG_GETBLOCKS, MSG_GETCHAINSTREAM, MSG_CHAINSTREAM, MSG_INV, MSG_BLOCKS,
+    MAX_HEADERS_PER_REPLY, MAX_BLOCKS_PER_REPLY
+)
+
+
+class MessageHandler:
+    def __init__(self, chain, gossip=None, get_peers=None, on_tip_changed=None, logger=None, tag="Listener"):
+        """
+        Answers the messages peers send a node; called as
+        handler(msg_type, payload), it returns (reply_type, reply_payload) or
+        None, as network.protocol.serve_connection and AsyncNode expect.
+        chain is the node's blockchain.blockchain.Blockchain, or anything
+        with the same iter_block_dicts(), get_block_dict(), get_headers(),
+        get_block_range() and receive_block() (the observer's
+        network.replica.ChainReplica).
+        Requests are answered from chain and blocks go to its
+        receive_block(). With gossip (a network.gossip.Gossip), INV
+        announcements are fetched and new valid blocks announced onward.
+        The per-node hooks: get_peers() returns the "host:port" peers to
+        fetch an orphan's missing ancestors from (None leaves orphans to the
+        chain), and on_tip_changed() is called whenever a block moves our
+        tip, e.g. to cancel a mining round that is now stale.
+        tag prefixes the log lines.
+        """
+        self.chain = chain
+        self.gossip = gossip
+        self.get_peers = get_peers
+        self.on_tip_changed = on_tip_changed
+        self.logger = logger or logging.getLogger("node")
+        self.tag = tag
+
+    def __call__(self, msg_type, payload):
+        if msg_type == MSG_GETCHAIN:
+            chain_data = list(self.chain.iter_block_dicts(payload.get("from", 0)))
+            print(f"[{self.tag}] Sending chain with {len(chain_data)} blocks")
+            return MSG_CHAIN, chain_data
+
+        if msg_type == MSG_GETCHAINSTREAM:
+            # Sent one block per frame as each is serialised
+            return MSG_CHAINSTREAM, self.chain.iter_block_dicts(payload.get("from", 0))
+
+        if msg_type == MSG_GETBLOCK:
+            blk = self.chain.get_block_dict(payload["hash"])
+            return (MSG_NOTFOUND, None) if blk is None else (MSG_BLOCK, blk)
+
+        if msg_type == MSG_GETHEADERS:
+            limit = min(payload.get("limit", MAX_HEADERS_PER_REPLY), MAX_HEADERS_PER_REPLY)
+            return MSG_HEADERS, self.chain.get_headers(payload["from"], limit)
+
+        if msg_type == MSG_GETBLOCKS:
+            end = min(payload["end"], payload["start"] + MAX_BLOCKS_PER_REPLY)
+            return MSG_CHAIN, self.chain.get_block_range(payload["start"], end)
+
+        if msg_type == MSG_INV:
+            if self.gossip is not None:
+                self.gossip.on_inv(payload)
+            return None
+
+        if msg_type == MSG_BLOCKS:
+            # Blocks a peer queued for us while we were unreachable, oldest first
+            for blk in payload:
+                self.receive_block(blk)
+            return None
+
+        if msg_type == MSG_BLOCK:
+            self.receive_block(payload)
+        return None
+
+    def receive_block(self, blk):
+        """
+        Hand a block to the chain, relay it if it was new and valid, and
+        fetch the missing ancestors of an orphan. Returns the chain's status.
+        """
+        status = self.chain.receive_block(blk)
+        if self.gossip is not None:
+            self.gossip.block_received(blk, status)
+
+        if status in (BLOCK_EXTENDED, BLOCK_REORG):
+            print(f"[{self.tag}] {'Appended' if status == BLOCK_EXTENDED else 'Reorganised onto'} block #{blk['index']}")
+            self._tip_changed()
+        elif status == BLOCK_SIDE:
+            print(f"[{self.tag}] Kept block #{blk['index']} on a side branch")
+        elif status == BLOCK_INVALID:
+            print(f"[{self.tag}] Rejected invalid block #{blk['index']}")
+        elif status == BLOCK_ORPHAN and self.get_peers is not None:
+            # Parent unknown → fetch just the blocks we're missing
+            print(f"[{self.tag}] Orphan block #{blk['index']}; fetching missing ancestors…")
+            if fetch_missing_ancestors(self.chain, blk["hash"], self.get_peers(), self.logger):
+                print(f"[{self.tag}] Synced to length {len(self.chain.chain)}")
+                self._tip_changed()
+        return status
+
+    def _tip_changed(self):
+        if self.on_tip_changed is not None:
+            self.on_tip_changed()
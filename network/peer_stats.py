@@ -0,0 +1,162 @@
+# network/peer_stats.py
+import threading
+import time
+
+# Seconds after which a success, failure or bad block counts half as much
+STATS_HALF_LIFE = 300.0
+
+# Weight of the newest sample in the latency and throughput averages
+SAMPLE_WEIGHT = 0.3
+
+# Assumed for peers we haven't measured yet, so they still get tried
+DEFAULT_LATENCY = 0.2           # seconds
+DEFAULT_THROUGHPUT = 1_000_000  # bytes per second
+
+# Transfer size a peer's cost is estimated for
+REFERENCE_BYTES = 100_000
+
+# A bad block counts as this many failed requests
+BAD_BLOCK_WEIGHT = 3.0
+
+# Recent failures (after decay, so three in quick succession) that get a
+# peer backed off; the back-off doubles each time the peer offends again,
+# up to the maximum
+BACKOFF_THRESHOLD = 2.5
+BACKOFF_BASE = 10.0
+BACKOFF_MAX = 600.0
+
+
+class PeerRecord:
+    def __init__(self, now):
+        """
+        What we've measured of one peer. Counts decay with STATS_HALF_LIFE,
+        so a peer that misbehaved an hour ago isn't held to it.
+        """
+        self.latency = None         # connect latency average, seconds
+        self.throughput = None      # transfer rate average, bytes per second
+        self.successes = 0.0
+        self.failures = 0.0
+        self.bad_blocks = 0.0
+        self.updated = now
+        self.backoff_until = 0.0
+        self.strikes = 0            # back-offs in a row, for the next back-off's length
+
+    def decay(self, now, half_life):
+        factor = 0.5 ** ((now - self.updated) / half_life)
+        self.successes *= factor
+        self.failures *= factor
+        self.bad_blocks *= factor
+        self.updated = now
+
+    def failure_rate(self):
+        offences = self.failures + BAD_BLOCK_WEIGHT * self.bad_blocks
+        total = self.successes + offences
+        return offences / total if total else 0.0
+
+
+def _average(old, sample):
+    return sample if old is None else old + SAMPLE_WEIGHT * (sample - old)
+
+
+class PeerStats:
+    def __init__(self, half_life=STATS_HALF_LIFE, backoff_base=BACKOFF_BASE,
+                 backoff_max=BACKOFF_MAX, clock=time.monotonic):
+        """
+        Per-peer connect latency, throughput, failure rate and bad blocks,
+        used to try fast, healthy peers first. A peer whose recent failures
+        pass BACKOFF_THRESHOLD is left out for backoff_base seconds, doubling
+        each time it offends again up to backoff_max.
+        Peers are "host:port" strings.
+        """
+        self.half_life = half_life
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.clock = clock
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def _record(self, peer):
+        now = self.clock()
+        rec = self._records.get(peer)
+        if rec is None:
+            rec = self._records[peer] = PeerRecord(now)
+        rec.decay(now, self.half_life)
+        return rec, now
+
+    def record_connect(self, peer, seconds):
+        """
+        Note a successful connection that took seconds to open.
+        """
+        with self._lock:
+            rec, _ = self._record(peer)
+            rec.latency = _average(rec.latency, seconds)
+            rec.successes += 1
+
+    def record_transfer(self, peer, nbytes, seconds):
+        """
+        Note a request that returned nbytes in seconds.
+        """
+        with self._lock:
+            rec, _ = self._record(peer)
+            rec.throughput = _average(rec.throughput, nbytes / max(seconds, 1e-6))
+            rec.successes += 1
+            rec.strikes = max(0, rec.strikes - 1)
+
+    def record_failure(self, peer):
+        """
+        Note a request that failed or timed out.
+        """
+        with self._lock:
+            rec, now = self._record(peer)
+            rec.failures += 1
+            self._check_offences(peer, rec, now)
+
+    def record_bad_block(self, peer):
+        """
+        Note a block or chain from peer that failed validation.
+        """
+        with self._lock:
+            rec, now = self._record(peer)
+            rec.bad_blocks += 1
+            self._check_offences(peer, rec, now)
+
+    def _check_offences(self, peer, rec, now):
+        if now < rec.backoff_until:
+            return
+        if rec.failures + BAD_BLOCK_WEIGHT * rec.bad_blocks < BACKOFF_THRESHOLD:
+            return
+        delay = min(self.backoff_max, self.backoff_base * 2 ** rec.strikes)
+        rec.backoff_until = now + delay
+        rec.strikes += 1
+        print(f"[Peers] Backing off {peer} for {delay:.0f}s")
+
+    def backed_off(self, peer):
+        with self._lock:
+            rec = self._records.get(peer)
+            return rec is not None and self.clock() < rec.backoff_until
+
+    def cost(self, peer):
+        """
+        Estimated seconds to fetch REFERENCE_BYTES from peer, allowing for
+        retries after failures. Lower is better.
+        """
+        with self._lock:
+            rec = self._records.get(peer)
+            if rec is None:
+                return DEFAULT_LATENCY + REFERENCE_BYTES / DEFAULT_THROUGHPUT
+            rec.decay(self.clock(), self.half_life)
+            latency = DEFAULT_LATENCY if rec.latency is None else rec.latency
+            throughput = DEFAULT_THROUGHPUT if rec.throughput is None else rec.throughput
+            return (latency + REFERENCE_BYTES / throughput) / max(0.05, 1.0 - rec.failure_rate())
+
+    def rank(self, peers):
+        """
+        peers that aren't backed off, cheapest first. If every peer is
+        backed off they are all returned, so there is still someone to ask.
+        """
+        available = [p for p in peers if not self.backed_off(p)] or list(peers)
+        return sorted(available, key=self.cost)
+
+
+# Shared by everything in a node process that talks to peers
+default_stats = PeerStats()
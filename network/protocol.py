@@ -0,0 +1,506 @@
+# network/protocol.py
+import json
+import socket
+import struct
+import threading
+import time
+
+from network.peer_stats import default_stats
+
+# Framed protocol version spoken by this node
+# 2: streamed chains (GETCHAINSTREAM)
+# 3: inventory announcements (INV)
+# 4: batches of blocks (BLOCKS)
+PROTOCOL_VERSION = 4
+
+# A client opens with "HELLO BBP/<version>\n"; a framed server answers with
+# the version both sides will use. Old nodes don't know HELLO and just close
+# the connection, which tells the client to fall back to text commands.
+HELLO = "HELLO BBP/"
+
+# Every framed message is a 1-byte type and a 4-byte payload length (big
+# endian), followed by that many bytes of UTF-8 JSON
+FRAME_HEADER = struct.Struct(">BI")
+MAX_FRAME_BYTES = 256 * 1024 * 1024
+
+# Message types
+MSG_BLOCK = 1       # block dict, no reply
+MSG_GETCHAIN = 2    # {"from": height}, answered with MSG_CHAIN
+MSG_CHAIN = 3       # list of block dicts
+MSG_GETBLOCK = 4    # {"hash": block_hash}, answered with MSG_BLOCK or MSG_NOTFOUND
+MSG_NOTFOUND = 5    # null
+MSG_GETHEADERS = 6  # {"from": height, "limit": n}, answered with MSG_HEADERS
+MSG_HEADERS = 7     # list of block dicts without their "data"
+MSG_GETBLOCKS = 8   # {"start": height, "end": height} (end exclusive), answered with MSG_CHAIN
+MSG_GETCHAINSTREAM = 9  # {"from": height}, answered with a stream of MSG_CHAINSTREAM (version 2)
+MSG_CHAINSTREAM = 10    # one block dict per frame
+MSG_STREAMEND = 11      # null, ends a stream
+MSG_INV = 12            # {"hashes": [block_hash, ...], "from": "host:port"}, no reply (version 3)
+MSG_BLOCKS = 13         # list of block dicts, oldest first, no reply (version 4)
+
+# Replies sent as one frame per item, produced as they are sent, and ended
+# by MSG_STREAMEND; the handler returns an iterable of items as the payload
+STREAMED_REPLIES = (MSG_CHAINSTREAM,)
+# Streamed frames are written to the socket in batches of about this size
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# Most headers / blocks a node sends back for one GETHEADERS / GETBLOCKS
+MAX_HEADERS_PER_REPLY = 2000
+MAX_BLOCKS_PER_REPLY = 500
+
+CONNECT_TIMEOUT = 5.0
+# Longest we wait for a reply on a negotiated connection (whole chains included)
+REQUEST_TIMEOUT = 60.0
+# Idle pooled connections are closed by the server after this long
+IDLE_TIMEOUT = 300.0
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def _recv_exact(sock, n):
+    """
+    Read exactly n bytes, or return None if the peer closes first.
+    """
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(min(n - len(buf), 1024 * 1024))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+
+def read_line(sock, limit=MAX_FRAME_BYTES):
+    """
+    Read up to and including the next newline, or to EOF.
+    Returns the line without the newline, as bytes.
+    Only used for the first line on a connection, which the sender follows
+    with nothing until it is answered, so reading past the newline is safe.
+    """
+    buf = bytearray()
+    while not buf.endswith(b"\n"):
+        chunk = sock.recv(65536 if buf else 1)
+        if not chunk:
+            break
+        buf += chunk
+        if len(buf) > limit:
+            raise ProtocolError("line too long")
+    return bytes(buf).rstrip(b"\r\n")
+
+
+def encode_frame(msg_type, payload):
+    """
+    The bytes of one framed message with a JSON payload.
+    """
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    return FRAME_HEADER.pack(msg_type, len(body)) + body
+
+
+def reply_frames(msg_type, payload):
+    """
+    The bytes of a reply, in pieces. Streamed replies are encoded an item
+    at a time as the pieces are taken, so they're never held whole.
+    """
+    if msg_type not in STREAMED_REPLIES:
+        yield encode_frame(msg_type, payload)
+        return
+    buf = bytearray()
+    for item in payload:
+        buf += encode_frame(msg_type, item)
+        if len(buf) >= STREAM_CHUNK_BYTES:
+            yield bytes(buf)
+            buf = bytearray()
+    buf += encode_frame(MSG_STREAMEND, None)
+    yield bytes(buf)
+
+
+def send_frame(sock, msg_type, payload):
+    """
+    Send one framed message with a JSON payload.
+    """
+    sock.sendall(encode_frame(msg_type, payload))
+
+
+def recv_frame(sock):
+    """
+    Read one framed message.
+    Returns (msg_type, payload), or None if the peer closed the connection.
+    """
+    header = _recv_exact(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    msg_type, length = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME_BYTES:
+        raise ProtocolError(f"frame of {length} bytes is too large")
+    body = _recv_exact(sock, length)
+    if body is None:
+        raise ProtocolError("connection closed mid-frame")
+    return msg_type, json.loads(body)
+
+
+def _negotiate(sock):
+    """
+    Send HELLO and read the answer.
+    Returns the negotiated framed version, or 0 if the peer is text-only.
+    """
+    try:
+        sock.sendall(f"{HELLO}{PROTOCOL_VERSION}\n".encode())
+        reply = read_line(sock, limit=64).decode()
+    except (OSError, ProtocolError, UnicodeDecodeError):
+        reply = ""
+    return int(reply[len(HELLO):]) if reply.startswith(HELLO) else 0
+
+
+# Text protocol used by nodes that predate framing
+
+def _legacy_request(msg_type, payload):
+    """
+    The text command for a message, for peers that don't speak frames.
+    """
+    if msg_type == MSG_BLOCK:
+        return "BLOCK " + json.dumps(payload) + "\n"
+    if msg_type == MSG_GETCHAIN:
+        start = payload.get("from", 0)
+        return "GETCHAIN\n" if not start else f"GETCHAIN {start}\n"
+    if msg_type == MSG_GETBLOCK:
+        return f"GETBLOCK {payload['hash']}\n"
+    if msg_type == MSG_GETHEADERS:
+        return f"GETHEADERS {payload['from']} {payload.get('limit', MAX_HEADERS_PER_REPLY)}\n"
+    if msg_type == MSG_GETBLOCKS:
+        return f"GETBLOCKS {payload['start']} {payload['end']}\n"
+    raise ProtocolError(f"message type {msg_type} has no text form")
+
+
+def parse_legacy_request(line):
+    """
+    Map a text command to (msg_type, payload), or None if it isn't one we serve.
+    """
+    if line == "GETCHAIN":
+        return MSG_GETCHAIN, {"from": 0}
+    if line.startswith("GETCHAIN "):
+        return MSG_GETCHAIN, {"from": int(line[len("GETCHAIN "):])}
+    if line.startswith("GETBLOCK "):
+        return MSG_GETBLOCK, {"hash": line[len("GETBLOCK "):].strip()}
+    if line.startswith("GETHEADERS "):
+        start, limit = line.split()[1:3]
+        return MSG_GETHEADERS, {"from": int(start), "limit": int(limit)}
+    if line.startswith("GETBLOCKS "):
+        start, end = line.split()[1:3]
+        return MSG_GETBLOCKS, {"start": int(start), "end": int(end)}
+    if line.startswith("BLOCK "):
+        return MSG_BLOCK, json.loads(line[len("BLOCK "):])
+    return None
+
+
+def _parse_legacy_reply(data, request_type):
+    """
+    Map a text reply to (msg_type, payload).
+    """
+    if request_type in (MSG_GETCHAIN, MSG_GETBLOCKS) and data.startswith(b"CHAIN "):
+        return MSG_CHAIN, json.loads(data[len(b"CHAIN "):].decode())
+    if request_type == MSG_GETHEADERS and data.startswith(b"HEADERS "):
+        return MSG_HEADERS, json.loads(data[len(b"HEADERS "):].decode())
+    if request_type == MSG_GETBLOCK and data.startswith(b"BLOCK "):
+        return MSG_BLOCK, json.loads(data[len(b"BLOCK "):].decode())
+    return MSG_NOTFOUND, None
+
+
+def legacy_reply(msg_type, payload):
+    """
+    The text reply for a message, for peers that don't speak frames.
+    """
+    if msg_type == MSG_CHAIN:
+        return ("CHAIN " + json.dumps(payload) + "\n").encode()
+    if msg_type == MSG_BLOCK:
+        return ("BLOCK " + json.dumps(payload) + "\n").encode()
+    if msg_type == MSG_HEADERS:
+        return ("HEADERS " + json.dumps(payload) + "\n").encode()
+    return b""
+
+
+def dispatch(handle, msg_type, payload):
+    """
+    handle(msg_type, payload), with any error it raises (a malformed payload
+    missing a key or of the wrong type, say) turned into a ProtocolError, so
+    the connection it came in on is logged and dropped cleanly.
+    """
+    try:
+        return handle(msg_type, payload)
+    except Exception as e:
+        raise ProtocolError(f"error handling message type {msg_type}: {e!r}") from e
+
+
+def serve_connection(conn, handle):
+    """
+    serve one accepted peer connection until it closes
+    blocking for the life of the connection
+
+    a connection that opens with HELLO is answered with the negotiated
+    version and then carries any number of framed messages; anything else is
+    treated as a single text command from an older node and answered in
+    kind. Each message is passed to handle(msg_type, payload), which returns
+    (reply_type, reply_payload) or None for no reply; if it raises, the
+    error is logged and the connection dropped
+
+    arguments:
+    conn   -- accepted socket; closed on return
+    handle -- callable taking (msg_type, payload)
+
+    return:
+    None
+    """
+    try:
+        conn.settimeout(IDLE_TIMEOUT)
+        line = read_line(conn).decode()
+        if not line.startswith(HELLO):
+            request = parse_legacy_request(line)
+            if request is not None:
+                reply = dispatch(handle, *request)
+                if reply is not None:
+                    conn.sendall(legacy_reply(*reply))
+            return
+
+        version = min(PROTOCOL_VERSION, int(line[len(HELLO):]))
+        conn.sendall(f"{HELLO}{version}\n".encode())
+        while True:
+            message = recv_frame(conn)
+            if message is None:
+                return
+            reply = dispatch(handle, *message)
+            if reply is not None:
+                for chunk in reply_frames(*reply):
+                    conn.sendall(chunk)
+    except (OSError, ValueError, ProtocolError) as e:
+        print(f"[Protocol] Dropping connection: {e}")
+    finally:
+        conn.close()
+
+
+class PeerConnection:
+    def __init__(self, host, port, timeout=CONNECT_TIMEOUT, stats=None):
+        """
+        Long-lived connection to one peer. Negotiates the framed protocol on
+        first use and falls back to one text command per connection if the
+        peer is an older node. Connect times and failures are recorded in
+        stats (a network.peer_stats.PeerStats), if given.
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.stats = stats
+        self.version = None     # negotiated framed version, 0 for a text-only peer
+        self._sock = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        start = time.perf_counter()
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        except OSError:
+            if self.stats is not None:
+                self.stats.record_failure(f"{self.host}:{self.port}")
+            raise
+        if self.stats is not None:
+            self.stats.record_connect(f"{self.host}:{self.port}", time.perf_counter() - start)
+        sock.settimeout(self.timeout)
+        return sock
+
+    def _open(self):
+        """
+        Connect and negotiate, unless the peer is already known to be text-only.
+        """
+        if self._sock is not None or self.version == 0:
+            return
+        sock = self._connect()
+        self.version = _negotiate(sock)
+        if self.version:
+            sock.settimeout(REQUEST_TIMEOUT)
+            self._sock = sock
+        else:
+            sock.close()
+
+    def _legacy_exchange(self, msg_type, payload, expect_reply):
+        with self._connect() as sock:
+            sock.sendall(_legacy_request(msg_type, payload).encode())
+            if not expect_reply:
+                return None
+            sock.settimeout(REQUEST_TIMEOUT)
+            chunks = []
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    break
+                chunks.append(data)
+        return _parse_legacy_reply(b"".join(chunks), msg_type)
+
+    def _exchange(self, msg_type, payload, expect_reply):
+        with self._lock:
+            # A pooled connection may have been closed by the peer since the
+            # last use, so retry once on a fresh one
+            for attempt in (0, 1):
+                self._open()
+                if self.version == 0:
+                    return self._legacy_exchange(msg_type, payload, expect_reply)
+                try:
+                    send_frame(self._sock, msg_type, payload)
+                    if not expect_reply:
+                        return None
+                    reply = recv_frame(self._sock)
+                    if reply is None:
+                        raise ConnectionError("peer closed the connection")
+                    return reply
+                except OSError:
+                    self._close()
+                    if attempt:
+                        if self.stats is not None:
+                            self.stats.record_failure(f"{self.host}:{self.port}")
+                        raise
+                except Exception:
+                    # A bad frame or undecodable reply leaves the stream out of
+                    # step, so the socket must not be reused for the next request
+                    self._close()
+                    raise
+
+    def negotiated_version(self):
+        """
+        The framed protocol version agreed with the peer (0 for a text-only
+        peer), connecting first if that isn't known yet.
+        """
+        with self._lock:
+            self._open()
+            return self.version
+
+    def send(self, msg_type, payload):
+        """
+        Send a message that has no reply.
+        """
+        self._exchange(msg_type, payload, expect_reply=False)
+
+    def request(self, msg_type, payload):
+        """
+        Send a request and return the reply as (msg_type, payload).
+        """
+        return self._exchange(msg_type, payload, expect_reply=True)
+
+    def _close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            finally:
+                self._sock = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+class ReplyStream:
+    def __init__(self, sock):
+        """
+        Iterator over the items of a streamed reply, read one frame at a time
+        from a connection of its own. Closing it early (or leaving a with
+        block) drops the connection, which stops the sender.
+        """
+        self._sock = sock
+        self._reader = sock.makefile("rb")
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._sock is None:
+            raise StopIteration
+        header = self._reader.read(FRAME_HEADER.size)
+        if len(header) < FRAME_HEADER.size:
+            self.close()
+            raise ProtocolError("stream closed before its end")
+        msg_type, length = FRAME_HEADER.unpack(header)
+        if length > MAX_FRAME_BYTES:
+            self.close()
+            raise ProtocolError(f"frame of {length} bytes is too large")
+        body = self._reader.read(length)
+        if len(body) < length:
+            self.close()
+            raise ProtocolError("connection closed mid-frame")
+        if msg_type == MSG_STREAMEND:
+            self.close()
+            raise StopIteration
+        if msg_type not in STREAMED_REPLIES:
+            self.close()
+            raise ProtocolError(f"unexpected message type {msg_type} in a stream")
+        return json.loads(body)
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._reader.close()
+                self._sock.close()
+            finally:
+                self._sock = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_stream(host, port, msg_type, payload):
+    """
+    send a request whose reply is streamed, on a new connection so a long
+    transfer doesn't hold up the pooled one
+    blocking until the request has been sent
+
+    arguments:
+    host     -- peer's hostname or IP address
+    port     -- peer's TCP port number
+    msg_type -- request type, e.g. MSG_GETCHAINSTREAM
+    payload  -- request payload
+
+    return:
+    ReplyStream over the reply's items, or None if the peer predates
+    streamed replies
+    """
+    sock = socket.create_connection((host, port), timeout=CONNECT_TIMEOUT)
+    try:
+        sock.settimeout(CONNECT_TIMEOUT)
+        if _negotiate(sock) < 2:
+            sock.close()
+            return None
+        sock.settimeout(REQUEST_TIMEOUT)
+        send_frame(sock, msg_type, payload)
+    except OSError:
+        sock.close()
+        raise
+    return ReplyStream(sock)
+
+
+class ConnectionPool:
+    def __init__(self, stats=None):
+        """
+        One PeerConnection per "host:port", reused across messages, each
+        recording into stats if given.
+        """
+        self.stats = stats
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def get(self, host, port):
+        key = f"{host}:{port}"
+        with self._lock:
+            conn = self._connections.get(key)
+            if conn is None:
+                conn = self._connections[key] = PeerConnection(host, port, stats=self.stats)
+            return conn
+
+    def close_all(self):
+        with self._lock:
+            connections, self._connections = list(self._connections.values()), {}
+        for conn in connections:
+            conn.close()
+
+
+# Shared by everything in a node process that talks to peers
+default_pool = ConnectionPool(stats=default_stats)
@@ -0,0 +1,393 @@
+# network/replica.py
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from blockchain.block import Block
+from blockchain.blockchain import BLOCK_EXTENDED, BLOCK_DUPLICATE, BLOCK_ORPHAN
+from blockchain.story_tree import StoryTree
+from blockchain.validation import block_work
+from network.compression import compress
+from network.protocol import STREAM_CHUNK_BYTES
+
+# Seconds between background refreshes
+REPLICA_REFRESH_INTERVAL = 5.0
+
+# Serialised slices of the chain kept for the current tip
+MAX_CACHED_SLICES = 256
+
+# Peers tried per refresh, best first
+REPLICA_SOURCES = 3
+
+# Events held for a subscriber that isn't reading them; one that falls
+# further behind is sent a reset and dropped
+MAX_PENDING_EVENTS = 256
+
+# Most blocks replayed to a subscriber resuming from a block it last saw
+# (fewer than MAX_PENDING_EVENTS); one further behind is sent a reset instead
+MAX_REPLAYED_BLOCKS = 200
+
+
+def _linked(prev, blk):
+    return blk.get("index") == prev["index"] + 1 and blk.get("previous_hash") == prev["hash"]
+
+
+def _work(blocks):
+    """
+    Cumulative proof-of-work of a list of block dicts.
+    """
+    return sum(block_work(Block(**{"data": None, **blk})) for blk in blocks)
+
+
+def _more_work(candidate, ours):
+    """
+    Whether the chain candidate has strictly more work than ours. Only the
+    blocks past the last one both share are counted.
+    """
+    shared = 0
+    for theirs, mine in zip(candidate, ours):
+        if theirs["hash"] != mine["hash"]:
+            break
+        shared += 1
+    return _work(candidate[shared:]) > _work(ours[shared:])
+
+
+def _block_event(blk):
+    return f"id: {blk['hash']}\nevent: block\ndata: {json.dumps(blk)}\n\n".encode()
+
+
+def _reset_event(tip):
+    data = json.dumps({"height": tip["index"], "tip_hash": tip["hash"]})
+    return f"id: {tip['hash']}\nevent: reset\ndata: {data}\n\n".encode()
+
+
+class ChainReplica:
+    def __init__(self, get_peers, fetch_chain, refresh_interval=REPLICA_REFRESH_INTERVAL,
+                 max_slices=MAX_CACHED_SLICES, follows=_linked):
+        """
+        In-memory copy of the chain for serving to browsers, kept up to date
+        in the background instead of being downloaded for every request.
+        get_peers() returns the peers to copy from as
+        network.tracker_client.PeerInfo, best first. fetch_chain(peer,
+        from_height) returns a peer's blocks from from_height on as checked,
+        linked dicts, or an empty list.
+        A refresh is skipped when the best peer reports our tip, and
+        otherwise fetches only the blocks past it (the whole chain only if
+        the peer has forked from us, and then only if its chain has more
+        work than ours). Serialised slices are cached until the tip hash
+        changes.
+        Blocks pushed to us (receive_block) are appended at once if
+        follows(tip, blk) accepts them; anything else wakes the background
+        refresh. It answers the same queries as a Blockchain, so peers'
+        requests can be served from it (network.handler.MessageHandler).
+        Subscribers are sent every change as an event, and tree keeps the
+        story's positions (blockchain.story_tree.StoryTree) in step.
+        """
+        self.get_peers = get_peers
+        self.fetch_chain = fetch_chain
+        self.refresh_interval = refresh_interval
+        self.max_slices = max_slices
+        self.follows = follows
+        # Replaced on every change and never modified, so readers can use it
+        # without holding the lock
+        self._blocks = []
+        self._heights = {}              # block hash -> height, for the current chain
+        self._work = 0                  # cumulative work of the current chain
+        self._slices = OrderedDict()    # (start, end) -> JSON bytes for the current tip
+        self._subscribers = set()
+        self.tree = StoryTree()
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._metrics = {
+            "hits": 0, "misses": 0, "cold_misses": 0, "refreshes": 0, "refresh_errors": 0,
+            "blocks_fetched": 0, "full_fetches": 0, "last_refresh_ms": 0.0,
+            "blocks_pushed": 0, "blocks_unlinked": 0, "events_sent": 0, "subscribers_dropped": 0,
+        }
+
+    def blocks(self):
+        """
+        The current chain as a list of block dicts. Don't modify it.
+        """
+        return self._blocks
+
+    def tip_hash(self):
+        blocks = self._blocks
+        return blocks[-1]["hash"] if blocks else None
+
+    def get_known_block(self, block_hash):
+        """
+        The block dict with block_hash on our chain, or None.
+        """
+        height = self._heights.get(block_hash)
+        blocks = self._blocks
+        if height is None or height >= len(blocks) or blocks[height]["hash"] != block_hash:
+            return None
+        return blocks[height]
+
+    def get_block_dict(self, block_hash):
+        return self.get_known_block(block_hash)
+
+    def iter_block_dicts(self, from_height=0):
+        return iter(self._blocks[from_height:])
+
+    def get_block_range(self, start, end):
+        return self._blocks[start:end]
+
+    def get_headers(self, from_height, limit):
+        """
+        Up to limit block dicts from from_height on, without their data.
+        """
+        return [{k: v for k, v in blk.items() if k != "data"}
+                for blk in self._blocks[from_height:from_height + limit]]
+
+    def start(self):
+        """
+        Refresh every refresh_interval seconds on a background thread, and
+        straight away when a pushed block doesn't follow our tip.
+        """
+        def loop():
+            while True:
+                self._wake.clear()
+                self.refresh()
+                self._wake.wait(self.refresh_interval)
+        threading.Thread(target=loop, daemon=True).start()
+
+    def receive_block(self, blk):
+        """
+        Append a block pushed to us by a peer if it follows our tip.
+        Returns BLOCK_EXTENDED if it was appended and BLOCK_DUPLICATE for
+        one we already have. Any other (a fork, or we missed its parent) is
+        BLOCK_ORPHAN and wakes the background refresh to catch up from the
+        best peer.
+        """
+        with self._refresh_lock:
+            blocks = self._blocks
+            if blocks and blk.get("hash") in self._heights:
+                return BLOCK_DUPLICATE
+            if not blocks or not self.follows(blocks[-1], blk):
+                with self._lock:
+                    self._metrics["blocks_unlinked"] += 1
+                self._wake.set()
+                return BLOCK_ORPHAN
+            with self._lock:
+                self._metrics["blocks_pushed"] += 1
+            self._install(blocks + [blk], 0, appended=[blk])
+            return BLOCK_EXTENDED
+
+    def ensure_loaded(self):
+        """
+        Make sure there is a chain to serve, fetching it now if the
+        background refresh hasn't yet. Returns False if none could be fetched.
+        """
+        if self._blocks:
+            return True
+        with self._lock:
+            self._metrics["cold_misses"] += 1
+        self.refresh()
+        return bool(self._blocks)
+
+    def refresh(self):
+        """
+        Bring the replica up to the best peer's chain. Returns True if it changed.
+        """
+        with self._refresh_lock:
+            start = time.perf_counter()
+            try:
+                changed = self._refresh()
+            except Exception as e:
+                print(f"[Replica] Refresh failed: {e}")
+                changed = False
+                with self._lock:
+                    self._metrics["refresh_errors"] += 1
+            with self._lock:
+                self._metrics["refreshes"] += 1
+                self._metrics["last_refresh_ms"] = (time.perf_counter() - start) * 1000
+            return changed
+
+    def _refresh(self):
+        blocks = self._blocks
+        for peer in self.get_peers()[:REPLICA_SOURCES]:
+            if blocks and peer.tip_hash == blocks[-1]["hash"]:
+                return False
+            if blocks and peer.work is not None and peer.work <= self._work:
+                # No more work than ours, e.g. pushed blocks have taken us
+                # past what it last reported
+                continue
+            if blocks:
+                fetched = self.fetch_chain(peer.addr, blocks[-1]["index"])
+                if fetched and fetched[0]["hash"] == blocks[-1]["hash"]:
+                    if len(fetched) == 1:
+                        return False
+                    self._install(blocks + fetched[1:], len(fetched) - 1, appended=fetched[1:])
+                    return True
+            # A fresh replica, or the peer has forked from us
+            fetched = self.fetch_chain(peer.addr, 0)
+            if fetched and _more_work(fetched, blocks):
+                with self._lock:
+                    self._metrics["full_fetches"] += 1
+                self._install(fetched, len(fetched))
+                return True
+        return False
+
+    def _install(self, blocks, fetched, appended=None):
+        """
+        Make blocks the chain. appended lists the blocks added to the end
+        of the old chain, or is None if blocks replaces it.
+        """
+        # Serialised once for every subscriber
+        if appended is None:
+            events = [_reset_event(blocks[-1])]
+        else:
+            events = [_block_event(blk) for blk in appended]
+        if appended is None:
+            self.tree.reset(blocks)
+        else:
+            self.tree.add(appended)
+        with self._lock:
+            if appended is None:
+                self._heights = {blk["hash"]: blk["index"] for blk in blocks}
+                self._work = _work(blocks)
+            else:
+                for blk in appended:
+                    self._heights[blk["hash"]] = blk["index"]
+                self._work += _work(appended)
+            self._blocks = blocks
+            self._slices.clear()
+            self._metrics["blocks_fetched"] += fetched
+            for subscriber in list(self._subscribers):
+                for event in events:
+                    self._send(subscriber, event)
+        if fetched:
+            print(f"[Replica] Chain at height {blocks[-1]['index']} ({fetched} blocks fetched)")
+
+    def _send(self, subscriber, event):
+        try:
+            subscriber.put_nowait(event)
+            self._metrics["events_sent"] += 1
+        except queue.Full:
+            # Too far behind to catch up event by event: make room for a
+            # None, which tells the reader to start over
+            self._subscribers.discard(subscriber)
+            self._metrics["subscribers_dropped"] += 1
+            try:
+                subscriber.get_nowait()
+            except queue.Empty:
+                pass
+            subscriber.put_nowait(None)
+
+    def subscribe(self, last_hash=None):
+        """
+        Start receiving changes to the chain. Returns a queue.Queue of
+        server-sent event bytes: a "block" event (the block dict, with its
+        hash as the event id) for each block appended, and a "reset" event
+        ({"height", "tip_hash"}) when the chain is replaced. None in the
+        queue means the subscriber fell too far behind and was dropped.
+        With last_hash, the blocks appended since that block are queued
+        first, or a reset if it is no longer on the chain.
+        Call unsubscribe() when done.
+        """
+        subscriber = queue.Queue(maxsize=MAX_PENDING_EVENTS)
+        with self._lock:
+            if last_hash is not None and self._blocks and last_hash != self._blocks[-1]["hash"]:
+                height = self._heights.get(last_hash)
+                blocks = self._blocks
+                if height is not None and len(blocks) - height - 1 <= MAX_REPLAYED_BLOCKS:
+                    for blk in blocks[height + 1:]:
+                        self._send(subscriber, _block_event(blk))
+                else:
+                    self._send(subscriber, _reset_event(blocks[-1]))
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def slice_json(self, start, end, encoding=None):
+        """
+        blocks[start:end] serialised as a JSON array and compressed with
+        encoding (see network.compression) if given, from the cache when
+        the same slice has been asked for since the tip last changed.
+        Returns (body bytes, chain length, tip hash, hit), the length and
+        tip being those of the chain the slice was cut from.
+        """
+        key = (start, end, encoding)
+        with self._lock:
+            blocks = self._blocks
+            body = self._slices.get(key)
+            if body is not None:
+                self._slices.move_to_end(key)
+                self._metrics["hits"] += 1
+                return body, len(blocks), blocks[-1]["hash"], True
+            self._metrics["misses"] += 1
+            plain = self._slices.get((start, end, None)) if encoding is not None else None
+        if plain is None:
+            plain = json.dumps(blocks[start:end]).encode()
+        body = compress(plain, encoding) if encoding is not None else plain
+        with self._lock:
+            # Only cache it if the chain hasn't moved on in the meantime
+            if self._blocks is blocks:
+                self._slices[key] = body
+                if encoding is not None:
+                    self._slices[(start, end, None)] = plain
+                while len(self._slices) > self.max_slices:
+                    self._slices.popitem(last=False)
+        return body, len(blocks), blocks[-1]["hash"], False
+
+    def stream_json(self, start, end, ndjson=False):
+        """
+        blocks[start:end] serialised a few at a time as the returned
+        iterator is consumed, in chunks of about STREAM_CHUNK_BYTES, so a
+        long slice is never held whole. A JSON array, or one block per line
+        with ndjson. Nothing is cached.
+        Returns (iterator of bytes, chain length, tip hash).
+        """
+        blocks = self._blocks
+
+        def chunks():
+            buf = [] if ndjson else ["["]
+            size = 0
+            for i in range(start, min(end, len(blocks))):
+                if ndjson:
+                    item = json.dumps(blocks[i]) + "\n"
+                else:
+                    item = (", " if i > start else "") + json.dumps(blocks[i])
+                buf.append(item)
+                size += len(item)
+                if size >= STREAM_CHUNK_BYTES:
+                    yield "".join(buf).encode()
+                    buf, size = [], 0
+            if not ndjson:
+                buf.append("]")
+            if buf:
+                yield "".join(buf).encode()
+
+        return chunks(), len(blocks), blocks[-1]["hash"]
+
+    def chain_status(self):
+        """
+        The (height, tip_hash, work) of our chain, as nodes report theirs to
+        the tracker, or None before a chain has been fetched.
+        """
+        with self._lock:
+            blocks, work = self._blocks, self._work
+        return (blocks[-1]["index"], blocks[-1]["hash"], work) if blocks else None
+
+    def stats(self):
+        """
+        Cache and refresh counters, for monitoring.
+        """
+        with self._lock:
+            stats = dict(self._metrics)
+            stats["cached_slices"] = len(self._slices)
+            stats["subscribers"] = len(self._subscribers)
+            blocks = self._blocks
+        stats["tree_positions"] = len(self.tree)
+        stats["height"] = blocks[-1]["index"] if blocks else None
+        stats["tip_hash"] = blocks[-1]["hash"] if blocks else None
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,477 @@
+# network/sync.py
+import itertools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from blockchain.block import Block, SUPPORTED_VERSIONS
+from blockchain.blockchain import BLOCK_EXTENDED, BLOCK_REORG, BLOCK_ORPHAN
+from blockchain.validation import block_difficulty, block_work, check_block_hash
+from network.peer_stats import default_stats
+from network.protocol import (
+    default_pool, open_stream, MSG_GETCHAIN, MSG_GETCHAINSTREAM, MSG_CHAIN, MSG_GETBLOCK, MSG_BLOCK, MSG_GETHEADERS, MSG_HEADERS,
+    MSG_GETBLOCKS, MAX_HEADERS_PER_REPLY, MAX_BLOCKS_PER_REPLY
+)
+
+# Give up walking back through missing parents after this many and resync instead
+MAX_ANCESTOR_FETCH = 50
+
+# Block ranges downloaded at once during headers-first sync
+MAX_PARALLEL_DOWNLOADS = 8
+
+# Peers ahead of us that a startup sync asks, most work first
+MAX_SYNC_PEERS = 8
+
+def fetch_chain(host, port, from_height=None):
+    """
+    fetch a peer's chain, or only the part from a given height on
+    blocking until the whole reply has arrived
+
+    it sends GETCHAIN over the pooled connection to the peer (framed, or
+    as a text command to older nodes). Peers that predate GETCHAIN <height>
+    don't answer it, which yields None
+
+    arguments:
+    host        -- peer's hostname or IP address
+    port        -- peer's TCP port number
+    from_height -- first height wanted, or None for the whole chain
+
+    return:
+    list of block dictionaries, or None if the peer gave no CHAIN reply
+    """
+    msg_type, payload = default_pool.get(host, port).request(MSG_GETCHAIN, {"from": from_height or 0})
+    return payload if msg_type == MSG_CHAIN else None
+
+def stream_chain(host, port, from_height=None):
+    """
+    open a stream of a peer's chain, or of the part from a given height on
+    blocking until the request has been sent
+
+    the blocks arrive one frame each on a connection of their own, so they
+    can be checked as they come in (Blockchain.reorg_stream) instead of
+    after the whole chain has been buffered and decoded
+
+    arguments:
+    host        -- peer's hostname or IP address
+    port        -- peer's TCP port number
+    from_height -- first height wanted, or None for the whole chain
+
+    return:
+    ReplyStream of block dictionaries, or None if the peer predates GETCHAINSTREAM
+    """
+    return open_stream(host, port, MSG_GETCHAINSTREAM, {"from": from_height or 0})
+
+def fetch_block(host, port, block_hash):
+    """
+    fetch a single block by hash from a peer
+    blocking until the peer replies
+
+    it sends GETBLOCK over the pooled connection to the peer; peers that
+    don't know the block (or predate GETBLOCK) answer with NOTFOUND or
+    nothing
+
+    arguments:
+    host       -- peer's hostname or IP address
+    port       -- peer's TCP port number
+    block_hash -- hash of the wanted block
+
+    return:
+    block dictionary, or None if the peer didn't have it
+    """
+    msg_type, payload = default_pool.get(host, port).request(MSG_GETBLOCK, {"hash": block_hash})
+    return payload if msg_type == MSG_BLOCK else None
+
+def sync_candidates(bc, peer_infos, limit=MAX_SYNC_PEERS):
+    """
+    choose the peers worth syncing from using the chains they reported to
+    the tracker, so nothing is downloaded just to compare lengths
+
+    peers that reported more work than our chain come first, most work
+    first (the fastest, healthiest first among equals), up to limit of
+    them; peers that reported no more work than ours, or are backed off
+    for misbehaving, are skipped. Peers that haven't reported (older nodes)
+    are included after the others, since only their chains can tell,
+    unless they are backed off too
+
+    arguments:
+    bc         -- blockchain instance to sync
+    peer_infos -- list of network.tracker_client.PeerInfo
+    limit      -- most peers to take from those that are ahead
+
+    return:
+    list of "host:port" peer identifiers, empty if we are already at the
+    heaviest reported tip
+    """
+    our_work = bc.chain_work()
+    ahead = sorted((p for p in peer_infos if p.work is not None and p.work > our_work),
+                   key=lambda p: (-p.work, default_stats.cost(p.addr)))
+    ahead = [p.addr for p in ahead if not default_stats.backed_off(p.addr)]
+    unknown = [p.addr for p in peer_infos if p.work is None and not default_stats.backed_off(p.addr)]
+    return ahead[:limit] + unknown
+
+def sync_with_peers(bc, peers, logger):
+    """
+    bring bc up to the valid chain with the most work among peers
+    blocking until every peer has been asked
+
+    each peer is first asked only for the blocks from our tip on; if its
+    reply starts with our tip the new blocks are validated and appended,
+    so a restarted node only fetches and checks the delta. Peers that have
+    forked from us (or don't support the height argument) are asked for
+    their whole chain, and if it has more cumulative work we reorg onto it,
+    validating only the blocks past the common ancestor. Chains are
+    streamed and validated block by block from peers that support it
+
+    arguments:
+    bc     -- blockchain instance to update
+    peers  -- list of "host:port" peer identifiers
+    logger -- logger for progress and errors
+
+    return:
+    the last ReorgResult applied, or None if the chain didn't change
+    """
+    changed = None
+    for p in default_stats.rank(peers):
+        host, ps = p.split(':')
+        try:
+            result = _sync_with_peer(bc, host, int(ps))
+            if result is None:
+                logger.debug(f"Kept our chain over {p}'s")
+            else:
+                logger.info(f"Synced with {p}: fork at {result.fork_height}, "
+                            f"+{len(result.added)} / -{len(result.removed)} blocks, "
+                            f"length {len(bc.chain)}")
+                changed = result
+        except Exception as e:
+            logger.warning(f"Error syncing with {p}: {e}")
+            continue
+    return changed
+
+def _sync_with_peer(bc, host, port):
+    """
+    sync_with_peers() for a single peer
+
+    return:
+    ReorgResult, or None if the chain didn't change
+    """
+    # Our tip moves as heavier chains are adopted, so it's read per peer
+    tip = bc.get_latest_block()
+    streams = True
+    # A fresh node's genesis is its own, so only ask for a delta once we
+    # hold real blocks
+    if tip.index > 0:
+        stream = stream_chain(host, port, from_height=tip.index)
+        if stream is not None:
+            with stream:
+                first = next(stream, None)
+                if first is not None and first["hash"] == tip.hash:
+                    return bc.reorg_stream(itertools.chain([first], stream))
+        else:
+            streams = False
+            delta = fetch_chain(host, port, from_height=tip.index)
+            if delta and delta[0]["hash"] == tip.hash:
+                return bc.extend(delta[1:])
+
+    stream = stream_chain(host, port) if streams else None
+    if stream is not None:
+        with stream:
+            return bc.reorg_stream(stream)
+    chain_data = fetch_chain(host, port)
+    return bc.reorg(chain_data) if chain_data else None
+
+def fetch_missing_ancestors(bc, block_hash, peers, logger, max_depth=MAX_ANCESTOR_FETCH):
+    """
+    connect an orphaned block by fetching only the blocks it is missing
+    blocking until the orphan connects, no peer has the next parent, or
+    max_depth blocks have been fetched
+
+    it repeatedly asks peers for the nearest ancestor of block_hash that we
+    don't hold (bc.missing_ancestor) and hands it to bc.receive_block, which
+    connects the waiting orphans once the gap is closed. If the gap can't
+    be closed this way it falls back to sync_with_peers
+
+    arguments:
+    bc         -- blockchain instance holding the orphan
+    block_hash -- hash of the orphaned block
+    peers      -- list of "host:port" peer identifiers
+    logger     -- logger for progress and errors
+    max_depth  -- most ancestors to fetch one by one before resyncing
+
+    return:
+    True if our chain changed
+    """
+    for _ in range(max_depth):
+        wanted = bc.missing_ancestor(block_hash)
+        blk = None
+        for p in default_stats.rank(peers):
+            host, ps = p.split(':')
+            try:
+                blk = fetch_block(host, int(ps), wanted)
+            except Exception as e:
+                logger.warning(f"Error fetching block {wanted[:12]} from {p}: {e}")
+            if blk:
+                break
+        if blk is None:
+            break
+        status = bc.receive_block(blk)
+        if status != BLOCK_ORPHAN:
+            logger.info(f"Fetched missing block #{blk['index']}: {status}")
+            return status in (BLOCK_EXTENDED, BLOCK_REORG)
+    logger.info("Could not connect orphan from its ancestors; syncing with peers")
+    return sync_with_peers(bc, peers, logger) is not None
+
+def fetch_headers(host, port, from_height, limit=MAX_HEADERS_PER_REPLY):
+    """
+    fetch block headers (blocks without their data) from a peer
+    blocking until the peer replies
+
+    arguments:
+    host        -- peer's hostname or IP address
+    port        -- peer's TCP port number
+    from_height -- height of the first header wanted
+    limit       -- most headers wanted; the peer may send fewer
+
+    return:
+    list of header dictionaries, or None if the peer doesn't serve headers
+    """
+    msg_type, payload = default_pool.get(host, port).request(
+        MSG_GETHEADERS, {"from": from_height, "limit": limit})
+    return payload if msg_type == MSG_HEADERS else None
+
+def fetch_block_range(host, port, start, end):
+    """
+    fetch the blocks at heights start up to (not including) end from a peer
+    blocking until the peer replies
+
+    arguments:
+    host  -- peer's hostname or IP address
+    port  -- peer's TCP port number
+    start -- first height wanted
+    end   -- height after the last one wanted
+
+    return:
+    list of block dictionaries, or None if the peer doesn't serve ranges
+    """
+    msg_type, payload = default_pool.get(host, port).request(MSG_GETBLOCKS, {"start": start, "end": end})
+    return payload if msg_type == MSG_CHAIN else None
+
+def _fetch_header_chain(bc, peer):
+    """
+    fetch a peer's headers past the last block it shares with bc
+    blocking until every header has been received
+
+    the peer is first asked for headers from our tip on; if they don't
+    start with our tip (the peer has forked from us, or we are a fresh node
+    with our own genesis) every header is fetched and the fork point found
+    with bc.common_ancestor_height()
+
+    arguments:
+    bc   -- blockchain instance to compare against
+    peer -- "host:port" peer identifier
+
+    return:
+    (fork_height, headers) with fork_height -1 if not even genesis is
+    shared, or None if the peer doesn't serve headers
+    """
+    host, ps = peer.split(':')
+    tip = bc.get_latest_block()
+
+    def fetch_from(height):
+        headers = []
+        while True:
+            batch = fetch_headers(host, int(ps), height + len(headers))
+            if batch is None:
+                return None if not headers else headers
+            headers.extend(batch)
+            if len(batch) < MAX_HEADERS_PER_REPLY:
+                return headers
+
+    if tip.index > 0:
+        headers = fetch_from(tip.index)
+        if headers is None:
+            return None
+        if headers and headers[0]["hash"] == tip.hash:
+            return tip.index, headers[1:]
+    headers = fetch_from(0)
+    if headers is None:
+        return None
+    fork_height = bc.common_ancestor_height(headers)
+    return fork_height, headers[fork_height + 1:]
+
+def _header_chain_work(bc, fork_height, headers):
+    """
+    check that headers link up from our block at fork_height and that each
+    claims a hash meeting its own difficulty, without the block data
+
+    arguments:
+    bc          -- blockchain instance the headers continue
+    fork_height -- height of the last shared block, or -1
+    headers     -- header dictionaries following it
+
+    return:
+    list of the cumulative chain work at each header, or None if the
+    headers don't form a chain
+    """
+    if fork_height >= 0:
+        prev_hash, work = bc.chain[fork_height].hash, bc.chain_work(bc.chain[fork_height])
+    else:
+        prev_hash, work = None, 0
+    works = []
+    for height, header in enumerate(headers, start=fork_height + 1):
+        block = Block(data=None, **header)
+        if block.index != height or block.version not in SUPPORTED_VERSIONS:
+            return None
+        if height > 0:
+            target = block_difficulty(block, bc.difficulty)
+            if block.previous_hash != prev_hash or target is None or not block.hash.startswith("0" * target):
+                return None
+        work += block_work(block)
+        works.append(work)
+        prev_hash = block.hash
+    return works
+
+def _download_range(bc, sources, start, headers):
+    """
+    download one range of blocks, trying each source until one sends blocks
+    that match the headers and pass their hash and proof-of-work checks
+    blocking until a source succeeds or all have failed
+
+    each source's throughput, or the bad blocks it sent, are recorded in
+    the peer statistics
+
+    arguments:
+    bc      -- blockchain instance (for the difficulty of older blocks)
+    sources -- "host:port" peers to try, in order
+    start   -- height of the first block
+    headers -- the verified headers for the range
+
+    return:
+    list of block dictionaries, or None if no source had them
+    """
+    for p in sources:
+        host, ps = p.split(':')
+        began = time.perf_counter()
+        try:
+            blocks = fetch_block_range(host, int(ps), start, start + len(headers))
+        except Exception:
+            continue
+        if not blocks:
+            continue
+        if [b["hash"] for b in blocks] == [h["hash"] for h in headers] and \
+                all(b["index"] == 0 or check_block_hash(Block(**b), bc.difficulty) for b in blocks):
+            default_stats.record_transfer(p, len(json.dumps(blocks)), time.perf_counter() - began)
+            return blocks
+        default_stats.record_bad_block(p)
+    return None
+
+def headers_first_sync(bc, peers, logger, range_size=MAX_BLOCKS_PER_REPLY):
+    """
+    bring bc up to the chain with the most work among peers by fetching
+    headers first and then block ranges from several peers at once
+    blocking until the sync has finished or failed
+
+    every peer's header chain is fetched and verified (linkage and claimed
+    proof-of-work). The heaviest one is then split into ranges of
+    range_size blocks, downloaded in parallel from the peers whose headers
+    agree with it. Each range is checked against the headers and re-hashed
+    as it arrives, and ranges are applied to bc in order as soon as they
+    are contiguous, so bootstrapping is bounded by the combined bandwidth
+    of the peers rather than one of them. Ranges go to the fastest,
+    healthiest peers first, and peers backed off for misbehaving are skipped
+
+    arguments:
+    bc         -- blockchain instance to update
+    peers      -- list of "host:port" peer identifiers
+    logger     -- logger for progress and errors
+    range_size -- blocks per GETBLOCKS request
+
+    return:
+    number of blocks applied, or None if no peer serves headers
+    """
+    chains = {}
+    for p in default_stats.rank(peers):
+        try:
+            found = _fetch_header_chain(bc, p)
+        except Exception as e:
+            logger.warning(f"Error fetching headers from {p}: {e}")
+            continue
+        if found is None:
+            continue
+        fork_height, headers = found
+        works = _header_chain_work(bc, fork_height, headers)
+        if works is None:
+            logger.warning(f"Rejected invalid headers from {p}")
+            default_stats.record_bad_block(p)
+            continue
+        chains[p] = (fork_height, headers, works)
+    if not chains:
+        return None
+
+    best = max(chains, key=lambda p: chains[p][2][-1] if chains[p][2] else 0)
+    fork_height, headers, works = chains[best]
+    if not works or works[-1] <= bc.chain_work():
+        return 0
+    logger.info(f"Syncing {len(headers)} blocks past height {fork_height} by headers from {best}")
+
+    first = fork_height + 1
+
+    def header_hash(peer, height):
+        peer_fork, peer_headers, _ = chains[peer]
+        i = height - peer_fork - 1
+        return peer_headers[i]["hash"] if 0 <= i < len(peer_headers) else None
+
+    def sources_for(start, end, rotate):
+        # Peers whose headers commit to the same block at the end of the
+        # range (and so to every block before it), fastest first. Ranges are
+        # spread over the faster half; the rest are only fallbacks
+        last = headers[end - 1 - first]["hash"]
+        agree = default_stats.rank([p for p in chains if header_hash(p, end - 1) == last])
+        fast = agree[:(len(agree) + 1) // 2]
+        lead = fast[rotate % len(fast)]
+        return [lead] + [p for p in agree if p != lead]
+
+    ranges = [(start, min(start + range_size, first + len(headers)))
+              for start in range(first, first + len(headers), range_size)]
+    applied = 0
+    switched = fork_height == bc.get_latest_block().index
+    pending = []
+    downloaded = {}
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_DOWNLOADS, len(chains))) as pool:
+        futures = {
+            pool.submit(_download_range, bc, sources_for(start, end, i), start,
+                        headers[start - first:end - first]): i
+            for i, (start, end) in enumerate(ranges)
+        }
+        next_range = 0
+        try:
+            for future in as_completed(futures):
+                blocks = future.result()
+                if blocks is None:
+                    start, end = ranges[futures[future]]
+                    logger.warning(f"No peer sent valid blocks {start}-{end - 1}")
+                    break
+                downloaded[futures[future]] = blocks
+
+                # Apply every range that is now contiguous with what we have
+                while next_range in downloaded:
+                    pending.extend(downloaded.pop(next_range))
+                    next_range += 1
+                    if switched:
+                        if bc.extend(pending, hashes_checked=True) is None:
+                            logger.warning(f"Blocks from {best} don't extend our chain")
+                            return applied
+                    elif works[applied + len(pending) - 1] > bc.chain_work():
+                        # The new branch only overtakes ours part way along
+                        if bc.reorg_from(fork_height, pending, hashes_checked=True) is None:
+                            logger.warning(f"Blocks from {best} failed validation")
+                            return applied
+                        switched = True
+                    else:
+                        continue
+                    applied += len(pending)
+                    pending = []
+                    logger.info(f"Applied blocks up to {bc.get_latest_block().index} of {fork_height + len(headers)}")
+        finally:
+            for future in futures:
+                future.cancel()
+    return applied
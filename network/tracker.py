@@ -1,21 +1,149 @@
 # network/tracker.py
+import heapq
+import random
+import selectors
 import socket
-import threading
+import time
+from collections import OrderedDict
+
+# Seconds a peer stays registered without a JOIN or HEARTBEAT
+PEER_TTL = 90.0
+
+# How often nodes should send HEARTBEAT; a few can be lost before the TTL runs out
+HEARTBEAT_INTERVAL = 30.0
+
+# Most peers returned by one GETPEERS, and the sample size when no limit is given
+MAX_PEERS_PER_REPLY = 1000
+
+# Longest command line accepted; longer ones close the connection
+MAX_LINE_BYTES = 1024
+
+# Longest the event loop sleeps before checking for expired peers and idle connections
+SWEEP_INTERVAL = 1.0
+
+# Seconds a connection may go without sending or receiving before it is
+# closed; nodes open one per command, so only dead or stalled ones get this old
+IDLE_TIMEOUT = 30.0
+
+
+class PeerRegistry:
+    def __init__(self, ttl=PEER_TTL):
+        """
+        Registered peers with an expiry time each. Peers are kept in order of
+        expiry, so expired ones are found without scanning the rest, and in a
+        list for sampling without copying it.
+        """
+        self.ttl = ttl
+        self._expiry = OrderedDict()    # peer -> monotonic expiry, soonest first
+        self._addrs = []
+        self._index = {}                # peer -> position in _addrs
+        self._status = {}               # peer -> (height, tip_hash, work) it last reported
+
+    def __contains__(self, peer):
+        return peer in self._expiry
+
+    def __len__(self):
+        return len(self._addrs)
+
+    def refresh(self, peer, status=None, now=None):
+        """
+        Register a peer, or push back its expiry if it's registered.
+        status is the (height, tip_hash, work) of the peer's chain, if it sent one.
+        Returns True if it wasn't registered.
+        """
+        now = time.monotonic() if now is None else now
+        new = peer not in self._expiry
+        if new:
+            self._index[peer] = len(self._addrs)
+            self._addrs.append(peer)
+        else:
+            self._expiry.move_to_end(peer)
+        self._expiry[peer] = now + self.ttl
+        if status is not None:
+            self._status[peer] = status
+        return new
+
+    def status(self, peer):
+        """
+        The (height, tip_hash, work) a peer last reported, or None.
+        """
+        return self._status.get(peer)
+
+    def remove(self, peer):
+        """
+        Unregister a peer. Returns True if it was registered.
+        """
+        if self._expiry.pop(peer, None) is None:
+            return False
+        self._status.pop(peer, None)
+        # Move the last peer into its slot so the list stays dense
+        i = self._index.pop(peer)
+        last = self._addrs.pop()
+        if last != peer:
+            self._addrs[i] = last
+            self._index[last] = i
+        return True
+
+    def expire(self, now=None):
+        """
+        Unregister the peers whose time ran out. Returns them.
+        """
+        now = time.monotonic() if now is None else now
+        expired = []
+        while self._expiry:
+            peer, expiry = next(iter(self._expiry.items()))
+            if expiry > now:
+                break
+            self.remove(peer)
+            expired.append(peer)
+        return expired
+
+    def sample(self, limit):
+        """
+        Up to limit registered peers, chosen at random.
+        """
+        if limit >= len(self._addrs):
+            return list(self._addrs)
+        return random.sample(self._addrs, limit)
+
+    def best(self, limit):
+        """
+        Up to limit registered peers with the most chain work, most first;
+        peers that haven't reported their chain come last.
+        """
+        def work(peer):
+            status = self._status.get(peer)
+            return status[2] if status is not None else -1
+        return heapq.nlargest(limit, self._addrs, key=work)
+
 
 class Tracker:
-    def __init__(self, host='0.0.0.0', port=8000):
+    def __init__(self, host='0.0.0.0', port=8000, ttl=PEER_TTL, idle_timeout=IDLE_TIMEOUT):
+        """
+        Peer registry served from a single thread with a selector, so
+        thousands of nodes can hold connections open or come and go without
+        a thread each. Peers that neither JOIN again nor send HEARTBEAT within
+        ttl seconds are dropped, so crashed nodes leave the list, and
+        connections with no traffic for idle_timeout seconds are closed.
+        port 0 picks a free port, stored in self.port once listening.
+        """
         self.host = host
         self.port = port
-        self.peers = set()
+        self.peers = PeerRegistry(ttl)
+        self.idle_timeout = idle_timeout
+        self._last_active = OrderedDict()   # connection -> monotonic time of its last traffic, oldest first
+        self._selector = None
+        self._running = False
 
     def start(self):
         """
         start the tracker server to accept peer registry requests
-        runs indefinitely, spawning a new thread for each incoming connection
+        runs until stop() is called, serving every connection from this thread
 
-        it binds to self.host:self.port, listens for TCP connections,
-        and uses handle_peer() to process JOIN/LEAVE/GETPEERS commands
-        in separate daemon threads
+        it binds to self.host:self.port and waits on the listening socket and
+        all client sockets at once; each connection may send any number of
+        newline-terminated commands, which handle_command() answers.
+        Expired peers and idle connections are swept out between events
 
         arguments:
         None
@@ -24,46 +152,149 @@ class Tracker:
         None
         """
         srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         srv.bind((self.host, self.port))
-        srv.listen()
+        srv.listen(1024)
+        srv.setblocking(False)
+        self.port = srv.getsockname()[1]
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(srv, selectors.EVENT_READ)
+        self._running = True
         print(f"Tracker listening on {self.host}:{self.port}")
-        while True:
-            conn, _ = srv.accept()
-            # handle each request in its own thread
-            threading.Thread(target=self.handle_peer, args=(conn,), daemon=True).start()
+        try:
+            while self._running:
+                for key, events in self._selector.select(SWEEP_INTERVAL):
+                    if key.fileobj is srv:
+                        self._accept(srv)
+                    else:
+                        self._service(key, events)
+                now = time.monotonic()
+                for peer in self.peers.expire(now):
+                    print(f"[-] Expired peer: {peer}")
+                self._close_idle(now)
+        finally:
+            for key in list(self._selector.get_map().values()):
+                key.fileobj.close()
+            self._selector.close()
 
-    def handle_peer(self, conn):
+    def stop(self):
         """
-        Commands:
-          GETPEERS           - returns the current peer list, one per line
-          JOIN <peer_addr>   - adds peer_addr to the registry
-          LEAVE <peer_addr>  - removes peer_addr from the registry
+        Make start() return after its current wait.
         """
+        self._running = False
+
+    def _accept(self, srv):
         try:
-            data = conn.recv(1024).decode().strip()
-            if not data:
+            conn, _ = srv.accept()
+        except BlockingIOError:
+            return
+        conn.setblocking(False)
+        # data: [unparsed input, unsent output]
+        self._selector.register(conn, selectors.EVENT_READ, [b"", b""])
+        self._last_active[conn] = time.monotonic()
+
+    def _close(self, conn):
+        self._selector.unregister(conn)
+        self._last_active.pop(conn, None)
+        conn.close()
+
+    def _close_idle(self, now):
+        """
+        Close the connections with no traffic for idle_timeout seconds,
+        oldest first, stopping at the first one still in use.
+        """
+        while self._last_active:
+            conn, last = next(iter(self._last_active.items()))
+            if now - last < self.idle_timeout:
+                break
+            self._close(conn)
+
+    def _service(self, key, events):
+        conn, buffers = key.fileobj, key.data
+        self._last_active.move_to_end(conn)
+        self._last_active[conn] = time.monotonic()
+        if events & selectors.EVENT_READ:
+            try:
+                data = conn.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                data = None
+            except OSError:
+                data = b""
+            if data == b"":
+                self._close(conn)
                 return
+            if data:
+                buffers[0] += data
+                *lines, buffers[0] = buffers[0].split(b"\n")
+                if len(buffers[0]) > MAX_LINE_BYTES:
+                    self._close(conn)
+                    return
+                for line in lines:
+                    reply = self.handle_command(line.decode(errors="replace"))
+                    if reply:
+                        buffers[1] += reply.encode()
+        if buffers[1]:
+            try:
+                sent = conn.send(buffers[1])
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except OSError:
+                self._close(conn)
+                return
+            buffers[1] = buffers[1][sent:]
+        # Only wait for writability while a reply is still going out
+        wanted = selectors.EVENT_READ | (selectors.EVENT_WRITE if buffers[1] else 0)
+        if key.events != wanted:
+            self._selector.modify(conn, wanted, buffers)
 
-            parts = data.split(maxsplit=1)
-            cmd = parts[0].upper()
+    def handle_command(self, line):
+        """
+        Commands:
+          GETPEERS           - returns the registered peers, one per line
+          GETPEERS <limit> [BEST] - returns "PEERS <n>" and then n peers chosen at
+                               random (or those with the most work), one per line as
+                               "<peer_addr> <height> <tip_hash> <work>", or just
+                               "<peer_addr>" for a peer that hasn't reported its chain
+          JOIN <peer_addr> [<height> <tip_hash> <work>]
+                             - adds peer_addr to the registry
+          HEARTBEAT <peer_addr> [<height> <tip_hash> <work>]
+                             - keeps peer_addr registered (re-adding it if it expired)
+          LEAVE <peer_addr>  - removes peer_addr from the registry
+        Returns the reply text, or None.
+        """
+        parts = line.split()
+        if not parts:
+            return None
+        cmd = parts[0].upper()
 
-            # Return the full list of peers
-            if cmd == "GETPEERS":
-                resp = "\n".join(self.peers) + "\n"
-                conn.sendall(resp.encode())
+        if cmd == "GETPEERS" and len(parts) == 1:
+            # Older nodes read lines until the connection goes quiet
+            return "".join(f"{p}\n" for p in self.peers.sample(MAX_PEERS_PER_REPLY))
 
-            # Register a new peer
-            elif cmd == "JOIN" and len(parts) == 2:
-                peer_addr = parts[1]
-                self.peers.add(peer_addr)
-                print(f"[+] Registered peer: {peer_addr}")
+        if cmd == "GETPEERS":
+            try:
+                limit = max(0, min(int(parts[1]), MAX_PEERS_PER_REPLY))
+            except ValueError:
+                limit = MAX_PEERS_PER_REPLY
+            best = len(parts) > 2 and parts[2].upper() == "BEST"
+            peers = self.peers.best(limit) if best else self.peers.sample(limit)
+            lines = []
+            for p in peers:
+                status = self.peers.status(p)
+                lines.append(f"{p} {status[0]} {status[1]} {status[2]}\n" if status else f"{p}\n")
+            return f"PEERS {len(peers)}\n" + "".join(lines)
 
-            # Unregister a departing peer
-            elif cmd == "LEAVE" and len(parts) == 2:
-                peer_addr = parts[1]
-                if peer_addr in self.peers:
-                    self.peers.remove(peer_addr)
-                    print(f"[-] Unregistered peer: {peer_addr}")
+        if cmd in ("JOIN", "HEARTBEAT") and len(parts) >= 2:
+            status = None
+            if len(parts) == 5:
+                try:
+                    status = (int(parts[2]), parts[3], int(parts[4]))
+                except ValueError:
+                    pass
+            if self.peers.refresh(parts[1], status):
+                print(f"[+] Registered peer: {parts[1]}")
 
-        finally:
-            conn.close()
\ No newline at end of file
+        elif cmd == "LEAVE" and len(parts) == 2:
+            if self.peers.remove(parts[1]):
+                print(f"[-] Unregistered peer: {parts[1]}")
+        return None
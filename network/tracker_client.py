@@ -0,0 +1,136 @@
+# network/tracker_client.py
+import socket
+import threading
+from collections import namedtuple
+
+from network.tracker import HEARTBEAT_INTERVAL, MAX_PEERS_PER_REPLY
+
+# Seconds to wait for the tracker to connect or answer
+TRACKER_TIMEOUT = 5.0
+
+# A peer as listed by the tracker; height, tip_hash and work describe the
+# chain it last reported, and are None if it hasn't reported one
+PeerInfo = namedtuple("PeerInfo", ["addr", "height", "tip_hash", "work"])
+
+
+def chain_status(bc):
+    """
+    the (height, tip_hash, work) of bc's chain, as reported to the tracker
+
+    arguments:
+    bc -- blockchain instance
+
+    return:
+    (height, tip_hash, work) tuple
+    """
+    tip = bc.get_latest_block()
+    return tip.index, tip.hash, bc.chain_work(tip)
+
+
+def tracker_command(tracker_host, tracker_port, command):
+    """
+    send one command that has no reply to the tracker
+    blocking until it has been sent
+
+    arguments:
+    tracker_host -- the tracker's hostname or IP address
+    tracker_port -- the tracker's port number
+    command      -- the command line, e.g. "JOIN host:port"
+
+    return:
+    None
+    """
+    with socket.create_connection((tracker_host, tracker_port), timeout=TRACKER_TIMEOUT) as s:
+        s.sendall(f"{command}\n".encode())
+
+
+def fetch_peer_info(tracker_host, tracker_port, self_id=None, limit=MAX_PEERS_PER_REPLY, best=False):
+    """
+    fetch a list of peers and the chains they last reported from the tracker
+    blocking until the whole reply has been read
+
+    it sends GETPEERS <limit> and reads the "PEERS <n>" line followed by
+    n peers, so lists of any size arrive whole; with more peers registered
+    than limit, the tracker picks a random sample, or the peers with the
+    most work if best is set
+
+    arguments:
+    tracker_host -- the tracker's hostname or IP address
+    tracker_port -- the tracker's port number
+    self_id      -- this node's identifier to exclude from the list, or None
+    limit        -- most peers to return
+    best         -- True to get the peers with the most work, most first
+
+    return:
+    list of PeerInfo excluding self_id
+    """
+    # Ask for one more, in case we're among them
+    wanted = limit + 1 if self_id is not None else limit
+    with socket.create_connection((tracker_host, tracker_port), timeout=TRACKER_TIMEOUT) as s:
+        s.sendall(f"GETPEERS {wanted}{' BEST' if best else ''}\n".encode())
+        with s.makefile("r", encoding="utf-8", newline="\n") as f:
+            header = f.readline().split()
+            if len(header) != 2 or header[0] != "PEERS":
+                raise ConnectionError(f"unexpected tracker reply: {' '.join(header)!r}")
+            peers = []
+            for _ in range(int(header[1])):
+                line = f.readline()
+                if not line.endswith("\n"):
+                    raise ConnectionError("tracker reply was cut short")
+                fields = line.split()
+                if len(fields) == 4:
+                    peers.append(PeerInfo(fields[0], int(fields[1]), fields[2], int(fields[3])))
+                else:
+                    peers.append(PeerInfo(fields[0], None, None, None))
+    return [p for p in peers if p.addr != self_id][:limit]
+
+
+def fetch_peers(tracker_host, tracker_port, self_id=None, limit=MAX_PEERS_PER_REPLY):
+    """
+    fetch_peer_info() without the chain details
+
+    return:
+    list of peer identifiers (strings) excluding self_id
+    """
+    return [p.addr for p in fetch_peer_info(tracker_host, tracker_port, self_id, limit)]
+
+
+def start_heartbeat(tracker_host, tracker_port, self_id, interval=HEARTBEAT_INTERVAL, status=None):
+    """
+    keep this node registered with the tracker by sending HEARTBEAT every
+    interval seconds from a background thread
+    returns at once
+
+    the first heartbeat registers the node, and a heartbeat after the
+    tracker restarted or expired us registers it again; failures are
+    printed and retried at the next interval. Each heartbeat carries our
+    chain's height, tip hash and work, so syncing nodes can pick a peer
+    that is ahead without downloading chains to compare
+
+    arguments:
+    tracker_host -- the tracker's hostname or IP address
+    tracker_port -- the tracker's port number
+    self_id      -- this node's identifier
+    interval     -- seconds between heartbeats
+    status       -- callable returning our (height, tip_hash, work), or None
+                    while there is nothing to report; or None
+
+    return:
+    threading.Event that stops the heartbeats when set
+    """
+    stopped = threading.Event()
+
+    def beat():
+        while not stopped.is_set():
+            try:
+                command = f"HEARTBEAT {self_id}"
+                current = status() if status is not None else None
+                if current is not None:
+                    command += " {} {} {}".format(*current)
+                tracker_command(tracker_host, tracker_port, command)
+            except OSError as e:
+                print(f"[Tracker] Heartbeat failed: {e}")
+            stopped.wait(interval)
+
+    threading.Thread(target=beat, daemon=True).start()
+    return stopped
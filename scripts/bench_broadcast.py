@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+import argparse
+import socket
+import statistics
+import threading
+import time
+
+from network.broadcast import Broadcaster, percentile
+from network.protocol import ConnectionPool, serve_connection, MSG_BLOCK
+
+# Keeps the stalled peers' sockets open
+_held = []
+
+def start_peer(stalled=False):
+    """
+    start a local peer that accepts BLOCK messages, or a stalled one whose
+    accept queue is full, so connecting to it hangs until the timeout
+
+    arguments:
+    stalled -- True for a peer that never answers
+
+    return:
+    "host:port" peer identifier
+    """
+    srv = socket.socket()
+    srv.bind(('127.0.0.1', 0))
+    addr = srv.getsockname()
+    if stalled:
+        srv.listen(0)
+        _held.append(srv)
+        # Fill the accept queue; further connection attempts go unanswered
+        for _ in range(2):
+            s = socket.socket()
+            s.setblocking(False)
+            s.connect_ex(addr)
+            _held.append(s)
+        return f"127.0.0.1:{addr[1]}"
+    srv.listen(128)
+
+    def accept_loop():
+        while True:
+            conn, _ = srv.accept()
+            threading.Thread(target=serve_connection, args=(conn, lambda t, p: None), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return f"127.0.0.1:{addr[1]}"
+
+def serial_broadcast(get_peers, pool, blk_dict):
+    """
+    the previous broadcast: look the peers up, then send to each in turn
+    blocking until every send has finished
+
+    arguments:
+    get_peers -- callable returning the peer list
+    pool      -- ConnectionPool to send over
+    blk_dict  -- block to send
+
+    return:
+    None
+    """
+    for p in get_peers():
+        host, ps = p.split(':')
+        try:
+            pool.get(host, int(ps)).send(MSG_BLOCK, blk_dict)
+        except Exception:
+            pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how long block broadcasts hold up the miner")
+    parser.add_argument("--peers", type=int, default=20, help="Peers that answer (default: 20)")
+    parser.add_argument("--stalled", type=int, default=1, help="Peers that never answer (default: 1)")
+    parser.add_argument("--blocks", type=int, default=10, help="Blocks to broadcast (default: 10)")
+    parser.add_argument("--tracker-delay", type=float, default=0.01,
+                        help="Seconds a tracker lookup takes (default: 0.01)")
+    args = parser.parse_args()
+
+    peers = [start_peer() for _ in range(args.peers)] + [start_peer(stalled=True) for _ in range(args.stalled)]
+    lookups = [0]
+
+    def get_peers():
+        lookups[0] += 1
+        time.sleep(args.tracker_delay)
+        return peers
+
+    print(f"Broadcasting {args.blocks} blocks to {args.peers} peers + {args.stalled} stalled")
+    blocked = []
+    pool = ConnectionPool()
+    for i in range(args.blocks):
+        start = time.perf_counter()
+        serial_broadcast(get_peers, pool, {"index": i, "hash": f"h{i}", "data": "x" * 1024})
+        blocked.append(time.perf_counter() - start)
+    print(f"  serial: miner blocked p50 {statistics.median(blocked) * 1000:.1f} ms, "
+          f"p99 {percentile(blocked, 99) * 1000:.1f} ms, {lookups[0]} tracker lookups")
+    pool.close_all()
+
+    lookups[0] = 0
+    blocked = []
+    pool = ConnectionPool()
+    broadcaster = Broadcaster(get_peers, pool=pool)
+    futures = []
+    for i in range(args.blocks):
+        start = time.perf_counter()
+        futures.append(broadcaster.broadcast({"index": i, "hash": f"h{i}", "data": "x" * 1024}))
+        blocked.append(time.perf_counter() - start)
+        # Blocks are minutes apart in practice; leave time for the fan-out
+        futures[-1].result()
+    p50, p99 = broadcaster.latency_percentiles()
+    print(f"  parallel: miner blocked p50 {statistics.median(blocked) * 1000:.3f} ms, "
+          f"fan-out p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms, {lookups[0]} tracker lookups")
+    broadcaster.close()
+    pool.close_all()
+
+if __name__ == "__main__":
+    main()
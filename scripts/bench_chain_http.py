@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import http.client
+import json
+import random
+import threading
+import time
+import tracemalloc
+
+from werkzeug.serving import make_server
+
+import scripts.run_server as run_server
+from network.replica import ChainReplica
+from network.tracker_client import PeerInfo
+from network.compression import ENCODINGS
+
+def make_story_chain(length, seed=1):
+    """
+    build a chain of block dicts shaped like mined story blocks
+    blocking until all are built
+
+    each block carries a few sentences of made-up prose in its data, with
+    story and previous positions, so the JSON compresses like a real story
+    would rather than like repeated filler
+
+    arguments:
+    length -- number of blocks
+    seed   -- random seed, for the same chain every run
+
+    return:
+    list of block dictionaries
+    """
+    rng = random.Random(seed)
+    words = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(2, 9)))
+             for _ in range(3000)]
+    blocks = []
+    prev_hash, prev_position = "0", None
+    for i in range(length):
+        position = {"book": 1 + i // 1000, "chapter": 1 + i // 50 % 20, "verse": 1 + i % 50}
+        data = {
+            "Content": " ".join(rng.choice(words) for _ in range(rng.randint(40, 80))).capitalize() + ".",
+            "Author": f"node{rng.randint(1, 8)}.local:500{rng.randint(0, 9)}",
+            "storyPosition": position,
+            "previousPosition": prev_position,
+        }
+        block = {
+            "index": i, "timestamp": 1.7e9 + i * 10, "data": json.dumps(data), "author": data["Author"],
+            "previous_hash": prev_hash, "nonce": rng.randint(0, 10**6),
+            "hash": "00" + hashlib.sha256(f"{seed}:{i}".encode()).hexdigest()[2:],
+            "position_hash": hashlib.sha256(json.dumps(position, sort_keys=True).encode()).hexdigest(),
+            "previous_position_hash": None, "version": 3, "difficulty": 2,
+        }
+        if prev_position is not None:
+            block["previous_position_hash"] = hashlib.sha256(json.dumps(prev_position, sort_keys=True).encode()).hexdigest()
+        blocks.append(block)
+        prev_hash, prev_position = block["hash"], position
+    return blocks
+
+def timed_get(port, path, encoding):
+    """
+    GET path from the server on port, as a browser would
+    blocking until the whole body has been read
+
+    arguments:
+    port     -- the server's port on 127.0.0.1
+    path     -- request path and query
+    encoding -- Accept-Encoding value, or None for none
+
+    return:
+    (seconds to the first body byte, seconds to the last, bytes received)
+    """
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    headers = {"Accept-Encoding": encoding} if encoding else {}
+    start = time.perf_counter()
+    conn.request("GET", path, headers=headers)
+    resp = conn.getresponse()
+    first = resp.read(1)
+    ttfb = time.perf_counter() - start
+    size = len(first) + len(resp.read())
+    total = time.perf_counter() - start
+    conn.close()
+    return ttfb, total, size
+
+def peak_memory(path, encoding):
+    """
+    the most memory Python allocated while the app answered path, read
+    through Flask's test client
+
+    return:
+    peak bytes above what was allocated before the request
+    """
+    client = run_server.app.test_client()
+    headers = {"Accept-Encoding": encoding} if encoding else {}
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    resp = client.get(path, headers=headers, buffered=False)
+    for _ in resp.response:
+        pass
+    resp.close()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return peak
+
+def report(label, ttfb, total, size, plain):
+    saved = f"{100 * (1 - size / plain):5.1f}% saved" if size != plain else ""
+    print(f"{label:<34} ttfb {ttfb * 1000:8.1f} ms   total {total * 1000:8.1f} ms   "
+          f"{size / 1e6:7.2f} MB {saved}", flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure /chain response size and time to first byte")
+    parser.add_argument("--blocks", type=int, default=50000, help="Chain length (default: 50000)")
+    args = parser.parse_args()
+
+    chain = make_story_chain(args.blocks)
+    tip = chain[-1]
+    run_server.replica = ChainReplica(
+        lambda: [PeerInfo("bench:1", tip["index"], tip["hash"], len(chain))],
+        lambda peer, from_height: chain[from_height:]
+    )
+    run_server.replica.ensure_loaded()
+    server = make_server('127.0.0.1', 0, run_server.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+    print(f"{args.blocks} blocks; encodings offered: {', '.join(ENCODINGS)}"
+          f"{'' if 'br' in ENCODINGS else ' (pip install brotli for br)'}", flush=True)
+
+    plain = None
+    for encoding in (None,) + ENCODINGS:
+        name = encoding or "identity"
+        # The whole chain built in one piece: first request (serialised
+        # and compressed) and repeats (from the per-tip cache)
+        run_server.STREAM_MIN_BLOCKS = args.blocks + 1
+        run_server.replica._slices.clear()
+        ttfb, total, size = timed_get(port, "/chain", encoding)
+        plain = plain or size
+        report(f"buffered, first, {name}", ttfb, total, size, plain)
+        report(f"buffered, cached, {name}", *timed_get(port, "/chain", encoding), plain)
+        run_server.STREAM_MIN_BLOCKS = 2000
+        report(f"streamed, {name}", *timed_get(port, "/chain", encoding), plain)
+        report(f"ndjson, {name}", *timed_get(port, "/chain?format=ndjson", encoding), plain)
+        report(f"page of 20, {name}", *timed_get(port, "/chain?page=2&per_page=20", encoding),
+               timed_get(port, "/chain?page=2&per_page=20", None)[2])
+
+    for encoding in (None, "gzip"):
+        name = encoding or "identity"
+        run_server.STREAM_MIN_BLOCKS = args.blocks + 1
+        run_server.replica._slices.clear()
+        buffered = peak_memory("/chain", encoding)
+        run_server.STREAM_MIN_BLOCKS = 2000
+        streamed = peak_memory("/chain", encoding)
+        print(f"peak memory, {name:<8} buffered {buffered / 1e6:7.1f} MB   streamed {streamed / 1e6:7.1f} MB",
+              flush=True)
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+import argparse
+import socket
+import statistics
+import threading
+import time
+
+from blockchain.block import Block
+from blockchain.blockchain import Blockchain
+from network.broadcast import Broadcaster
+from network.gossip import Gossip, GOSSIP_FANOUT
+from network.protocol import ConnectionPool, serve_connection, MSG_BLOCK
+from network.handler import MessageHandler
+
+def mine(block):
+    while not block.hash.startswith("0"):
+        block.nonce += 1
+        block.hash = block.calculate_hash()
+
+class Node:
+    def __init__(self, genesis, peers, fanout, stats):
+        """
+        In-process node on an ephemeral port. Blocks are relayed by gossip
+        when fanout is set, and not relayed at all otherwise.
+        stats counts the messages and bytes every node receives.
+        """
+        self.bc = Blockchain(difficulty=1)
+        self.bc.chain = [Block(**genesis.to_dict())]
+        self.bc._mine_block = mine
+        self.pool = ConnectionPool()
+        srv = socket.socket()
+        srv.bind(('127.0.0.1', 0))
+        srv.listen(512)
+        self.id = f"127.0.0.1:{srv.getsockname()[1]}"
+        self.broadcaster = Broadcaster(lambda: peers, pool=self.pool)
+        self.gossip = None
+        if fanout:
+            self.gossip = Gossip(self.bc, self.id, self.broadcaster, lambda blk: self.handler(MSG_BLOCK, blk),
+                                 pool=self.pool, fanout=fanout)
+        self.handler = MessageHandler(self.bc, self.gossip)
+
+        def handle(msg_type, payload):
+            with stats["lock"]:
+                stats["messages"] += 1
+                stats["bytes"] += len(str(payload))
+            return self.handler(msg_type, payload)
+
+        def accept_loop():
+            while True:
+                conn, _ = srv.accept()
+                threading.Thread(target=serve_connection, args=(conn, handle), daemon=True).start()
+
+        threading.Thread(target=accept_loop, daemon=True).start()
+
+    def close(self):
+        self.pool.close_all()
+
+def run(nodes_count, fanout, blocks, data_size):
+    """
+    mine blocks on one node of an in-process network and time how long each
+    takes to reach every node
+    blocking until every block has reached every node
+
+    arguments:
+    nodes_count -- number of nodes
+    fanout      -- gossip fanout, or 0 for the miner sending to every peer
+    blocks      -- blocks to mine and time
+    data_size   -- bytes of data per block
+
+    return:
+    (list of per-block convergence times, messages received, bytes received)
+    """
+    genesis = Blockchain(difficulty=1).chain[0]
+    peers = []
+    stats = {"messages": 0, "bytes": 0, "lock": threading.Lock()}
+    nodes = [Node(genesis, peers, fanout, stats) for _ in range(nodes_count)]
+    peers.extend(node.id for node in nodes)
+    miner = nodes[0]
+
+    times = []
+    for i in range(blocks):
+        blk = miner.bc.add_block("x" * data_size)
+        start = time.perf_counter()
+        if fanout:
+            miner.gossip.announce(blk.to_dict())
+        else:
+            miner.broadcaster.fan_out([p for p in peers if p != miner.id],
+                                      lambda conn: conn.send(MSG_BLOCK, blk.to_dict()), f"Block #{blk.index}")
+        while any(node.bc.get_latest_block().hash != blk.hash for node in nodes):
+            time.sleep(0.005)
+        times.append(time.perf_counter() - start)
+    for node in nodes:
+        node.close()
+    return times, stats["messages"], stats["bytes"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare block propagation by gossip and by sending to every peer")
+    parser.add_argument("--nodes", type=int, default=100, help="Nodes in the network (default: 100)")
+    parser.add_argument("--fanout", type=int, default=GOSSIP_FANOUT,
+                        help=f"Gossip fanout (default: {GOSSIP_FANOUT})")
+    parser.add_argument("--blocks", type=int, default=5, help="Blocks to propagate (default: 5)")
+    parser.add_argument("--data-size", type=int, default=4096, help="Bytes of data per block (default: 4096)")
+    args = parser.parse_args()
+
+    print(f"{args.nodes} nodes, {args.blocks} blocks of ~{args.data_size}B, all mined by one node")
+    for name, fanout in (("push to all", 0), (f"gossip f={args.fanout}", args.fanout)):
+        times, messages, size = run(args.nodes, fanout, args.blocks, args.data_size)
+        print(f"{name:>14}: converged in p50 {statistics.median(times) * 1000:.0f} ms, "
+              f"max {max(times) * 1000:.0f} ms; miner sent to "
+              f"{args.nodes - 1 if not fanout else min(fanout, args.nodes - 1)} peers per block; "
+              f"{messages / args.blocks:.0f} messages, {size / args.blocks / 1024:.0f} KB received per block")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+import argparse
+import socket
+import statistics
+import threading
+import time
+
+from blockchain.blockchain import Blockchain
+from network.async_node import AsyncNode
+from network.protocol import PeerConnection, MSG_BLOCK, MSG_GETCHAIN
+from scripts.bench_validation import build_chain
+from network.handler import MessageHandler
+from scripts.run_node import listen_for_blocks
+
+def free_port():
+    """
+    pick a TCP port nothing is listening on
+
+    return:
+    port number
+    """
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_node(runtime, chain):
+    """
+    start a listener serving a copy of chain with the given runtime
+    blocking until the listener accepts connections
+
+    arguments:
+    runtime -- "threaded" or "asyncio"
+    chain   -- list of Blocks the node starts with
+
+    return:
+    (port, blockchain instance)
+    """
+    bc = Blockchain(difficulty=1)
+    bc.chain = list(chain)
+    port = free_port()
+    if runtime == "asyncio":
+        node = AsyncNode(port, MessageHandler(bc))
+        threading.Thread(target=node.run, daemon=True).start()
+    else:
+        threading.Thread(target=listen_for_blocks, args=(port, MessageHandler(bc)), daemon=True).start()
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return port, bc
+        except OSError:
+            time.sleep(0.05)
+
+def run(runtime, chain, new_blocks, syncers):
+    """
+    measure how long new blocks take to be applied while peers sync
+    blocking until every new block has been sent and applied
+
+    arguments:
+    runtime    -- "threaded" or "asyncio"
+    chain      -- blocks the node serves to syncing peers
+    new_blocks -- blocks extending chain, sent one at a time
+    syncers    -- number of peers fetching the whole chain in a loop
+
+    return:
+    list of per-block latencies in seconds
+    """
+    port, bc = start_node(runtime, chain)
+    stop = threading.Event()
+
+    def sync_loop():
+        peer = PeerConnection('127.0.0.1', port)
+        while not stop.is_set():
+            peer.request(MSG_GETCHAIN, {"from": 0})
+        peer.close()
+
+    loaders = [threading.Thread(target=sync_loop, daemon=True) for _ in range(syncers)]
+    for t in loaders:
+        t.start()
+    time.sleep(0.5)
+
+    sender = PeerConnection('127.0.0.1', port)
+    latencies = []
+    for blk in new_blocks:
+        start = time.perf_counter()
+        sender.send(MSG_BLOCK, blk.to_dict())
+        while bc.get_latest_block().hash != blk.hash:
+            time.sleep(0.0005)
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.05)
+    stop.set()
+    sender.close()
+    for t in loaders:
+        t.join()
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure block propagation latency while peers sync the chain")
+    parser.add_argument("--blocks", type=int, default=5000, help="Chain length served to syncing peers (default: 5000)")
+    parser.add_argument("--data-size", type=int, default=1024, help="Bytes of data per block (default: 1024)")
+    parser.add_argument("--syncers", type=int, default=4, help="Peers syncing the whole chain concurrently (default: 4)")
+    parser.add_argument("--samples", type=int, default=20, help="New blocks to time (default: 20)")
+    args = parser.parse_args()
+
+    full = build_chain(args.blocks + args.samples, 1, args.data_size)
+    chain, new_blocks = full[:args.blocks], full[args.blocks:]
+    print(f"Serving {len(chain)} blocks of ~{args.data_size}B to {args.syncers} syncing peer(s)")
+
+    for runtime in ("threaded", "asyncio"):
+        latencies = run(runtime, chain, new_blocks, args.syncers)
+        print(f"{runtime:>8}: block applied in p50 {statistics.median(latencies) * 1000:.1f} ms, "
+              f"max {max(latencies) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
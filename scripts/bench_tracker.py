@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+import argparse
+import socket
+import threading
+import time
+
+from network.tracker import Tracker
+from network.tracker_client import fetch_peers, tracker_command
+
+def run_clients(clients, per_client, work):
+    """
+    run work(client, i) per_client times on each of clients threads
+    blocking until every thread has finished
+
+    arguments:
+    clients    -- number of client threads
+    per_client -- calls per thread
+    work       -- callable taking the client number and call number
+
+    return:
+    calls per second across all threads
+    """
+    def loop(c):
+        for i in range(per_client):
+            work(c, i)
+
+    threads = [threading.Thread(target=loop, args=(c,)) for c in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return clients * per_client / (time.perf_counter() - start)
+
+def report(label, rate):
+    print(f"{label:<32} {rate:8.0f}/s", flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure tracker registrations and lookups per second")
+    parser.add_argument("--peers", type=int, default=10000, help="Peers to register (default: 10000)")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent client threads (default: 8)")
+    parser.add_argument("--lookups", type=int, default=2000, help="GETPEERS requests in total (default: 2000)")
+    parser.add_argument("--limit", type=int, default=50, help="Peers asked for per lookup (default: 50)")
+    args = parser.parse_args()
+
+    tracker = Tracker('127.0.0.1', 0)
+    threading.Thread(target=tracker.start, daemon=True).start()
+    while tracker.port == 0:
+        time.sleep(0.01)
+    host, port = '127.0.0.1', tracker.port
+    per_client = args.peers // args.clients
+
+    rate = run_clients(args.clients, per_client,
+                       lambda c, i: tracker_command(host, port, f"JOIN node{c}-{i}.local:9000"))
+    report("JOIN, one connection each", rate)
+
+    rate = run_clients(args.clients, per_client,
+                       lambda c, i: tracker_command(host, port, f"HEARTBEAT node{c}-{i}.local:9000"))
+    report("HEARTBEAT, one connection each", rate)
+
+    # Many commands down one connection, as the tracker reads them
+    start = time.perf_counter()
+    with socket.create_connection((host, port)) as s:
+        s.sendall("".join(f"HEARTBEAT node0-{i}.local:9000\n" for i in range(per_client)).encode())
+        s.sendall(b"GETPEERS 0\n")
+        s.makefile("r").readline()
+    report("HEARTBEAT, pipelined", per_client / (time.perf_counter() - start))
+
+    per_client = args.lookups // args.clients
+    rate = run_clients(args.clients, per_client,
+                       lambda c, i: fetch_peers(host, port, limit=args.limit))
+    report(f"GETPEERS {args.limit} of {len(tracker.peers)}", rate)
+    rate = run_clients(args.clients, max(1, per_client // 10),
+                       lambda c, i: fetch_peers(host, port))
+    report(f"GETPEERS 1000 of {len(tracker.peers)}", rate)
+    tracker.stop()
+
+if __name__ == "__main__":
+    main()
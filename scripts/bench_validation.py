@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import time
+
+from blockchain.blockchain import Blockchain
+from blockchain.block import Block, BLOCK_VERSION
+
+def build_chain(length, difficulty, data_size):
+    """
+    build a valid chain of the given length for benchmarking
+    blocking until every block has been mined
+
+    arguments:
+    length     -- number of blocks including genesis
+    difficulty -- leading zero hex digits each block must have
+    data_size  -- approximate size of each block's data in bytes
+
+    return:
+    list of Block objects, genesis first
+    """
+    chain = Blockchain(difficulty=difficulty).chain[:1]
+    content = "x" * data_size
+    target = "0" * difficulty
+    for i in range(1, length):
+        prev = chain[-1]
+        blk = Block(
+            index=i,
+            previous_hash=prev.hash,
+            data=json.dumps({"Content": content, "storyPosition": {"verse": i}}),
+            author="bench:0",
+            position_hash=f"{i:064x}",
+            previous_position_hash=prev.position_hash if i > 1 else None,
+            version=BLOCK_VERSION,
+            difficulty=difficulty
+        )
+        hash_nonce = blk.nonce_hasher()
+        while not blk.hash.startswith(target):
+            blk.nonce += 1
+            blk.hash = hash_nonce(blk.nonce)
+        chain.append(blk)
+    return chain
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure is_valid_chain throughput by worker count")
+    parser.add_argument("--blocks", type=int, default=20000, help="Chain length (default: 20000)")
+    parser.add_argument("--data-size", type=int, default=512, help="Bytes of data per block (default: 512)")
+    parser.add_argument("--workers", default="1,2,4,8", help="Comma-separated worker counts (default: 1,2,4,8)")
+    args = parser.parse_args()
+
+    difficulty = 1
+    chain = build_chain(args.blocks, difficulty, args.data_size)
+    print(f"Built {len(chain)} blocks of ~{args.data_size}B")
+
+    for workers in [int(w) for w in args.workers.split(",")]:
+        # workers=1 validates in-process; more times one run in-process and
+        # one in the process pool, then keeps whichever was faster
+        bc = Blockchain(difficulty=difficulty, validation_workers=workers)
+        try:
+            rates = []
+            for _ in range(3):
+                start = time.perf_counter()
+                ok = bc.is_valid_chain(chain)
+                rates.append(len(chain) / (time.perf_counter() - start))
+            validator = bc._validator
+        finally:
+            bc.close()
+        if validator is None:
+            print(f"{workers} worker(s): {rates[-1]:,.0f} blocks/s (valid={ok})")
+        else:
+            print(f"{workers} worker(s): in-process {rates[0]:,.0f} blocks/s, pool {rates[1]:,.0f} blocks/s, "
+                  f"then {'pool' if validator.use_pool() else 'in-process'} {rates[2]:,.0f} blocks/s (valid={ok})")
+
+if __name__ == "__main__":
+    main()
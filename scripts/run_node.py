@@ -1,87 +1,39 @@
 #!/usr/bin/env python3
+import os
 import socket
 import sys
 import threading
-import json
 import time
 import argparse
 import logging
 import atexit
 
 from blockchain.blockchain import Blockchain
-from blockchain.block import Block
+from blockchain.storage import ChainStore
+from blockchain.sqlite_store import SQLiteChainStore
 from agent.storyteller import StoryTeller
 from agent.mining_agent import MiningAgent
-
-def fetch_peers(tracker_host, tracker_port, self_id):
-    """
-    fetch list of peers from tracker server
-    blocking until the full peer list is received
-
-    it sends a GETPEERS command to the tracker, decodes the response lines,
-    and filters out this node's own identifier
-
-    arguments:
-    tracker_host -- the tracker's hostname or IP address
-    tracker_port -- the tracker's port number
-    self_id      -- this peer's identifier to exclude from the returned list
-
-    return:
-    list of peer identifiers (strings) excluding self_id
-    """
-    with socket.socket() as s:
-        s.connect((tracker_host, tracker_port))
-        s.sendall(b"GETPEERS\n")
-        data = s.recv(4096).decode().splitlines()
-    return [p for p in data if p != self_id]
-
-def broadcast_fn(tracker_host, tracker_port, self_id, blk_dict):
-    """
-    broadcast block data to all peers
-    blocking until each send attempt completes
-
-    it fetches the peer list via fetch_peers, serializes blk_dict as a JSON
-    payload prefixed with "BLOCK ", then iterates through each peer,
-    sending the message and logging success or failure
-
-    arguments:
-    tracker_host -- the tracker's hostname or IP address
-    tracker_port -- the tracker's port number
-    self_id      -- this peer's identifier to exclude from broadcast
-    blk_dict     -- dictionary containing the block data to send
-
-    return:
-    None
-    """
-    peers = fetch_peers(tracker_host, tracker_port, self_id)
-    msg = "BLOCK " + json.dumps(blk_dict) + "\n"
-    for p in peers:
-        host, port_s = p.split(':')
-        try:
-            with socket.socket() as s:
-                s.connect((host, int(port_s)))
-                s.sendall(msg.encode())
-            print(f"[Broadcast] -> {p}")
-        except Exception as e:
-            print(f"[Broadcast] x {p}: {e}")
-
-def listen_for_blocks(port, bc, tracker_host, tracker_port, self_id):
+from network.sync import sync_with_peers, headers_first_sync, sync_candidates
+from network.async_node import AsyncNode
+from network.broadcast import Broadcaster
+from network.gossip import Gossip
+from network.handler import MessageHandler
+from network.tracker_client import fetch_peers, fetch_peer_info, tracker_command, start_heartbeat, chain_status
+from network.protocol import default_pool, serve_connection, MSG_BLOCK
+
+def listen_for_blocks(port, handle):
     """
-    listen for incoming block and chain requests on given port
-    runs indefinitely, handling GETCHAIN and BLOCK commands
+    listen for incoming peer connections on given port
+    runs indefinitely, serving each connection on its own thread
 
-    it binds to the specified port, accepts connections in a loop,
-    responds to GETCHAIN by sending the full chain, processes BLOCK
-    messages—appending valid next blocks, rejecting duplicates,
-    and syncing out-of-order blocks by fetching the longest valid chain
-    from peers
+    it binds to the specified port and accepts connections in a loop.
+    Peers that negotiate the framed protocol keep their connection open and
+    send any number of messages over it; older nodes send one text command
+    per connection. Either way each message goes to handle
 
     arguments:
     port           -- TCP port to listen on for peer connections
-    bc             -- blockchain instance with attributes chain, get_latest_block(), add_block_from_dict(), is_valid_chain()
-    tracker_host   -- the tracker's hostname or IP address for peer discovery
-    tracker_port   -- the tracker's port number for peer discovery
-    self_id        -- this node's identifier to exclude from peer list
+    handle         -- network.handler.MessageHandler answering each message
 
     return:
     None
@@ -92,117 +44,7 @@ def listen_for_blocks(port, bc, tracker_host, tracker_port, self_id):
     print(f"[Listener] Listening on port {port}…")
     while True:
         conn, addr = srv.accept()
-        try:
-            raw = conn.recv(8192).decode().strip()
-
-            # Reply on same connection to GETCHAIN
-            if raw == "GETCHAIN":
-                # For large blockchains, serialize and send in smaller chunks
-                # to avoid timeouts and memory issues
-                try:
-                    # First, prepare the data
-                    chain_data = [blk.to_dict() for blk in bc.chain]
-                    json_data = json.dumps(chain_data)
-                    
-                    # Log the size for debugging
-                    data_size = len(json_data.encode())
-                    print(f"[Listener] Sending chain with {len(chain_data)} blocks ({data_size/1024:.1f}KB) to {addr[0]}:{addr[1]}")
-                    
-                    # Send in a single response for small chains (under 1MB)
-                    if data_size < 1024 * 1024:  # 1MB
-                        conn.sendall(f"CHAIN {json_data}\n".encode())
-                    else:
-                        # For larger chains, split the JSON array into chunks
-                        # This is a workaround for large chains - sending prefix first
-                        conn.sendall(b"CHAIN ")
-                        
-                        # Send data in small chunks
-                        chunk_size = 65536  # 64KB chunks
-                        bytes_data = json_data.encode()
-                        for i in range(0, len(bytes_data), chunk_size):
-                            chunk = bytes_data[i:i+chunk_size]
-                            conn.sendall(chunk)
-                            
-                            # Add small delay to prevent buffer overflows
-                            if i % (1024 * 1024) == 0 and i > 0:  # Every 1MB
-                                print(f"[Listener] Sent {i/1024:.1f}KB so far...")
-                                time.sleep(0.1)  # Small delay every MB
-                                
-                        # Make sure to terminate the response
-                        conn.sendall(b"\n")
-                    
-                    print(f"[Listener] Finished sending chain data")
-                except Exception as e:
-                    print(f"[Listener] Error sending chain: {e}")
-                    # Send a simple response in case of error
-                    try:
-                        conn.sendall(b"CHAIN []\n")
-                    except:
-                        pass
-                conn.close()
-                continue
-
-            # Incoming block
-            if raw.startswith("BLOCK "):
-                blk = json.loads(raw[len("BLOCK "):])
-                latest = bc.get_latest_block()
-                
-                # Check for position hash uniqueness
-                if "position_hash" in blk and any(b.position_hash == blk["position_hash"] for b in bc.chain):
-                    print(f"[Listener] Rejecting block with duplicate position hash")
-                    conn.close()
-                    continue
-                    
-                if blk["index"] == latest.index + 1 and blk["previous_hash"] == latest.hash:
-                    # Try to add the block
-                    if bc.add_block_from_dict(blk):
-                        print(f"[Listener] Appended block #{blk['index']}")
-                else:
-                    # Out‐of‐order → sync longest chain
-                    print(f"[Listener] Out-of-order block {blk['index']}; syncing…")
-                    peers = fetch_peers(tracker_host, tracker_port, self_id)
-                    best_chain = None
-                    best_length = len(bc.chain)
-                    
-                    for p in peers:
-                        host, ps = p.split(':')
-                        try:
-                            with socket.socket() as s3:
-                                s3.connect((host, int(ps)))
-                                s3.sendall(b"GETCHAIN\n")
-                                
-                                # Read with better chunking
-                                chunks = []
-                                while True:
-                                    data = s3.recv(65536)
-                                    if not data:
-                                        break
-                                    chunks.append(data)
-                                
-                                full_data = b''.join(chunks)
-                                if full_data.startswith(b"CHAIN "):
-                                    chain_json = full_data[6:].decode().strip()
-                                    chain_data = json.loads(chain_json)
-                                    candidate = [Block(**d) for d in chain_data]
-                                    
-                                    # Check if this is a valid chain with no duplicate position hashes
-                                    if len(candidate) > best_length and bc.is_valid_chain(candidate):
-                                        best_chain = candidate
-                                        best_length = len(candidate)
-                        except Exception as e:
-                            print(f"[Listener] Error syncing with {p}: {e}")
-                            continue
-                            
-                    if best_chain and len(best_chain) > len(bc.chain):
-                        bc.chain = best_chain
-                        print(f"[Listener] Synced to length {len(bc.chain)}")
-        except Exception as e:
-            print(f"[Listener] Error handling connection: {e}")
-        finally:
-            try:
-                conn.close()
-            except:
-                pass
+        threading.Thread(target=serve_connection, args=(conn, handle), daemon=True).start()
 
 def main():
     parser = argparse.ArgumentParser(description="Run a Block-Bard node")
@@ -211,6 +53,16 @@ def main():
     parser.add_argument("--port", type=int, required=True, help="Port to listen on")
     parser.add_argument("--schema", default="bible", help="Schema to use (bible or path to JSON file)")
     parser.add_argument("--mine-interval", type=float, default=5.0, help="Mining interval in seconds (default: 5.0)")
+    parser.add_argument("--mining-workers", type=int, default=1,
+                       help="Processes to spread proof-of-work across (default: 1, 0 = one per CPU)")
+    parser.add_argument("--validation-workers", type=int, default=1,
+                       help="Processes to re-hash long runs of synced blocks across (default: 1, 0 = one per CPU)")
+    parser.add_argument("--runtime", default="threaded", choices=["threaded", "asyncio"],
+                       help="Serve peers from a thread per connection or an asyncio event loop (default: threaded)")
+    parser.add_argument("--data-dir",
+                       help="Directory to persist the chain in, reloaded on restart (default: in-memory only)")
+    parser.add_argument("--store", default="log", choices=["log", "sqlite"],
+                       help="Storage engine for --data-dir: append-only log or indexed SQLite (default: log)")
     parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"], 
                        help="Set the logging level")
     parser.add_argument("--api-key", help="OpenAI API key (defaults to OPENAI_API_KEY environment variable)")
@@ -234,57 +86,66 @@ def main():
     logger.info(f"Starting node with ID: {self_id}")
 
     # 1) Register with tracker
-    with socket.socket() as s:
-        s.connect((tracker_host, tracker_port))
-        s.sendall(f"JOIN {self_id}\n".encode())
+    tracker_command(tracker_host, tracker_port, f"JOIN {self_id}")
     logger.info(f"Registered with tracker at {tracker_host}:{tracker_port}")
 
-    # 1b) Unregister on clean exit
+    # 2) Start blockchain and listener
+    store = None
+    if args.data_dir and args.store == "sqlite":
+        os.makedirs(args.data_dir, exist_ok=True)
+        store = SQLiteChainStore(os.path.join(args.data_dir, "chain.db"))
+    elif args.data_dir:
+        store = ChainStore(args.data_dir)
+    bc = Blockchain(difficulty=2, mining_workers=args.mining_workers, store=store,
+                    validation_workers=args.validation_workers)
+    atexit.register(bc.close)
+    atexit.register(default_pool.close_all)
+
+    # Heartbeats keep us registered (we drop off the peer list if we crash)
+    # and tell syncing nodes how far our chain has got
+    heartbeat = start_heartbeat(tracker_host, tracker_port, self_id, status=lambda: chain_status(bc))
+
+    # Unregister on clean exit
     def unregister():
-        with socket.socket() as s:
-            s.connect((tracker_host, tracker_port))
-            s.sendall(f"LEAVE {self_id}\n".encode())
+        heartbeat.set()
+        tracker_command(tracker_host, tracker_port, f"LEAVE {self_id}")
     atexit.register(unregister)
 
-    # 2) Start blockchain and listener
-    bc = Blockchain(difficulty=2)
-    threading.Thread(
-        target=listen_for_blocks,
-        args=(int(my_port), bc, tracker_host, tracker_port, self_id),
-        daemon=True
-    ).start()
+    # Blocks are propagated by gossip: announced to a few random peers (from
+    # a peer list refreshed from the tracker periodically), which fetch and
+    # relay the ones they haven't seen
+    broadcaster = Broadcaster(lambda: fetch_peers(tracker_host, tracker_port, self_id))
+    atexit.register(broadcaster.close)
+    gossip = Gossip(bc, self_id, broadcaster, lambda blk: handle(MSG_BLOCK, blk))
+    atexit.register(gossip.close)
+    # Orphans' missing ancestors are fetched from the tracker's peers, and a
+    # block that moves our tip leaves whatever our miner is working on stale
+    handle = MessageHandler(
+        bc, gossip,
+        get_peers=lambda: fetch_peers(tracker_host, tracker_port, self_id),
+        on_tip_changed=bc.cancel_mining,
+        logger=logger
+    )
+
+    if args.runtime == "asyncio":
+        node = AsyncNode(int(my_port), handle)
+        threading.Thread(target=node.run, daemon=True).start()
+    else:
+        threading.Thread(target=listen_for_blocks, args=(int(my_port), handle), daemon=True).start()
     time.sleep(1)
     logger.info(f"Listener started on port {my_port}")
 
-    # 3) Initial sync to longest chain
-    peers = fetch_peers(tracker_host, tracker_port, self_id)
-    best_chain = None
-    best_length = len(bc.chain)
-
-    for p in peers:
-        host, ps = p.split(':')
-        try:
-            with socket.socket() as s2:
-                s2.connect((host, int(ps)))
-                s2.sendall(b"GETCHAIN\n")
-                data = s2.recv(65536).decode().strip()
-            if data.startswith("CHAIN "):
-                chain_data = json.loads(data[len("CHAIN "):])
-                candidate = [Block(**d) for d in chain_data]
-                
-                # Check if this is a valid chain with no duplicate position hashes
-                if len(candidate) > best_length and bc.is_valid_chain(candidate):
-                    best_chain = candidate
-                    best_length = len(candidate)
-        except Exception as e:
-            logger.warning(f"Error syncing with {p}: {e}")
-            continue
-
-    if best_chain and len(best_chain) > len(bc.chain):
-        bc.chain = best_chain
-        logger.info(f"Synced to chain length {len(bc.chain)}")
-    else:
-        logger.info("No longer chain found, using genesis block")
+    # 3) Initial sync to the chain with the most work, from the peers the
+    # tracker says are ahead of us: headers first, then block ranges from
+    # several peers at once; whole chains from peers that don't serve headers
+    peers = sync_candidates(bc, fetch_peer_info(tracker_host, tracker_port, self_id, best=True))
+    applied = None
+    if peers:
+        applied = headers_first_sync(bc, peers, logger)
+        if applied is None:
+            applied = sync_with_peers(bc, peers, logger)
+    if not applied:
+        logger.info(f"No heavier chain found, keeping local chain of length {len(bc.chain)}")
 
     # 4) Configure AI agent
     st = StoryTeller(
@@ -296,11 +157,11 @@ def main():
     if args.system_prompt:
         logger.info(f"Using custom system prompt: {args.system_prompt}")
 
-    # 5) Launch the mining agent
+    # 5) Launch the mining agent; mined blocks are announced in the background
     miner = MiningAgent(
         bc=bc,
         storyteller=st,
-        broadcast_fn=lambda blk: broadcast_fn(tracker_host, tracker_port, self_id, blk),
+        broadcast_fn=gossip.announce,
         agent_name=self_id,
         mine_interval=args.mine_interval,
         story_schema=args.schema
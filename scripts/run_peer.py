@@ -2,77 +2,30 @@
 import socket
 import sys
 import threading
-import json
 import time
 import atexit
+import logging
 
-from blockchain.blockchain import Blockchain
-from blockchain.block import Block
+from blockchain.blockchain import Blockchain, MiningAborted
+from network.sync import sync_with_peers, headers_first_sync, sync_candidates
+from network.broadcast import Broadcaster
+from network.gossip import Gossip
+from network.handler import MessageHandler
+from network.tracker_client import fetch_peers, fetch_peer_info, tracker_command, start_heartbeat, chain_status
+from network.protocol import serve_connection, MSG_BLOCK
 
-def fetch_peers(tracker_host, tracker_port, self_id):
-    """
-    fetch list of peers from tracker server
-    blocking until the full peer list is received
-
-    it sends a GETPEERS command to the tracker, decodes the response lines,
-    and filters out this node's own identifier
-
-    arguments:
-    tracker_host -- the tracker's hostname or IP address
-    tracker_port -- the tracker's port number
-    self_id      -- this peer's identifier to exclude from the returned list
-
-    return:
-    list of peer identifiers (strings) excluding self_id
-    """
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.connect((tracker_host, tracker_port))
-        s.sendall("GETPEERS\n".encode())
-        data = s.recv(4096).decode().strip()
-    return [p for p in data.splitlines() if p != self_id]
-
-def fetch_chain_from_peer(host, port):
-    """
-    fetch blockchain data from a single peer
-    blocking until a CHAIN response is received or an error occurs
-
-    it opens a TCP connection to the given host:port, sends GETCHAIN,
-    decodes the response, and returns the parsed chain if valid
-
-    arguments:
-    host -- peer's hostname or IP address
-    port -- peer's TCP port number
-
-    return:
-    list of block dictionaries on success, or None on failure
-    """
-    try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect((host, port))
-            s.sendall("GETCHAIN\n".encode())
-            resp = s.recv(65536).decode().strip()
-        if resp.startswith("CHAIN "):
-            return json.loads(resp[len("CHAIN "):])
-    except:
-        pass
-    return None
-
-def listen_for_messages(port, bc, tracker_host, tracker_port, self_id):
+def listen_for_messages(port, handle):
     """
     listen for chain and block messages on given port
-    blocking until each message is processed
+    runs indefinitely, serving each connection on its own thread
 
-    it binds to the specified port, accepts TCP connections in a loop,
-    replies to GETCHAIN requests with the full blockchain, processes
-    incoming BLOCK messages by appending valid next blocks or, if out-of-order,
-    syncing to the longest chain available from peers
+    it binds to the specified port, accepts TCP connections in a loop and
+    serves each with network.protocol.serve_connection, which passes every
+    message (framed, or a text command from an older node) to handle
 
     arguments:
     port           -- TCP port to listen on for incoming peer connections
-    bc             -- blockchain instance with attributes chain and get_latest_block()
-    tracker_host   -- tracker's hostname or IP address for peer discovery
-    tracker_port   -- tracker's port number for peer discovery
-    self_id        -- this node's identifier to exclude from peer list
+    handle         -- network.handler.MessageHandler answering each message
 
     return:
     None
@@ -83,73 +36,7 @@ def listen_for_messages(port, bc, tracker_host, tracker_port, self_id):
     print(f"[Listener] Listening on port {port}…")
     while True:
         conn, _ = srv.accept()
-        raw = conn.recv(8192).decode().strip()
-
-        # GETCHAIN → reply on same connection
-        if raw == "GETCHAIN":
-            payload = json.dumps([blk.to_dict() for blk in bc.chain])
-            conn.sendall(f"CHAIN {payload}\n".encode())
-            conn.close()
-            continue
-
-        # BLOCK broadcast
-        if raw.startswith("BLOCK "):
-            blk = json.loads(raw[len("BLOCK "):])
-            idx = blk["index"]
-            latest = bc.get_latest_block()
-
-            if idx == latest.index + 1 and blk["previous_hash"] == latest.hash:
-                bc.chain.append(Block(**blk))
-                print(f"[Listener] Appended block {idx}")
-            else:
-                # out-of-order: sync longest chain
-                print(f"[Listener] Out-of-order block {idx}; syncing…")
-                peers = fetch_peers(tracker_host, tracker_port, self_id)
-                best = bc.chain
-                for p in peers:
-                    h, ps = p.split(':')
-                    cl = fetch_chain_from_peer(h, int(ps))
-                    if cl and len(cl) > len(best):
-                        best = [Block(**d) for d in cl]
-                if len(best) > len(bc.chain):
-                    bc.chain = best
-                    print(f"[Listener] Synced; new length={len(bc.chain)}")
-                else:
-                    print("[Listener] No longer chain found.")
-            conn.close()
-
-def broadcast_block(blk_dict, tracker_host, tracker_port, self_id):
-    """
-    broadcast a new block to all peers except self
-    blocking until each send attempt completes
-
-    it retrieves the current peer list via fetch_peers(), constructs a
-    BLOCK message by JSON-serializing blk_dict, skips this node's own ID,
-    and sends the message to each remaining peer, logging success or error
-
-    arguments:
-    blk_dict      -- dictionary containing the block data to broadcast
-    tracker_host  -- the tracker's hostname or IP address for peer discovery
-    tracker_port  -- the tracker's port number for peer discovery
-    self_id       -- this node's identifier to exclude from broadcasting
-
-    return:
-    None
-    """
-    peers = fetch_peers(tracker_host, tracker_port, self_id)
-    msg = "BLOCK " + json.dumps(blk_dict) + "\n"
-    for p in peers:
-        if p == self_id:
-            continue
-        host, ps = p.split(':')
-        port = int(ps)
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((host, port))
-                s.sendall(msg.encode())
-            print(f"[Broadcast] - {p}")
-        except Exception as e:
-            print(f"[Broadcast] x {p}: {e}")
+        threading.Thread(target=serve_connection, args=(conn, handle), daemon=True).start()
 
 if __name__ == "__main__":
     if len(sys.argv) != 4:
@@ -159,37 +46,41 @@ if __name__ == "__main__":
     tracker_host, tracker_port, my_port = sys.argv[1], int(sys.argv[2]), sys.argv[3]
     self_id = f"{socket.gethostname()}:{my_port}"
 
-    # Register on join
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.connect((tracker_host, tracker_port))
-        s.sendall(f"JOIN {self_id}\n".encode())
+    # Register on join, then heartbeat with our chain's tip so the tracker
+    # drops us if we crash and syncing peers can see how far we've got
+    bc = Blockchain(difficulty=2)
+    tracker_command(tracker_host, tracker_port, f"JOIN {self_id}")
+    heartbeat = start_heartbeat(tracker_host, tracker_port, self_id, status=lambda: chain_status(bc))
 
     # On exit, notify tracker
     def unregister():
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect((tracker_host, tracker_port))
-            s.sendall(f"LEAVE {self_id}\n".encode())
+        heartbeat.set()
+        tracker_command(tracker_host, tracker_port, f"LEAVE {self_id}")
     atexit.register(unregister)
 
-    # Start listener thread
-    bc = Blockchain(difficulty=2)
-    threading.Thread(
-        target=listen_for_messages,
-        args=(int(my_port), bc, tracker_host, tracker_port, self_id),
-        daemon=True
-    ).start()
+    # Start listener thread; blocks are propagated by gossip
+    broadcaster = Broadcaster(lambda: fetch_peers(tracker_host, tracker_port, self_id))
+    gossip = Gossip(bc, self_id, broadcaster, lambda blk: handle(MSG_BLOCK, blk))
+    # A block that moves our tip makes the verse being mined stale, so the
+    # shell is told to resend it
+    handle = MessageHandler(
+        bc, gossip,
+        get_peers=lambda: fetch_peers(tracker_host, tracker_port, self_id),
+        on_tip_changed=bc.cancel_mining,
+        logger=logging.getLogger("peer")
+    )
+    threading.Thread(target=listen_for_messages, args=(int(my_port), handle), daemon=True).start()
     time.sleep(0.5)
 
-    # Initial sync
-    peers = fetch_peers(tracker_host, tracker_port, self_id)
-    best = bc.chain
-    for p in peers:
-        h, ps = p.split(':')
-        cl = fetch_chain_from_peer(h, int(ps))
-        if cl and len(cl) > len(best):
-            best = [Block(**d) for d in cl]
-    if len(best) > len(bc.chain):
-        bc.chain = best
+    # Initial sync to the valid chain with the most work, from the peers
+    # the tracker says are ahead of us
+    peers = sync_candidates(bc, fetch_peer_info(tracker_host, tracker_port, self_id, best=True))
+    applied = None
+    if peers:
+        applied = headers_first_sync(bc, peers, logging.getLogger("peer"))
+        if applied is None:
+            applied = sync_with_peers(bc, peers, logging.getLogger("peer"))
+    if applied:
         print(f"[Startup] Synced chain length={len(bc.chain)}")
 
     # Interactive shell
@@ -210,9 +101,13 @@ if __name__ == "__main__":
                 continue
 
             # Mine & broadcast
-            new_blk = bc.add_block({"content": line, "author": self_id})
+            try:
+                new_blk = bc.add_block({"content": line, "author": self_id})
+            except MiningAborted:
+                print("[Mined] x another block arrived first; please resend\n")
+                continue
             print(f"[Mined] #{new_blk.index} hash={new_blk.hash}")
-            broadcast_block(new_blk.to_dict(), tracker_host, tracker_port, self_id)
+            gossip.announce(new_blk.to_dict())
             print(f"[Chain] length={len(bc.chain)}, latest={bc.get_latest_block().index}\n")
 
     except KeyboardInterrupt:
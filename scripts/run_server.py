@@ -2,17 +2,40 @@
 import os
 import socket
 import json
-from flask import Flask, jsonify, send_from_directory, request
+import queue
+import threading
+import atexit
+from flask import Flask, Response, jsonify, send_from_directory, request
 from flask_cors import CORS
 import hashlib
 import time
-import concurrent.futures
+
+from blockchain.block import Block
+from blockchain.validation import check_block_hash, MIN_DIFFICULTY
+from network.protocol import default_pool, open_stream, serve_connection, MSG_GETCHAINSTREAM, MSG_BLOCK
+from network.peer_stats import default_stats
+from network.sync import fetch_chain
+from network.replica import ChainReplica
+from network.compression import ENCODINGS, compress_chunks
+from blockchain.story_tree import DEFAULT_SUBTREE_DEPTH
+from network.broadcast import Broadcaster
+from network.gossip import Gossip
+from network.handler import MessageHandler
+from network import tracker_client
 
 # Configuration
 TRACKER_HOST = '127.0.0.1'
 TRACKER_PORT = 8000
-PEER_FETCH_TIMEOUT = 10  # Increased from 2 to 10 seconds
-PEER_CONNECT_TIMEOUT = 3  # Added separate connection timeout
+# Port the server listens on as an observer node, for blocks from peers
+OBSERVER_PORT = 60001
+# Our "host:port" once we've joined the network as an observer, so we
+# don't pick ourselves from the tracker's peer list
+self_id = None
+# Seconds between comments sent to idle event streams, so proxies keep them open
+EVENTS_KEEPALIVE = 15
+# /chain replies longer than this many blocks are streamed as they are
+# serialised instead of being built whole (and cached)
+STREAM_MIN_BLOCKS = 2000
 
 # Paths
 BASE_DIR = os.path.dirname(__file__)
@@ -25,178 +48,155 @@ CORS(app, expose_headers=[
     'X-Total-Blocks', 
     'X-Page', 
     'X-Per-Page', 
-    'X-Total-Pages'
+    'X-Total-Pages',
+    'X-Cache',
+    'ETag'
 ])
 
 def fetch_peers():
     """
-    ask the tracker for the current peer list
+    ask the tracker for the current peer list, best chains first
     blocking until peer list is received or a timeout/error occurs
 
-    it connects to the tracker using TRACKER_HOST and TRACKER_PORT,
-    sends GETPEERS, reads the response lines, resolves hostnames to IPs,
-    and returns a list of "ip:port" strings (falling back to hostname on resolution failure)
+    it asks the tracker at TRACKER_HOST and TRACKER_PORT for the peers with
+    the most chain work (as reported in their heartbeats), resolves
+    hostnames to IPs (falling back to hostname on resolution failure), and
+    returns them with the tips they reported. The observer itself (self_id)
+    is left out. Among peers with the same
+    work the fastest, healthiest come first, and peers backed off for
+    failing or sending bad blocks are left out unless nothing else is left
 
     arguments:
     None
 
     return:
-    list of peer address strings in "ip:port" format, or empty list on error
+    list of network.tracker_client.PeerInfo with "ip:port" addresses, the
+    peer with the most work first, or empty list on error
     """
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.settimeout(PEER_CONNECT_TIMEOUT)
-            s.connect((TRACKER_HOST, TRACKER_PORT))
-            s.sendall(b"GETPEERS\n")
-            data = s.recv(4096).decode().strip()
         # Convert hostnames to IP addresses
-        peers = []
-        for peer in data.splitlines():
-            host, port = peer.split(':')
+        infos = {}
+        for info in tracker_client.fetch_peer_info(TRACKER_HOST, TRACKER_PORT, self_id, best=True):
+            host, port = info.addr.split(':')
             try:
                 # Try to resolve hostname to IP
                 ip = socket.gethostbyname(host)
-                peers.append(f"{ip}:{port}")
+                info = info._replace(addr=f"{ip}:{port}")
             except socket.gaierror:
                 # If resolution fails, use the original hostname
-                peers.append(peer)
-        return peers
+                pass
+            infos[info.addr] = info
+        peers = default_stats.rank(infos)
+        peers.sort(key=lambda p: (-(infos[p].work if infos[p].work is not None else -1), default_stats.cost(p)))
+        return [infos[p] for p in peers]
     except Exception as e:
         print(f"Error fetching peers: {e}")
         return []
 
-def fetch_chain_from_peer(peer):
+def _follows(prev, blk):
+    """
+    check that a streamed block comes straight after prev and carries a
+    correct hash with proof-of-work
+
+    arguments:
+    prev -- the previous block dictionary, or None if blk should be genesis
+    blk  -- block dictionary to check
+
+    return:
+    True if blk can follow prev
+    """
+    if prev is None:
+        return blk.get("index") == 0
+    if blk.get("index") != prev["index"] + 1 or blk.get("previous_hash") != prev["hash"]:
+        return False
+    # Blocks that don't record their difficulty are held to the lowest one
+    return check_block_hash(Block(**blk), MIN_DIFFICULTY)
+
+def _checked_blocks(blocks, from_height, peer):
+    """
+    collect a peer's blocks, checking each against the one before it
+    blocking until blocks is exhausted or a bad block is found
+
+    blocks may be a list or a stream being received; iteration stops at
+    the first block that doesn't follow the one before it, which counts
+    against the peer
+
+    arguments:
+    blocks      -- iterable of block dictionaries starting at from_height
+    from_height -- height of the first block
+    peer        -- "host:port" the blocks came from
+
+    return:
+    list of the block dictionaries, or empty list if any was bad
+    """
+    chain_data = []
+    for blk in blocks:
+        if chain_data or from_height == 0:
+            follows = _follows(chain_data[-1] if chain_data else None, blk)
+        else:
+            # The first block of a delta is checked against our tip by the caller
+            follows = blk.get("index") == from_height
+        if not follows:
+            print(f"Invalid block #{blk.get('index')} from {peer}, dropping it")
+            default_stats.record_bad_block(peer)
+            return []
+        chain_data.append(blk)
+    return chain_data
+
+def fetch_chain_from_peer(peer, from_height=0):
     """
     fetch blockchain data from a single peer
-    blocking until the full chain is received or an error/timeout occurs
+    blocking until the chain is received or an error/timeout occurs
 
-    it parses the peer address, connects over TCP with timeouts,
-    sends GETCHAIN, verifies the "CHAIN " prefix, streams the JSON payload
-    in chunks (with size and timeout safety checks), and returns the parsed list
+    it parses the peer address and streams the chain with GETCHAINSTREAM,
+    checking each block against the one before it as it arrives and
+    dropping the stream at the first bad block, so a broken or malicious
+    peer is given up on without buffering the rest of its chain. Peers that
+    don't stream are sent GETCHAIN instead, and its reply is checked the
+    same way before it is used. Throughput, failures and bad
+    blocks go into the peer statistics, and a peer backed off for them
+    isn't retried
 
     arguments:
-    peer -- address string in "host:port" format of the peer to query
+    peer        -- address string in "host:port" format of the peer to query
+    from_height -- height of the first block wanted
 
     return:
-    list of block dictionaries on success, or empty list on failure
+    list of block dictionaries from from_height on, or empty list on failure
     """
     host, port_s = peer.split(':')
     port = int(port_s)
-    
-    # Increase timeouts for more reliable data transfer
-    PEER_FETCH_TIMEOUT = 20  # Increase from 10 to 20 seconds
     MAX_RETRIES = 3
-    
+
     for retry in range(MAX_RETRIES):
+        if retry and default_stats.backed_off(peer):
+            break
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                # Set socket options for better reliability
-                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-                s.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-                
-                # Set buffer sizes
-                s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)  # 1MB receive buffer
-                
-                print(f"Connecting to {host}:{port} (attempt {retry+1}/{MAX_RETRIES})")
-                s.settimeout(PEER_CONNECT_TIMEOUT)  # Use shorter timeout for connection
-                s.connect((host, port))
-                
-                print(f"Connected to {host}:{port}, sending GETCHAIN")
-                s.sendall(b"GETCHAIN\n")
-                
-                # After connection, set longer timeout for data receipt
-                s.settimeout(PEER_FETCH_TIMEOUT)
-                
-                # Read the response in chunks
-                chunks = []
-                start_time = time.time()
-                total_bytes = 0
-                
-                # Read the first chunk to get the header
-                initial_chunk = s.recv(1024)
-                if not initial_chunk:
-                    print(f"Connection closed by {peer} without data")
-                    continue
-                
-                # Check for the CHAIN prefix
-                if not initial_chunk.startswith(b"CHAIN "):
-                    print(f"Invalid response prefix from {peer}: {initial_chunk[:20]}")
-                    continue
-                
-                # Add the initial chunk minus the prefix to our chunks list
-                chunks.append(initial_chunk[6:])
-                total_bytes = len(initial_chunk) - 6
-                
-                print(f"Got CHAIN prefix from {peer}, reading data...")
-                
-                # Now read the actual chain data in a loop
-                while True:
-                    try:
-                        chunk = s.recv(65536)  # 64KB chunks
-                        if not chunk:
-                            print(f"Connection closed by {peer}, total received: {total_bytes} bytes")
-                            break
-                        
-                        chunks.append(chunk)
-                        total_bytes += len(chunk)
-                        
-                        # Print progress for large chains
-                        if total_bytes > 1024*1024 and total_bytes % (1024*1024) < 65536:
-                            print(f"Received {total_bytes/1024/1024:.2f}MB from {peer}")
-                    
-                    except socket.timeout:
-                        # If we get a timeout but have received some data, consider it complete
-                        if total_bytes > 0:
-                            print(f"Socket timeout with {total_bytes} bytes received, processing data")
-                            break
-                        else:
-                            print(f"Socket timeout receiving data from {peer} with no data received")
-                            break
-                    except Exception as e:
-                        print(f"Error receiving data from {peer}: {e}")
-                        break
-                
-                # Process the data only if we received something
-                if chunks:
-                    full_data = b''.join(chunks)
-                    
-                    # Print debug info
-                    print(f"Received {len(full_data)/1024:.2f}KB from {peer} in {time.time()-start_time:.2f}s")
-                    
-                    # Try to decode and parse the JSON
-                    try:
-                        chain_json = full_data.decode().strip()
-                        chain_data = json.loads(chain_json)
-                        print(f"Successfully parsed chain data with {len(chain_data)} blocks")
-                        return chain_data
-                    except UnicodeDecodeError as e:
-                        print(f"Error decoding response from {peer}: {e}")
-                        print(f"First 100 bytes: {full_data[:100]}")
-                    except json.JSONDecodeError as e:
-                        print(f"Error parsing JSON from {peer} ({e})")
-                        # Try to salvage what we can - look for complete JSON
-                        if len(chain_json) > 0:
-                            try:
-                                # Look for closing bracket of JSON array
-                                last_bracket = chain_json.rfind(']')
-                                if last_bracket > 0:
-                                    truncated_json = chain_json[:last_bracket+1]
-                                    chain_data = json.loads(truncated_json)
-                                    print(f"Salvaged partial chain data with {len(chain_data)} blocks")
-                                    return chain_data
-                            except Exception:
-                                pass
-                        print(f"Could not salvage JSON data")
-        
+            print(f"Connecting to {host}:{port} (attempt {retry+1}/{MAX_RETRIES})")
+            start_time = time.time()
+            stream = open_stream(host, port, MSG_GETCHAINSTREAM, {"from": from_height})
+            if stream is None:
+                print(f"{peer} doesn't stream chains, sending GETCHAIN")
+                chain_data = _checked_blocks(fetch_chain(host, port, from_height or None) or [], from_height, peer)
+            else:
+                with stream:
+                    chain_data = _checked_blocks(stream, from_height, peer)
+            if chain_data:
+                print(f"Received {len(chain_data)} blocks from {peer} in {time.time()-start_time:.2f}s")
+                default_stats.record_transfer(peer, len(json.dumps(chain_data)), time.time() - start_time)
+                return chain_data
         except ConnectionRefusedError:
             print(f"Connection refused by {peer}")
+            default_stats.record_failure(peer)
         except socket.timeout:
-            print(f"Timeout connecting to {peer}")
+            print(f"Timeout fetching chain from {peer}")
+            default_stats.record_failure(peer)
         except Exception as e:
             print(f"Error fetching chain from {peer}: {e}")
-        
+            default_stats.record_failure(peer)
+
         print(f"Retry {retry+1}/{MAX_RETRIES} failed for {peer}")
-    
+
     print(f"All retries failed for {peer}")
     return []
 
@@ -227,99 +227,309 @@ def find_position_data(position_hash, all_blocks):
                 pass
     return None
 
+# Copy of the chain the API serves from, kept up to date by the blocks
+# peers send us and refreshed in the background
+replica = ChainReplica(fetch_peers, fetch_chain_from_peer, follows=_follows)
+
+def start_observer(port=OBSERVER_PORT):
+    """
+    join the network as an observer node that is sent blocks like any other
+    returns once the listener is running
+
+    it listens on port for peer connections and keeps registered with the
+    tracker by heartbeats carrying the replica's tip, so nodes broadcast
+    blocks to it but only sync from it when it is ahead of them. Messages are
+    answered by a network.handler.MessageHandler on the replica: blocks
+    that follow the tip are appended, which pushes them to subscribed
+    browsers, and other blocks make the replica catch up from the best
+    peer. It relays the blocks it appends by gossip, since a node may count
+    on it to pass announcements on, and serves chain requests from the
+    replica, so peers can fetch what we announce. The tracker is told
+    we've left on exit
+
+    arguments:
+    port -- TCP port to listen on for peer connections
+
+    return:
+    None
+    """
+    global self_id
+    self_id = f"{socket.gethostname()}:{port}"
+    broadcaster = Broadcaster(lambda: tracker_client.fetch_peers(TRACKER_HOST, TRACKER_PORT, self_id))
+    atexit.register(broadcaster.close)
+    # The replica stands in for the blockchain
+    gossip = Gossip(replica, self_id, broadcaster, lambda blk: handle(MSG_BLOCK, blk))
+    atexit.register(gossip.close)
+    handle = MessageHandler(replica, gossip, tag="Observer")
+    atexit.register(default_pool.close_all)
+
+    srv = socket.socket()
+    srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    srv.bind(('', port))
+    srv.listen()
+
+    def accept():
+        while True:
+            conn, addr = srv.accept()
+            threading.Thread(target=serve_connection, args=(conn, handle), daemon=True).start()
+    threading.Thread(target=accept, daemon=True).start()
+    print(f"[Observer] Listening for blocks on port {port}")
+
+    # Report the replica's tip like a node reports its chain, so syncing
+    # nodes only pick us when we are ahead of them
+    heartbeat = tracker_client.start_heartbeat(TRACKER_HOST, TRACKER_PORT, self_id, status=replica.chain_status)
+
+    def unregister():
+        heartbeat.set()
+        try:
+            tracker_client.tracker_command(TRACKER_HOST, TRACKER_PORT, f"LEAVE {self_id}")
+        except OSError:
+            pass
+    atexit.register(unregister)
+
 @app.route('/chain')
 def chain():
     """
-    retrieve and return the blockchain with optional pagination
-    blocking until a valid chain is fetched from a peer or none available
+    retrieve and return the blockchain with optional pagination, or only
+    the blocks added since a client's tip
+    blocking only if no chain has been fetched yet
 
-    it discovers peers via fetch_peers(), attempts to GETCHAIN from each until
-    successful, then applies page/per_page query parameters to slice the result
+    pages are cut from the server's replica of the chain, which a background
+    worker keeps in step with the best peer, and each page is serialised
+    once per tip; the X-Cache header says whether this one was (HIT) or
+    had to be (MISS). Every response carries the tip hash as its ETag, and
+    a request whose If-None-Match names the current tip is answered with
+    304 and no body. With since_hash (a client's tip) or since_height only
+    the blocks after it are returned, per_page at a time if given, so a
+    client's refresh costs as much as the blocks that are new to it; if
+    since_hash is no longer on the chain the client has to start over,
+    which is answered with 409.
+    Replies of more than STREAM_MIN_BLOCKS blocks, and any asked for with
+    stream=1 or format=ndjson, are streamed a chunk at a time as they are
+    serialised (X-Cache: STREAM), so the whole chain is never held in
+    memory for them. Bodies are compressed with brotli or gzip if the
+    client's Accept-Encoding allows it
 
     arguments:
     None (uses query params):
-      - page     -- 1-based page number (default=1)
-      - per_page -- number of blocks per page (default=0 for all)
+      - page         -- 1-based page number (default=1)
+      - per_page     -- number of blocks per page (default=0 for all)
+      - since_height -- return only blocks above this height
+      - since_hash   -- return only blocks after the block with this hash
+      - format       -- "json" for a JSON array (default) or "ndjson" for
+                        one block per line
+      - stream       -- 1 to stream the reply whatever its length
 
     return:
-    JSON list of block dictionaries (possibly paginated), or empty list if fetch fails
+    JSON list of block dictionaries (possibly paginated), 304 if the tip
+    is the one named in If-None-Match, 400 for bad parameters, 404 for a
+    page past the end, 409 if since_hash isn't on the chain, or 503 if no
+    chain is available
     """
     # Get pagination parameters
     page = request.args.get('page', default=1, type=int)
     per_page = request.args.get('per_page', default=0, type=int)  # 0 means all
-    
-    peers = fetch_peers()
-    if not peers:
-        print("No peers found to fetch chain from")
-        return jsonify([])
-    
-    print(f"Found {len(peers)} peers: {peers}")
-    
-    # Limit to 3 peers to try for performance
-    if len(peers) > 3:
-        # Sort peers by hostname so the selection is deterministic
-        peers.sort()
-        peers = peers[:3]
-        print(f"Limited to 3 peers: {peers}")
-    
-    # Try all peers in parallel and use the first valid result
-    chain_data = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=len(peers)) as executor:
-        # Submit all peer fetch tasks
-        future_to_peer = {executor.submit(fetch_chain_from_peer, peer): peer for peer in peers}
-        
-        # Wait for first successful result or all to complete
-        for future in concurrent.futures.as_completed(future_to_peer):
-            peer = future_to_peer[future]
-            try:
-                result = future.result()
-                if result and len(result) > 0:
-                    print(f"Successfully fetched chain with {len(result)} blocks from {peer}")
-                    chain_data = result
-                    break  # Use first successful result
-                else:
-                    print(f"Failed to fetch chain from {peer}")
-            except Exception as e:
-                print(f"Exception fetching from {peer}: {e}")
-    
-    if not chain_data:
+    since_height = request.args.get('since_height', type=int)
+    since_hash = request.args.get('since_hash')
+    ndjson = request.args.get('format', default='json') == 'ndjson'
+    stream = request.args.get('stream', default=0, type=int) == 1
+    if page < 1 or per_page < 0 or (since_height is not None and since_height < 0):
+        return jsonify({"error": "page, per_page and since_height can't be negative"}), 400
+
+    if not replica.ensure_loaded():
         print("Could not fetch blockchain from any peer")
         return jsonify([]), 503  # Service Unavailable
-    
-    # Apply pagination if requested
-    if per_page > 0 and len(chain_data) > 0:
+    blocks = replica.blocks()
+    total = len(blocks)
+    tip = blocks[-1]
+
+    # The client already has everything up to our tip
+    if request.if_none_match.contains_weak(tip["hash"]):
+        resp = Response(status=304)
+        resp.set_etag(tip["hash"])
+        return resp
+
+    if since_hash is not None or since_height is not None:
+        if since_hash is not None:
+            known = replica.get_known_block(since_hash)
+            if known is None or since_height not in (None, known["index"]):
+                return jsonify({"error": "since_hash is not on the chain",
+                                "height": tip["index"], "tip_hash": tip["hash"]}), 409
+            since_height = known["index"]
+        start_idx = min(since_height + 1, total)
+        end_idx = min(start_idx + per_page, total) if per_page > 0 else total
+        # Pages of what is new; the next one starts after this one's last block
+        page, per_page, paged = 1, per_page or end_idx - start_idx, total - start_idx
+    elif per_page > 0:
         # If requesting a specific page, calculate indices
         start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        
-        # Ensure we don't go out of bounds
-        start_idx = min(start_idx, len(chain_data) - 1) if len(chain_data) > 0 else 0
-        end_idx = min(end_idx, len(chain_data))
-        
-        # Add chain length as response header
-        resp = jsonify(chain_data[start_idx:end_idx])
-        resp.headers['X-Total-Blocks'] = str(len(chain_data))
-        resp.headers['X-Page'] = str(page)
-        resp.headers['X-Per-Page'] = str(per_page)
-        resp.headers['X-Total-Pages'] = str((len(chain_data) + per_page - 1) // per_page)
-        
-        # Debug header information
-        print(f"Setting pagination headers: X-Total-Blocks={len(chain_data)}, X-Total-Pages={(len(chain_data) + per_page - 1) // per_page}")
-        print(f"Returning {end_idx - start_idx} blocks (page {page} of {(len(chain_data) + per_page - 1) // per_page})")
-        return resp
-    
-    # For non-paginated requests, set headers on the response directly
-    resp = jsonify(chain_data)
-    if len(chain_data) > 0:
-        resp.headers['X-Total-Blocks'] = str(len(chain_data))
-        resp.headers['X-Page'] = '1'
-        resp.headers['X-Per-Page'] = str(len(chain_data))
-        resp.headers['X-Total-Pages'] = '1'
-        print(f"Setting headers for full response: X-Total-Blocks={len(chain_data)}")
-    
-    print(f"Returning complete chain with {len(chain_data)} blocks")
+        if start_idx >= total:
+            return jsonify({"error": "page out of range",
+                            "total_pages": (total + per_page - 1) // per_page}), 404
+        end_idx = min(start_idx + per_page, total)
+        paged = total
+    else:
+        start_idx, end_idx, page, per_page, paged = 0, total, 1, total, total
+
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    if stream or ndjson or end_idx - start_idx > STREAM_MIN_BLOCKS:
+        chunks, total, tip_hash = replica.stream_json(start_idx, end_idx, ndjson)
+        if encoding is not None:
+            chunks = compress_chunks(chunks, encoding)
+        resp = Response(chunks, mimetype='application/x-ndjson' if ndjson else 'application/json')
+        cache = 'STREAM'
+    else:
+        body, total, tip_hash, hit = replica.slice_json(start_idx, end_idx, encoding)
+        resp = Response(body, mimetype='application/json')
+        cache = 'HIT' if hit else 'MISS'
+    if encoding is not None:
+        resp.headers['Content-Encoding'] = encoding
+    resp.vary.add('Accept-Encoding')
+    # Compressed bodies differ byte for byte, so their ETag is weak
+    resp.set_etag(tip_hash, weak=encoding is not None)
+    # Cached copies have to be checked with us before they are reused
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Total-Blocks'] = str(total)
+    resp.headers['X-Page'] = str(page)
+    resp.headers['X-Per-Page'] = str(per_page)
+    resp.headers['X-Total-Pages'] = str((paged + per_page - 1) // per_page) if per_page else '0'
+    resp.headers['X-Cache'] = cache
     return resp
 
+def _json_response(body, hit):
+    resp = Response(body, mimetype='application/json')
+    resp.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+    return resp
+
+@app.route('/chain/tree')
+def tree():
+    """
+    return the story tree's structure: its roots, and optionally each
+    position's children
+    blocking only if no chain has been fetched yet
+
+    positions are identified by their position_hash; the blocks themselves
+    are fetched a subtree at a time from /chain/tree/<position_hash>. The
+    tree is kept up to date as blocks arrive rather than rebuilt per request
+
+    arguments:
+    None (uses query params):
+      - children -- 1 to include every position's children (default=0)
+
+    return:
+    JSON object {"size", "roots", "frontier"} (and "children"), or 503 if
+    no chain is available
+    """
+    with_children = request.args.get('children', default=0, type=int) == 1
+    if not replica.ensure_loaded():
+        return jsonify({}), 503
+    return _json_response(*replica.tree.structure_json(with_children))
+
+@app.route('/chain/tree/frontier')
+def tree_frontier():
+    """
+    return a page of the story's frontier: the positions nothing continues
+    from yet, newest first
+    blocking only if no chain has been fetched yet
+
+    arguments:
+    None (uses query params):
+      - page     -- 1-based page number (default=1)
+      - per_page -- number of blocks per page (default=20)
+
+    return:
+    JSON list of block dictionaries, with the same pagination headers as
+    /chain, or 503 if no chain is available
+    """
+    page = max(1, request.args.get('page', default=1, type=int))
+    per_page = max(1, request.args.get('per_page', default=20, type=int))
+    if not replica.ensure_loaded():
+        return jsonify([]), 503
+    body, total, hit = replica.tree.frontier_json((page - 1) * per_page, page * per_page)
+    resp = _json_response(body, hit)
+    resp.headers['X-Total-Blocks'] = str(total)
+    resp.headers['X-Page'] = str(page)
+    resp.headers['X-Per-Page'] = str(per_page)
+    resp.headers['X-Total-Pages'] = str((total + per_page - 1) // per_page)
+    return resp
+
+@app.route('/chain/tree/<position_hash>')
+def subtree(position_hash):
+    """
+    return the blocks of the story tree from one position down
+    blocking only if no chain has been fetched yet
+
+    arguments:
+    position_hash -- the position_hash of the subtree's root
+    None (uses query params):
+      - depth -- levels below the root to include (default=3, at most 50)
+
+    return:
+    JSON object {"root", "depth", "blocks", "children", "truncated"}; positions
+    in truncated have children that weren't included. 404 if the position
+    isn't in the tree, 503 if no chain is available
+    """
+    depth = request.args.get('depth', default=DEFAULT_SUBTREE_DEPTH, type=int)
+    if not replica.ensure_loaded():
+        return jsonify({}), 503
+    body, hit = replica.tree.subtree_json(position_hash, depth)
+    if body is None:
+        return jsonify({"error": "unknown position"}), 404
+    return _json_response(body, hit)
+
+@app.route('/events')
+def events():
+    """
+    stream changes to the chain to a browser as server-sent events
+    blocking for as long as the browser stays connected
+
+    each block appended to the replica is sent as a "block" event carrying
+    the block, with its hash as the event id; when the replica switches to
+    another chain a "reset" event with the new height and tip hash tells
+    the browser to reload. A browser reconnecting with Last-Event-ID is
+    first sent the blocks it missed. An idle stream gets a comment every
+    EVENTS_KEEPALIVE seconds
+
+    arguments:
+    None (uses the Last-Event-ID header)
+
+    return:
+    text/event-stream response
+    """
+    subscriber = replica.subscribe(request.headers.get('Last-Event-ID'))
+
+    def stream():
+        try:
+            yield b"retry: 2000\n\n"
+            while True:
+                try:
+                    event = subscriber.get(timeout=EVENTS_KEEPALIVE)
+                except queue.Empty:
+                    yield b": keepalive\n\n"
+                    continue
+                if event is None:
+                    # Fell behind; the browser reconnects and catches up
+                    return
+                yield event
+        finally:
+            replica.unsubscribe(subscriber)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/chain/stats')
+def chain_stats():
+    """
+    report the chain replica's cache hits and misses and refresh counters
+
+    arguments:
+    None
+
+    return:
+    JSON object of counters
+    """
+    return jsonify(replica.stats())
+
 # Serve React App for any other routes
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -343,5 +553,8 @@ def serve(path):
         return send_from_directory(STATIC_DIR, 'index.html')
 
 if __name__ == '__main__':
-    # Run on port 60000
-    app.run(host='0.0.0.0', port=60000, debug=True)
+    replica.start()
+    start_observer()
+    # Run on port 60000; without the reloader, which would start a second
+    # observer on the same port
+    app.run(host='0.0.0.0', port=60000, debug=True, use_reloader=False, threaded=True)
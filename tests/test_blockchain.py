@@ -1,5 +1,7 @@
 import unittest
-from blockchain.blockchain import Blockchain
+import hashlib
+import threading
+from blockchain.blockchain import Blockchain, MiningAborted
 from blockchain.block import Block
 from unittest.mock import patch
 
@@ -81,6 +83,109 @@ class TestBlockchain(unittest.TestCase):
             bc.add_block("slow block")
             self.assertEqual(bc.difficulty, 2)
 
+    def test_indexes_track_chain(self):
+        bc = Blockchain(difficulty=1)
+        blk = bc.add_block({"content": "verse", "author": "a",
+                            "position": {"book": 1, "chapter": 1, "verse": 1}})
+        self.assertIs(bc.get_block_by_hash(blk.hash), blk)
+        self.assertIs(bc.get_block_by_height(1), blk)
+        self.assertIs(bc.get_block_by_position(blk.position_hash), blk)
+        self.assertTrue(bc.has_position_hash(blk.position_hash))
+
+        # Replacing the chain rebuilds the indexes
+        bc.chain = bc.chain[:1]
+        self.assertIsNone(bc.get_block_by_hash(blk.hash))
+        self.assertIsNone(bc.get_block_by_height(1))
+        self.assertFalse(bc.has_position_hash(blk.position_hash))
+
+    def test_duplicate_position_rejected(self):
+        bc = Blockchain(difficulty=1)
+        position = {"book": 1, "chapter": 1, "verse": 1}
+        bc.add_block({"content": "first", "position": position})
+        with self.assertRaises(ValueError):
+            bc.add_block({"content": "second", "position": position})
+
+    def test_parallel_mining(self):
+        bc = Blockchain(difficulty=2, mining_workers=2)
+        try:
+            blk = bc.add_block("block A")
+        finally:
+            bc.close()
+        self.assertTrue(blk.hash.startswith("00"))
+        self.assertEqual(blk.hash, blk.calculate_hash())
+        self.assertEqual(blk.previous_hash, bc.chain[0].hash)
+        self.assertGreater(bc.last_hash_rate, 0)
+
+    def test_block_versions(self):
+        # New blocks use the nonce-last format with the difficulty committed
+        # before it; the fast path must agree with a plain hash of the whole payload
+        bc = Blockchain(difficulty=1)
+        blk = bc.add_block({"content": "verse", "author": "a"})
+        self.assertEqual(blk.version, 3)
+        self.assertEqual(blk.difficulty, 1)
+        payload = (f"{blk.index}{blk.timestamp}{blk.data}{blk.author}{blk.previous_hash}"
+                   f"{blk.position_hash}{blk.previous_position_hash}{blk.difficulty}{blk.nonce}")
+        self.assertEqual(blk.hash, hashlib.sha256(payload.encode()).hexdigest())
+
+        # Old-format dicts (no version key) still validate next to new blocks.
+        # They record no difficulty and are checked against the node's current
+        # one, which mining blk raised; lower it so the old block mines quickly
+        bc.difficulty = 1
+        old = Block(index=2, previous_hash=blk.hash, data="old", author="b", timestamp=1.0)
+        while not old.hash.startswith("0" * bc.difficulty):
+            old.nonce += 1
+            old.hash = old.calculate_hash()
+        self.assertNotIn("version", old.to_dict())
+        self.assertTrue(bc.add_block_from_dict(old.to_dict()))
+        self.assertTrue(bc.is_valid_chain(bc.chain))
+
+        # Unknown versions are rejected
+        bc.chain[-1].version = 99
+        self.assertFalse(bc.is_valid_chain(bc.chain))
+
+    def test_blocks_checked_against_own_difficulty(self):
+        # Fast mining raises the difficulty after every block
+        bc = Blockchain(difficulty=1)
+        for i in range(3):
+            bc.add_block(f"block {i}")
+        self.assertEqual([b.difficulty for b in bc.chain[1:]], [1, 2, 3])
+        self.assertEqual(bc.difficulty, 4)
+        self.assertTrue(bc.is_valid())
+
+        # The recorded difficulty is part of the hash, so it can't be lowered
+        bc.chain[3].difficulty = 1
+        self.assertFalse(bc.is_valid())
+        bc.chain[3].difficulty = 0
+        bc.chain[3].hash = bc.chain[3].calculate_hash()
+        self.assertFalse(bc.is_valid())
+
+    def test_cancel_mining(self):
+        # Difficulty high enough that mining can't finish before the cancel
+        bc = Blockchain(difficulty=12)
+        threading.Timer(0.2, bc.cancel_mining).start()
+        with self.assertRaises(MiningAborted):
+            bc.add_block("stale block")
+        self.assertEqual(len(bc.chain), 1)
+
+    def test_stale_tip_aborts(self):
+        bc = Blockchain(difficulty=1)
+        other = Blockchain(difficulty=1)
+        competing = other.add_block("peer block")
+
+        # A peer's block lands on our tip while we are mining
+        mine = bc._mine_block
+        def mine_while_peer_appends(block):
+            bc.add_block_from_dict(competing.to_dict())
+            return mine(block)
+        bc._mine_block = mine_while_peer_appends
+
+        with self.assertRaises(MiningAborted):
+            bc.add_block("our block")
+        self.assertEqual(len(bc.chain), 2)
+        self.assertEqual(bc.get_latest_block().hash, competing.hash)
+        # The fast but discarded round doesn't retune the difficulty
+        self.assertEqual(bc.difficulty, 1)
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
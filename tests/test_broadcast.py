@@ -0,0 +1,117 @@
+# tests/test_broadcast.py
+
+import unittest
+import threading
+import socket
+import time
+
+from network.protocol import ConnectionPool, serve_connection, MSG_BLOCK, MSG_BLOCKS
+from network.broadcast import Broadcaster, percentile
+
+def start_server(serve, port=0):
+    """
+    Accept connections on a localhost port (an ephemeral one by default),
+    serving each with serve(conn) on its own thread.
+    Returns the "host:port" peer identifier.
+    """
+    srv = socket.socket()
+    srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    srv.bind(('127.0.0.1', port))
+    srv.listen()
+
+    def accept_loop():
+        while True:
+            conn, _ = srv.accept()
+            threading.Thread(target=serve, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return f"127.0.0.1:{srv.getsockname()[1]}"
+
+class TestBroadcaster(unittest.TestCase):
+    def setUp(self):
+        self.received = []
+        self.stalled = []
+        self.pool = ConnectionPool()
+
+    def tearDown(self):
+        self.pool.close_all()
+        for conn in self.stalled:
+            conn.close()
+
+    def handle(self, msg_type, payload):
+        if msg_type == MSG_BLOCKS:
+            self.received.append((msg_type, [blk["index"] for blk in payload]))
+        else:
+            self.received.append((msg_type, payload["index"]))
+
+    def stall(self, conn):
+        # Accepts the connection but never answers or reads
+        self.stalled.append(conn)
+
+    def test_parallel_fan_out_with_a_stalled_peer(self):
+        fast = [start_server(lambda conn: serve_connection(conn, self.handle)) for _ in range(3)]
+        peers = fast + [start_server(self.stall)]
+        lookups = []
+
+        def get_peers():
+            lookups.append(time.monotonic())
+            return peers
+
+        broadcaster = Broadcaster(get_peers, pool=self.pool, send_timeout=0.5)
+        start = time.perf_counter()
+        futures = [broadcaster.broadcast({"index": i, "hash": f"h{i}"}) for i in (1, 2)]
+        # The caller never waits on the peers
+        self.assertLess(time.perf_counter() - start, 0.1)
+
+        # The stalled peer times out without holding up the others, and is
+        # skipped while its first send is still stuck
+        self.assertEqual(futures[0].result(timeout=5), (3, 1, 0))
+        self.assertEqual(futures[1].result(timeout=5), (3, 0, 0))
+        for _ in range(100):
+            if len(self.received) == 6:
+                break
+            time.sleep(0.02)
+        self.assertEqual(sorted(self.received), [(MSG_BLOCK, 1)] * 3 + [(MSG_BLOCK, 2)] * 3)
+        # One tracker lookup served both blocks
+        self.assertEqual(len(lookups), 1)
+
+        p50, p99 = broadcaster.latency_percentiles()
+        self.assertGreaterEqual(p99, 0.5)
+        self.assertLessEqual(p50, p99)
+        broadcaster.close()
+
+    def test_blocks_queued_for_a_down_peer_are_sent_in_one_batch(self):
+        up = start_server(lambda conn: serve_connection(conn, self.handle))
+        # A free port with nothing listening on it yet
+        probe = socket.socket()
+        probe.bind(('127.0.0.1', 0))
+        down_port = probe.getsockname()[1]
+        probe.close()
+        down = f"127.0.0.1:{down_port}"
+
+        broadcaster = Broadcaster(lambda: [up, down], pool=self.pool, retry_base=0.2, retry_max=0.4)
+        for i in (1, 2, 3):
+            self.assertEqual(broadcaster.broadcast({"index": i, "hash": f"h{i}"}).result(timeout=5)[0], 1)
+        self.assertEqual([blk["index"] for blk in broadcaster.queued(down)], [1, 2, 3])
+
+        # Let at least one retry fail and back off, then bring the peer up
+        time.sleep(0.3)
+        start_server(lambda conn: serve_connection(conn, self.handle), port=down_port)
+        for _ in range(100):
+            if len(self.received) == 4:
+                break
+            time.sleep(0.02)
+        # The up peer got each block as it was broadcast; the down one got
+        # everything it missed, in order, in one message
+        self.assertEqual(self.received, [(MSG_BLOCK, 1), (MSG_BLOCK, 2), (MSG_BLOCK, 3), (MSG_BLOCKS, [1, 2, 3])])
+        self.assertEqual(broadcaster.queued(down), [])
+        broadcaster.close()
+
+    def test_percentile(self):
+        samples = list(range(1, 101))
+        self.assertEqual(percentile(samples, 50), 50)
+        self.assertEqual(percentile(samples, 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,10 @@
 import unittest
-from blockchain.blockchain import Blockchain
+from blockchain.blockchain import (
+    Blockchain, BLOCK_EXTENDED, BLOCK_REORG, BLOCK_SIDE, BLOCK_ORPHAN, BLOCK_DUPLICATE, BLOCK_INVALID
+)
 from blockchain.block import Block
+from blockchain.orphans import OrphanPool
+from unittest.mock import patch
 
 class TestForkResolution(unittest.TestCase):
     def test_competing_miners(self):
@@ -34,5 +38,271 @@ class TestForkResolution(unittest.TestCase):
         for blk_b, blk_a in zip(b.chain, a.chain):
             self.assertEqual(blk_b.hash, blk_a.hash)
 
+    def test_reorg_validates_only_suffix(self):
+        a = Blockchain(difficulty=1)
+        b = Blockchain(difficulty=1)
+        for bc in (a, b):
+            mine_at_fixed_difficulty(bc)
+
+        # B starts from a copy of A's first two blocks, then the two diverge
+        a.add_block("shared 1")
+        b.chain = [Block(**blk.to_dict()) for blk in a.chain]
+        b.add_block("B's block 2")
+        a.add_block("A's block 2")
+        a.add_block("A's block 3")
+        a_dicts = [blk.to_dict() for blk in a.chain]
+        self.assertEqual(b.common_ancestor_height(a_dicts), 1)
+
+        # Blocks at or below the fork are not re-hashed
+        with patch.object(Block, "calculate_hash", autospec=True,
+                          side_effect=Block.calculate_hash) as spy:
+            result = b.reorg(a_dicts)
+        self.assertEqual(spy.call_count, 2)
+
+        self.assertEqual(result.fork_height, 1)
+        self.assertEqual([blk.data for blk in result.added], ["A's block 2", "A's block 3"])
+        self.assertEqual([blk.data for blk in result.removed], ["B's block 2"])
+        self.assertEqual([blk.hash for blk in b.chain], [blk.hash for blk in a.chain])
+        self.assertIsNone(b.get_block_by_hash(result.removed[0].hash))
+
+    def test_reorg_rejects_invalid_suffix(self):
+        a = Blockchain(difficulty=1)
+        b = Blockchain(difficulty=1)
+        for bc in (a, b):
+            mine_at_fixed_difficulty(bc)
+        a.add_block("shared 1")
+        b.chain = [Block(**blk.to_dict()) for blk in a.chain]
+        a.add_block("A's block 2")
+        a.add_block("A's block 3")
+
+        a_dicts = [blk.to_dict() for blk in a.chain]
+        a_dicts[3]["data"] = "tampered"
+        before = [blk.hash for blk in b.chain]
+        self.assertIsNone(b.reorg(a_dicts))
+        self.assertEqual([blk.hash for blk in b.chain], before)
+
+        # The untampered part past our tip can still be appended
+        result = b.extend(a_dicts[2:3])
+        self.assertEqual(result.fork_height, 1)
+        self.assertEqual(len(b.chain), 3)
+
+    def test_reorg_from_fork_height(self):
+        a = Blockchain(difficulty=1)
+        b = Blockchain(difficulty=1)
+        for bc in (a, b):
+            mine_at_fixed_difficulty(bc)
+        a.add_block("shared 1")
+        b.chain = [Block(**blk.to_dict()) for blk in a.chain]
+        b.add_block("B's block 2")
+        a.add_block("A's block 2")
+        a.add_block("A's block 3")
+        suffix = [blk.to_dict() for blk in a.chain[2:]]
+
+        # The branch must link to our block at the fork and have more work
+        self.assertIsNone(b.reorg_from(2, suffix))
+        self.assertIsNone(b.reorg_from(5, suffix))
+        self.assertIsNone(b.reorg_from(1, suffix[:1]))
+        self.assertEqual(b.get_latest_block().data, "B's block 2")
+
+        # Only the blocks past the fork are needed, not ours up to it
+        with patch.object(Block, "to_dict", autospec=True, side_effect=Block.to_dict) as spy:
+            result = b.reorg_from(1, suffix)
+        self.assertEqual(spy.call_count, 0)
+        self.assertEqual(result.fork_height, 1)
+        self.assertEqual([blk.data for blk in result.removed], ["B's block 2"])
+        self.assertEqual([blk.hash for blk in b.chain], [blk.hash for blk in a.chain])
+
+    def test_parallel_validation_matches_serial(self):
+        a = Blockchain(difficulty=1)
+        mine_at_fixed_difficulty(a)
+        for i in range(6):
+            a.add_block(f"block {i}")
+
+        # Chunks of two so the run is split across several worker tasks
+        b = Blockchain(difficulty=1, validation_workers=2)
+        validator = b._validator
+        validator.chunk_size = 2
+        try:
+            # The first run is timed in-process, the second in the pool
+            self.assertFalse(validator.use_pool())
+            self.assertTrue(b.is_valid_chain(a.chain))
+            self.assertTrue(validator.use_pool())
+            self.assertTrue(b.is_valid_chain(a.chain))
+            self.assertIsNotNone(validator.pool_rate)
+            # From then on the faster path is kept
+            self.assertEqual(validator.use_pool(), validator.pool_rate > validator.serial_rate)
+
+            tampered = [Block(**blk.to_dict()) for blk in a.chain]
+            tampered[5].data = "tampered"
+            self.assertFalse(b.is_valid_chain(tampered))
+            self.assertTrue(validator.check_in_pool(a.chain[1:], 1))
+            self.assertFalse(validator.check_in_pool(tampered[1:], 1))
+        finally:
+            b.close()
+
+    def test_side_branch_becomes_best_chain(self):
+        a = Blockchain(difficulty=1)
+        b = Blockchain(difficulty=1)
+        for bc in (a, b):
+            mine_at_fixed_difficulty(bc)
+        a.add_block("shared 1")
+        b.chain = [Block(**blk.to_dict()) for blk in a.chain]
+        b.add_block("B's block 2")
+        a2 = a.add_block("A's block 2")
+        a3 = a.add_block("A's block 3")
+
+        # A competing block at our height is kept, not dropped
+        self.assertEqual(b.receive_block(a2.to_dict()), BLOCK_SIDE)
+        self.assertEqual(b.get_known_block(a2.hash).data, "A's block 2")
+        self.assertEqual(b.get_latest_block().data, "B's block 2")
+        self.assertEqual(b.receive_block(a2.to_dict()), BLOCK_DUPLICATE)
+
+        # Its child makes that branch the longer one
+        self.assertEqual(b.receive_block(a3.to_dict()), BLOCK_REORG)
+        self.assertEqual([blk.hash for blk in b.chain], [blk.hash for blk in a.chain])
+        # The old tip is still known, as a side block
+        old_tip = [blk for blk in b._side_blocks.values() if blk.data == "B's block 2"][0]
+        self.assertIsNone(b.get_block_by_hash(old_tip.hash))
+        self.assertIs(b.get_known_block(old_tip.hash), old_tip)
+
+    def test_orphans_connect_when_parent_arrives(self):
+        a = Blockchain(difficulty=1)
+        b = Blockchain(difficulty=1)
+        for bc in (a, b):
+            mine_at_fixed_difficulty(bc)
+        a.add_block("shared 1")
+        b.chain = [Block(**blk.to_dict()) for blk in a.chain]
+        blocks = [a.add_block(f"A's block {i}") for i in range(2, 5)]
+
+        # Blocks 3 and 4 arrive first and wait for block 2
+        self.assertEqual(b.receive_block(blocks[2].to_dict()), BLOCK_ORPHAN)
+        self.assertEqual(b.receive_block(blocks[1].to_dict()), BLOCK_ORPHAN)
+        self.assertEqual(b.missing_ancestor(blocks[2].hash), blocks[0].hash)
+        self.assertEqual(len(b.chain), 2)
+
+        self.assertEqual(b.receive_block(blocks[0].to_dict()), BLOCK_EXTENDED)
+        self.assertEqual([blk.hash for blk in b.chain], [blk.hash for blk in a.chain])
+        self.assertEqual(len(b._orphans), 0)
+
+    def test_orphans_need_proof_of_work(self):
+        a = Blockchain(difficulty=2)
+        b = Blockchain(difficulty=2)
+        for bc in (a, b):
+            mine_at_fixed_difficulty(bc)
+        b.chain = [Block(**blk.to_dict()) for blk in a.chain]
+        blocks = [a.add_block(f"A's block {i}") for i in range(1, 3)]
+
+        # An unconnected block without valid proof-of-work isn't held
+        junk = dict(blocks[1].to_dict(), data="junk")
+        self.assertEqual(b.receive_block(junk), BLOCK_INVALID)
+        self.assertEqual(len(b._orphans), 0)
+        self.assertEqual(b.receive_block(blocks[1].to_dict()), BLOCK_ORPHAN)
+        self.assertEqual(b.receive_block(blocks[0].to_dict()), BLOCK_EXTENDED)
+        self.assertEqual(b.get_latest_block().hash, blocks[1].hash)
+
+    def test_orphan_pool_is_bounded(self):
+        pool = OrphanPool(max_orphans=3)
+        for i in range(5):
+            pool.add({"hash": f"h{i}", "previous_hash": f"p{i}"})
+        self.assertEqual(len(pool), 3)
+        self.assertNotIn("h0", pool)
+        self.assertNotIn("h1", pool)
+        self.assertEqual([d["hash"] for d in pool.pop_children("p4")], ["h4"])
+        self.assertEqual(len(pool), 2)
+
+    def test_fork_choice_by_work(self):
+        a = Blockchain(difficulty=1)
+        b = Blockchain(difficulty=1)
+        for bc in (a, b):
+            mine_at_fixed_difficulty(bc)
+        a.add_block("shared 1")
+        b.chain = [Block(**blk.to_dict()) for blk in a.chain]
+        self.assertEqual(b.chain_work(), a.chain_work())
+
+        # B's branch is longer, A's single block is harder
+        b.add_block("B's block 2")
+        b.add_block("B's block 3")
+        a.difficulty = 3
+        heavy = a.add_block("A's block 2")
+        self.assertGreater(a.chain_work(), b.chain_work())
+        self.assertEqual(a.chain_work(), a.chain_work(a.chain[1]) + 16 ** 3)
+
+        # The shorter, heavier chain wins, whether synced or received as a block
+        c = Blockchain(difficulty=1)
+        c.chain = [Block(**blk.to_dict()) for blk in b.chain]
+        self.assertIsNone(a.reorg([blk.to_dict() for blk in b.chain]))
+        result = b.reorg([blk.to_dict() for blk in a.chain])
+        self.assertEqual(len(result.removed), 2)
+        self.assertEqual(b.get_latest_block().hash, heavy.hash)
+        self.assertEqual(c.receive_block(heavy.to_dict()), BLOCK_REORG)
+        self.assertEqual(c.get_latest_block().hash, heavy.hash)
+
+    def test_side_branch_deeper_than_pruning(self):
+        a = Blockchain(difficulty=1)
+        b = Blockchain(difficulty=1)
+        for bc in (a, b):
+            mine_at_fixed_difficulty(bc)
+        a.add_block("shared 1")
+        b.chain = [Block(**blk.to_dict()) for blk in a.chain]
+        ours = [b.add_block(f"B's block {i}") for i in range(2, 5)]
+        theirs = [a.add_block(f"A's block {i}") for i in range(2, 6)]
+
+        with patch("blockchain.blockchain.SIDE_BRANCH_DEPTH", 2):
+            # A's branch overtakes ours; B's old blocks become side blocks and
+            # the oldest, more than 2 below the new tip, is pruned
+            statuses = [b.receive_block(blk.to_dict()) for blk in theirs]
+            self.assertEqual(statuses, [BLOCK_SIDE] * 3 + [BLOCK_REORG])
+            self.assertIsNone(b.get_known_block(ours[0].hash))
+            self.assertIsNotNone(b.get_known_block(ours[1].hash))
+
+            # B's branch now grows past A's, but can't be walked back to the
+            # fork any more: the block is rejected without raising
+            b2 = Blockchain(difficulty=1)
+            mine_at_fixed_difficulty(b2)
+            b2.chain = [Block(**blk.to_dict()) for blk in b.chain[:2]] + [Block(**blk.to_dict()) for blk in ours]
+            more = [b2.add_block(f"B's block {i}") for i in range(5, 7)]
+            self.assertEqual(b.receive_block(more[0].to_dict()), BLOCK_SIDE)
+            self.assertEqual(b.receive_block(more[1].to_dict()), BLOCK_INVALID)
+            self.assertIsNone(b.get_known_block(more[1].hash))
+            self.assertEqual(b.get_latest_block().hash, theirs[-1].hash)
+
+            # A sync of the whole branch still switches to it
+            self.assertIsNotNone(b.reorg([blk.to_dict() for blk in b2.chain]))
+            self.assertEqual(b.get_latest_block().hash, more[1].hash)
+
+    def test_side_blocks_pruned_as_chain_extends(self):
+        a = Blockchain(difficulty=1)
+        b = Blockchain(difficulty=1)
+        for bc in (a, b):
+            mine_at_fixed_difficulty(bc)
+        b.chain = [Block(**blk.to_dict()) for blk in a.chain]
+
+        with patch("blockchain.blockchain.SIDE_BRANCH_DEPTH", 3):
+            # Each round B loses a competing block at its tip, then extends
+            # its own chain without ever reorganising
+            losers = []
+            for i in range(1, 9):
+                ours = b.add_block(f"B's block {i}")
+                a.chain = [Block(**blk.to_dict()) for blk in b.chain[:-1]]
+                losers.append(a.add_block(f"A's block {i}"))
+                self.assertEqual(b.receive_block(losers[-1].to_dict()), BLOCK_SIDE)
+                self.assertEqual(b.get_latest_block().hash, ours.hash)
+
+        # Only side blocks within 3 of the tip (height 8) are kept
+        self.assertEqual(sorted(blk.index for blk in b._side_blocks.values()), [5, 6, 7, 8])
+        self.assertIsNone(b.get_known_block(losers[0].hash))
+        self.assertNotIn(losers[0].hash, b._chain_work)
+
+def mine_at_fixed_difficulty(bc):
+    """
+    Replace bc's miner with one that keeps the difficulty constant, so the
+    blocks stay valid at the difficulty the chain is checked against.
+    """
+    def mine(block):
+        while not block.hash.startswith("0" * bc.difficulty):
+            block.nonce += 1
+            block.hash = block.calculate_hash()
+    bc._mine_block = mine
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
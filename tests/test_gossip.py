@@ -0,0 +1,118 @@
+# tests/test_gossip.py
+
+import unittest
+import contextlib
+import io
+import threading
+import socket
+import time
+
+from blockchain.blockchain import Blockchain
+from blockchain.block import Block
+from network.protocol import ConnectionPool, serve_connection, MSG_BLOCK, MSG_GETBLOCK, MSG_INV
+from network.broadcast import Broadcaster
+from network.gossip import Gossip, SeenCache
+from network.handler import MessageHandler
+
+def mine(block):
+    while not block.hash.startswith("0"):
+        block.nonce += 1
+        block.hash = block.calculate_hash()
+
+class Node:
+    def __init__(self, genesis, peers, fanout, counts):
+        """
+        An in-process node on an ephemeral port, relaying blocks by gossip to
+        the "host:port" entries of peers (a list shared by all nodes).
+        """
+        self.bc = Blockchain(difficulty=1)
+        self.bc.chain = [Block(**genesis.to_dict())]
+        self.bc._mine_block = mine
+        self.pool = ConnectionPool()
+
+        srv = socket.socket()
+        srv.bind(('127.0.0.1', 0))
+        srv.listen()
+        self.id = f"127.0.0.1:{srv.getsockname()[1]}"
+        self.broadcaster = Broadcaster(lambda: peers, pool=self.pool)
+        self.gossip = Gossip(self.bc, self.id, self.broadcaster, self.deliver, pool=self.pool, fanout=fanout)
+        self.handler = MessageHandler(self.bc, self.gossip)
+
+        def handle(msg_type, payload):
+            counts[msg_type] = counts.get(msg_type, 0) + 1
+            return self.handler(msg_type, payload)
+
+        def accept_loop():
+            while True:
+                conn, _ = srv.accept()
+                threading.Thread(target=serve_connection, args=(conn, handle), daemon=True).start()
+
+        threading.Thread(target=accept_loop, daemon=True).start()
+
+    def deliver(self, blk):
+        self.handler(MSG_BLOCK, blk)
+
+class TestGossip(unittest.TestCase):
+    def test_network_converges_by_gossip(self):
+        genesis = Blockchain(difficulty=1).chain[0]
+        peers, counts = [], {}
+        nodes = [Node(genesis, peers, fanout=3, counts=counts) for _ in range(30)]
+        peers.extend(node.id for node in nodes)
+
+        for height in (1, 2):
+            blk = nodes[0].bc.add_block(f"block {height}")
+            nodes[0].gossip.announce(blk.to_dict())
+            deadline = time.time() + 20
+            while time.time() < deadline and any(len(n.bc.chain) <= height for n in nodes):
+                time.sleep(0.05)
+            self.assertTrue(all(n.bc.get_latest_block().hash == blk.hash for n in nodes))
+
+        # Every node fetched each block once; everything else was announcements
+        self.assertEqual(counts.get(MSG_GETBLOCK), 2 * 29)
+        self.assertNotIn(MSG_BLOCK, counts)
+        # Each node announced each block to at most 3 peers
+        self.assertLessEqual(counts[MSG_INV], 2 * 30 * 3)
+        for node in nodes:
+            node.pool.close_all()
+
+    def test_inv_from_unknown_peer_ignored(self):
+        genesis = Blockchain(difficulty=1).chain[0]
+        peers, counts = [], {}
+        node, source = Node(genesis, peers, fanout=1, counts=counts), Node(genesis, [], fanout=1, counts=counts)
+        peers.append(node.id)
+        node.broadcaster.refresh_interval = 0
+        blk = source.bc.add_block("block 1").to_dict()
+
+        # An INV naming an address that isn't one of our peers is not fetched
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            node.gossip.on_inv({"hashes": [blk["hash"]], "from": source.id})
+        self.assertIn(f"Ignoring INV from unknown peer {source.id}", out.getvalue())
+        self.assertNotIn(blk["hash"], node.gossip.seen)
+
+        # Once the tracker lists it, the same announcement is fetched
+        peers.append(source.id)
+        node.gossip.on_inv({"hashes": [blk["hash"]], "from": source.id})
+        deadline = time.time() + 10
+        while time.time() < deadline and len(node.bc.chain) < 2:
+            time.sleep(0.05)
+        self.assertEqual(node.bc.get_latest_block().hash, blk["hash"])
+        self.assertEqual(counts.get(MSG_GETBLOCK), 1)
+        for n in (node, source):
+            n.pool.close_all()
+
+    def test_seen_cache_is_bounded(self):
+        seen = SeenCache(max_size=3)
+        self.assertTrue(seen.add("a"))
+        self.assertFalse(seen.add("a"))
+        for h in "bcd":
+            seen.add(h)
+        self.assertEqual(len(seen), 3)
+        # The least recently seen hash is dropped first
+        self.assertNotIn("a", seen)
+        seen.add("b")
+        seen.add("e")
+        self.assertIn("b", seen)
+        self.assertNotIn("c", seen)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,17 +5,22 @@ import threading
 import time
 import socket
 
-from network.tracker import Tracker
+from network.tracker import Tracker, PeerRegistry
+from network.tracker_client import fetch_peers, tracker_command
 
 class TestP2PNetwork(unittest.TestCase):
     def setUp(self):
         # start tracker on localhost:10000
         self.tracker_port = 10000
-        self.tracker = Tracker(host='127.0.0.1', port=self.tracker_port)
+        self.tracker = Tracker(host='127.0.0.1', port=self.tracker_port, ttl=0.5)
         self.thread = threading.Thread(target=self.tracker.start, daemon=True)
         self.thread.start()
         time.sleep(0.1)  # let it bind
 
+    def tearDown(self):
+        self.tracker.stop()
+        self.thread.join()
+
     def test_peer_registration_and_discovery(self):
         # 1) JOIN three peers
         peers = [f'peer{i}.local:5000{i}' for i in range(3)]
@@ -45,5 +50,58 @@ class TestP2PNetwork(unittest.TestCase):
         expected = [peers[0], peers[2]]
         self.assertCountEqual(data2, expected)
 
+    def test_heartbeats_keep_peers_and_silent_ones_expire(self):
+        tracker_command('127.0.0.1', self.tracker_port, 'JOIN crashed.local:5000')
+        tracker_command('127.0.0.1', self.tracker_port, 'JOIN alive.local:5001')
+        # Heartbeat one peer past the 0.5 s TTL; the other goes quiet
+        for _ in range(4):
+            time.sleep(0.25)
+            tracker_command('127.0.0.1', self.tracker_port, 'HEARTBEAT alive.local:5001')
+        time.sleep(0.1)
+        self.assertEqual(fetch_peers('127.0.0.1', self.tracker_port), ['alive.local:5001'])
+
+    def test_large_peer_list_is_framed_and_sampled(self):
+        # One connection carrying many commands; the list is far above 4 KB
+        peers = [f'node{i}.example.local:{20000 + i}' for i in range(800)]
+        with socket.socket() as s:
+            s.connect(('127.0.0.1', self.tracker_port))
+            s.sendall(''.join(f'JOIN {p}\n' for p in peers).encode())
+        time.sleep(0.1)
+
+        everything = fetch_peers('127.0.0.1', self.tracker_port)
+        self.assertCountEqual(everything, peers)
+        # With our own id excluded, the limit still holds
+        sample = fetch_peers('127.0.0.1', self.tracker_port, self_id=peers[0], limit=50)
+        self.assertEqual(len(sample), 50)
+        self.assertEqual(len(set(sample)), 50)
+        self.assertNotIn(peers[0], sample)
+        self.assertTrue(set(sample) <= set(peers))
+
+    def test_idle_connections_closed(self):
+        self.tracker.idle_timeout = 0.3
+        idle, busy = socket.socket(), socket.socket()
+        for s in (idle, busy):
+            s.connect(('127.0.0.1', self.tracker_port))
+            s.settimeout(2)
+        # One connection keeps talking past the timeout, the other says nothing
+        for _ in range(4):
+            time.sleep(0.15)
+            busy.sendall(b'HEARTBEAT busy.local:5000\n')
+        busy.sendall(b'GETPEERS\n')
+        self.assertEqual(busy.recv(1024), b'busy.local:5000\n')
+        self.assertEqual(idle.recv(1024), b'')
+        for s in (idle, busy):
+            s.close()
+
+    def test_registry_expires_in_order(self):
+        registry = PeerRegistry(ttl=10)
+        for i, p in enumerate("abcd"):
+            registry.refresh(p, now=i)
+        registry.refresh("a", now=5)
+        registry.remove("c")
+        self.assertEqual(registry.expire(now=13.5), ["b", "d"])
+        self.assertEqual(registry.sample(10), ["a"])
+        self.assertEqual(len(registry), 1)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,90 @@
+# tests/test_peer_stats.py
+
+import unittest
+import threading
+import socket
+
+from network.peer_stats import PeerStats
+from network.protocol import ConnectionPool, serve_connection, MSG_BLOCK
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestPeerStats(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.stats = PeerStats(half_life=60, backoff_base=10, backoff_max=25, clock=self.clock)
+
+    def test_rank_prefers_fast_healthy_peers(self):
+        self.stats.record_connect("fast:1", 0.01)
+        self.stats.record_transfer("fast:1", 1_000_000, 0.1)
+        self.stats.record_connect("slow:1", 0.5)
+        self.stats.record_transfer("slow:1", 1_000_000, 2.0)
+        # As quick as the fast peer, but half its requests fail
+        self.stats.record_connect("flaky:1", 0.01)
+        self.stats.record_transfer("flaky:1", 1_000_000, 0.1)
+        self.stats.record_failure("flaky:1")
+        self.stats.record_connect("flaky:1", 0.01)
+        self.stats.record_failure("flaky:1")
+
+        self.assertEqual(self.stats.rank(["slow:1", "new:1", "flaky:1", "fast:1"]),
+                         ["fast:1", "flaky:1", "new:1", "slow:1"])
+
+    def test_repeat_offenders_are_backed_off(self):
+        self.stats.record_bad_block("bad:1")
+        self.assertTrue(self.stats.backed_off("bad:1"))
+        self.assertEqual(self.stats.rank(["bad:1", "ok:1"]), ["ok:1"])
+        # Nobody else to ask
+        self.assertEqual(self.stats.rank(["bad:1"]), ["bad:1"])
+
+        self.clock.now += 10
+        self.assertFalse(self.stats.backed_off("bad:1"))
+        # Offending again straight away doubles the back-off, up to the maximum
+        self.stats.record_failure("bad:1")
+        self.clock.now += 19
+        self.assertTrue(self.stats.backed_off("bad:1"))
+        self.clock.now += 1
+        self.stats.record_failure("bad:1")
+        self.clock.now += 24
+        self.assertTrue(self.stats.backed_off("bad:1"))
+
+        # Old offences decay: after a long quiet spell one failure is forgiven
+        self.clock.now += 600
+        self.stats.record_failure("bad:1")
+        self.assertFalse(self.stats.backed_off("bad:1"))
+
+    def test_pool_records_connects_and_failures(self):
+        srv = socket.socket()
+        srv.bind(('127.0.0.1', 0))
+        srv.listen()
+        up = srv.getsockname()[1]
+
+        def accept_once():
+            conn, _ = srv.accept()
+            serve_connection(conn, lambda msg_type, payload: None)
+        threading.Thread(target=accept_once, daemon=True).start()
+        probe = socket.socket()
+        probe.bind(('127.0.0.1', 0))
+        down = probe.getsockname()[1]
+        probe.close()
+
+        stats = PeerStats()
+        pool = ConnectionPool(stats=stats)
+        try:
+            pool.get('127.0.0.1', up).send(MSG_BLOCK, {})
+            for _ in range(3):
+                with self.assertRaises(OSError):
+                    pool.get('127.0.0.1', down).send(MSG_BLOCK, {})
+        finally:
+            pool.close_all()
+            srv.close()
+        self.assertFalse(stats.backed_off(f"127.0.0.1:{up}"))
+        self.assertTrue(stats.backed_off(f"127.0.0.1:{down}"))
+        self.assertEqual(stats.rank([f"127.0.0.1:{down}", f"127.0.0.1:{up}"]), [f"127.0.0.1:{up}"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+# tests/test_protocol.py
+
+import unittest
+import threading
+import socket
+import time
+import io
+import contextlib
+
+from network.protocol import (
+    PeerConnection, serve_connection, read_line, recv_frame, send_frame, FRAME_HEADER, HELLO, PROTOCOL_VERSION,
+    MSG_BLOCK, MSG_GETCHAIN, MSG_CHAIN, MSG_NOTFOUND
+)
+from network.async_node import AsyncNode, ENCODE_SLICE
+
+def start_server(serve):
+    """
+    Accept connections on an ephemeral localhost port, serving each with
+    serve(conn) on its own thread. Returns (port, number of connections accepted).
+    """
+    srv = socket.socket()
+    srv.bind(('127.0.0.1', 0))
+    srv.listen()
+    accepted = [0]
+
+    def accept_loop():
+        while True:
+            conn, _ = srv.accept()
+            accepted[0] += 1
+            threading.Thread(target=serve, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return srv.getsockname()[1], accepted
+
+class TestProtocol(unittest.TestCase):
+    def setUp(self):
+        self.received = []
+        self.got_message = threading.Event()
+        self.chain = [{"index": i, "data": "x" * 20000} for i in range(3)]
+
+    def handle(self, msg_type, payload):
+        if msg_type == MSG_GETCHAIN:
+            return MSG_CHAIN, self.chain[payload["from"]:]
+        self.received.append((msg_type, payload))
+        self.got_message.set()
+        return None
+
+    def test_framed_messages_share_one_connection(self):
+        port, accepted = start_server(lambda conn: serve_connection(conn, self.handle))
+        peer = PeerConnection('127.0.0.1', port)
+
+        # Blocks far larger than the old 8 KB read arrive intact
+        big = {"index": 1, "data": "y" * 100000}
+        for _ in range(3):
+            peer.send(MSG_BLOCK, big)
+        reply = peer.request(MSG_GETCHAIN, {"from": 1})
+        peer.close()
+
+        self.assertEqual(peer.version, PROTOCOL_VERSION)
+        self.assertEqual(reply, (MSG_CHAIN, self.chain[1:]))
+        self.assertEqual(self.received, [(MSG_BLOCK, big)] * 3)
+        self.assertEqual(accepted[0], 1)
+
+    def test_text_only_peer(self):
+        # An older node: one text command per connection, unknown ones ignored
+        def old_node(conn):
+            raw = conn.recv(8192).decode().strip()
+            if raw == "GETCHAIN":
+                conn.sendall(b'CHAIN [{"index": 0}]\n')
+            conn.close()
+
+        port, _ = start_server(old_node)
+        peer = PeerConnection('127.0.0.1', port)
+        self.assertEqual(peer.request(MSG_GETCHAIN, {"from": 0}), (MSG_CHAIN, [{"index": 0}]))
+        self.assertEqual(peer.version, 0)
+
+    def test_serves_text_commands(self):
+        port, _ = start_server(lambda conn: serve_connection(conn, self.handle))
+
+        with socket.socket() as s:
+            s.connect(('127.0.0.1', port))
+            s.sendall(b'BLOCK {"index": 5}\n')
+        with socket.socket() as s:
+            s.connect(('127.0.0.1', port))
+            s.sendall(b'GETCHAIN 2\n')
+            data = b''
+            while True:
+                chunk = s.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+        self.assertTrue(data.startswith(b'CHAIN '))
+        self.assertIn('"index": 2', data.decode())
+        self.assertTrue(self.got_message.wait(5))
+        self.assertEqual(self.received, [(MSG_BLOCK, {"index": 5})])
+
+    def test_handler_errors_drop_the_connection(self):
+        # A GETCHAIN without "from" makes the handler raise KeyError
+        port, accepted = start_server(lambda conn: serve_connection(conn, self.handle))
+        peer = PeerConnection('127.0.0.1', port)
+        with contextlib.redirect_stdout(io.StringIO()) as log, self.assertRaises(ConnectionError):
+            peer.request(MSG_GETCHAIN, {})
+        self.assertIn("Dropping connection: error handling message type 2: KeyError", log.getvalue())
+        # The server is still up, and the next request gets a connection of its own
+        self.assertEqual(peer.request(MSG_GETCHAIN, {"from": 2}), (MSG_CHAIN, self.chain[2:]))
+        self.assertEqual(accepted[0], 3)
+        peer.close()
+
+    def test_bad_reply_closes_pooled_connection(self):
+        # The first reply is undecodable and followed by a stray frame, which
+        # would be read as the next reply if the connection were reused
+        garble = [True]
+
+        def garbled(conn):
+            with conn:
+                read_line(conn)
+                conn.sendall(f"{HELLO}{PROTOCOL_VERSION}\n".encode())
+                while recv_frame(conn) is not None:
+                    if garble[0]:
+                        garble[0] = False
+                        conn.sendall(FRAME_HEADER.pack(MSG_CHAIN, 4) + b"[1, ")
+                        send_frame(conn, MSG_NOTFOUND, None)
+                    else:
+                        send_frame(conn, MSG_CHAIN, [2])
+
+        port, accepted = start_server(garbled)
+        peer = PeerConnection('127.0.0.1', port)
+        with self.assertRaises(ValueError):
+            peer.request(MSG_GETCHAIN, {"from": 0})
+        self.assertEqual(peer.request(MSG_GETCHAIN, {"from": 0}), (MSG_CHAIN, [2]))
+        self.assertEqual(accepted[0], 2)
+        peer.close()
+
+    def test_async_node(self):
+        # Long enough that the chain reply is encoded in several slices
+        self.chain = [{"index": i, "data": "x" * 100} for i in range(ENCODE_SLICE * 2 + 5)]
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        threading.Thread(target=AsyncNode(port, self.handle, host='127.0.0.1').run, daemon=True).start()
+        for _ in range(100):
+            try:
+                socket.create_connection(('127.0.0.1', port)).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+
+        peer = PeerConnection('127.0.0.1', port)
+        peer.send(MSG_BLOCK, {"index": 7})
+        self.assertEqual(peer.request(MSG_GETCHAIN, {"from": 0}), (MSG_CHAIN, self.chain))
+        self.assertEqual(peer.version, PROTOCOL_VERSION)
+        peer.close()
+        self.assertTrue(self.got_message.wait(5))
+        self.assertEqual(self.received, [(MSG_BLOCK, {"index": 7})])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,303 @@
+# tests/test_replica.py
+
+import unittest
+import json
+import gzip
+import threading
+import time
+from unittest.mock import patch
+
+from blockchain.block import Block
+from blockchain.blockchain import Blockchain, BLOCK_EXTENDED, BLOCK_DUPLICATE, BLOCK_ORPHAN
+from blockchain.validation import block_work, MIN_DIFFICULTY
+from network.replica import ChainReplica
+from network.handler import MessageHandler
+from network.tracker import Tracker
+from network.tracker_client import PeerInfo, tracker_command
+from network.peer_stats import default_stats
+from network.protocol import MSG_BLOCK, MSG_GETBLOCK
+import scripts.run_server as run_server
+
+def make_chain(length, fork_at=None):
+    """
+    Block dicts linked by hash; from fork_at on the hashes differ, as on a
+    competing branch.
+    """
+    blocks = []
+    for i in range(length):
+        tag = "b" if fork_at is not None and i >= fork_at else "a"
+        blocks.append({"index": i, "hash": f"{tag}{i}", "previous_hash": blocks[-1]["hash"] if blocks else "0"})
+    return blocks
+
+class FakePeer:
+    def __init__(self, chain):
+        """
+        A peer serving chain, recording the heights it was asked for.
+        """
+        self.chain = chain
+        self.requests = []
+
+    def info(self):
+        work = sum(block_work(Block(data=None, **blk)) for blk in self.chain)
+        return [PeerInfo("peer:1", len(self.chain) - 1, self.chain[-1]["hash"], work)]
+
+    def fetch(self, peer, from_height):
+        self.requests.append(from_height)
+        return self.chain[from_height:]
+
+class TestChainReplica(unittest.TestCase):
+    def test_incremental_refresh(self):
+        peer = FakePeer(make_chain(10))
+        replica = ChainReplica(peer.info, peer.fetch)
+        self.assertTrue(replica.ensure_loaded())
+        self.assertEqual(peer.requests, [0])
+
+        # The peer reports our tip: nothing is fetched
+        self.assertFalse(replica.refresh())
+        self.assertEqual(peer.requests, [0])
+
+        # Only the new blocks are fetched
+        peer.chain = make_chain(14)
+        self.assertTrue(replica.refresh())
+        self.assertEqual(peer.requests, [0, 9])
+        self.assertEqual([b["hash"] for b in replica.blocks()], [b["hash"] for b in peer.chain])
+
+        # A peer that has forked from us is copied whole
+        peer.chain = make_chain(16, fork_at=12)
+        self.assertTrue(replica.refresh())
+        self.assertEqual(peer.requests, [0, 9, 13, 0])
+        self.assertEqual(replica.tip_hash(), "b15")
+        stats = replica.stats()
+        self.assertEqual((stats["blocks_fetched"], stats["full_fetches"], stats["height"]), (30, 2, 15))
+
+    def test_fork_chosen_by_work(self):
+        peer = FakePeer(make_chain(10))
+        replica = ChainReplica(peer.info, peer.fetch)
+        replica.ensure_loaded()
+
+        # A fork of the same length has no more work: we keep our chain
+        peer.chain = make_chain(10, fork_at=8)
+        self.assertFalse(replica.refresh())
+        # nor when a peer that doesn't report its work has to be asked for it
+        peer.info = lambda: [PeerInfo("peer:1", 9, "b9", None)]
+        self.assertFalse(replica.refresh())
+        self.assertEqual(replica.tip_hash(), "a9")
+        del peer.info
+
+        # A shorter fork mined at a higher difficulty has more
+        peer.chain = make_chain(9, fork_at=8)
+        peer.chain[8].update(version=3, difficulty=MIN_DIFFICULTY + 1)
+        self.assertTrue(replica.refresh())
+        self.assertEqual(replica.tip_hash(), "b8")
+        self.assertEqual(replica.stats()["full_fetches"], 2)
+
+    def test_slices_cached_per_tip(self):
+        peer = FakePeer(make_chain(10))
+        replica = ChainReplica(peer.info, peer.fetch)
+        replica.ensure_loaded()
+        body, total, tip_hash, hit = replica.slice_json(2, 5)
+        self.assertEqual((json.loads(body), total, tip_hash, hit), (peer.chain[2:5], 10, "a9", False))
+        self.assertEqual(replica.slice_json(2, 5), (body, 10, "a9", True))
+
+        # A new tip invalidates the cached slices
+        peer.chain = make_chain(12)
+        replica.refresh()
+        self.assertFalse(replica.slice_json(2, 5)[3])
+        stats = replica.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["cold_misses"]), (1, 2, 1))
+
+    def test_pushed_blocks_notify_subscribers(self):
+        peer = FakePeer(make_chain(10))
+        replica = ChainReplica(peer.info, peer.fetch)
+        replica.ensure_loaded()
+        subscriber = replica.subscribe()
+        longer = make_chain(13)
+
+        self.assertEqual(replica.receive_block(longer[10]), BLOCK_EXTENDED)
+        self.assertEqual(replica.receive_block(longer[10]), BLOCK_DUPLICATE)
+        # Its parent is missing: left for a refresh
+        self.assertEqual(replica.receive_block(longer[12]), BLOCK_ORPHAN)
+        self.assertEqual(replica.tip_hash(), "a10")
+        self.assertEqual(replica.get_known_block("a10"), longer[10])
+        self.assertEqual(peer.requests, [0])
+        event = subscriber.get_nowait().decode()
+        self.assertEqual(event.split("\n")[:2], ["id: a10", "event: block"])
+        self.assertEqual(json.loads(event.split("\n")[2][len("data: "):]), longer[10])
+        self.assertTrue(subscriber.empty())
+
+        # A browser that last saw a9 is sent what it missed
+        resumed = replica.subscribe("a9")
+        self.assertIn(b"id: a10", resumed.get_nowait())
+
+        # Switching to a fork tells subscribers to start over
+        peer.chain = make_chain(14, fork_at=8)
+        replica.refresh()
+        reset = subscriber.get_nowait().decode()
+        self.assertIn("event: reset", reset)
+        self.assertEqual(json.loads(reset.split("\n")[2][len("data: "):]), {"height": 13, "tip_hash": "b13"})
+        self.assertIsNone(replica.get_known_block("a10"))
+        replica.unsubscribe(subscriber)
+        replica.unsubscribe(resumed)
+        stats = replica.stats()
+        self.assertEqual((stats["blocks_pushed"], stats["blocks_unlinked"], stats["subscribers"]), (1, 1, 0))
+
+class TestChainEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.peer = FakePeer(make_chain(45))
+        self.saved = run_server.replica
+        run_server.replica = ChainReplica(self.peer.info, self.peer.fetch)
+        self.handle = MessageHandler(run_server.replica, tag="Observer")
+        self.client = run_server.app.test_client()
+
+    def tearDown(self):
+        run_server.replica = self.saved
+
+    def test_pages_served_from_the_replica(self):
+        first = self.client.get('/chain?page=2&per_page=20')
+        self.assertEqual(first.get_json(), self.peer.chain[20:40])
+        self.assertEqual((first.headers['X-Total-Blocks'], first.headers['X-Total-Pages']), ('45', '3'))
+        self.assertEqual(first.headers['X-Cache'], 'MISS')
+        # Every page after that comes from memory, without asking the peer again
+        for page in (1, 2, 3):
+            self.client.get(f'/chain?page={page}&per_page=20')
+        again = self.client.get('/chain?page=2&per_page=20')
+        self.assertEqual(again.headers['X-Cache'], 'HIT')
+        self.assertEqual(again.get_json(), self.peer.chain[20:40])
+        self.assertEqual(self.client.get('/chain').get_json(), self.peer.chain)
+        self.assertEqual(self.peer.requests, [0])
+
+        stats = self.client.get('/chain/stats').get_json()
+        self.assertEqual((stats["hits"], stats["misses"], stats["height"]), (2, 4, 44))
+
+    def test_delta_and_conditional_requests(self):
+        full = self.client.get('/chain')
+        self.assertEqual(full.headers['ETag'], '"a44"')
+        # Nothing new: no body
+        unchanged = self.client.get('/chain', headers={'If-None-Match': '"a44"'})
+        self.assertEqual((unchanged.status_code, unchanged.data), (304, b''))
+        # Pages past the end aren't clamped to the last one any more
+        self.assertEqual(self.client.get('/chain?page=4&per_page=20').status_code, 404)
+        self.assertEqual(self.client.get('/chain?page=0&per_page=20').status_code, 400)
+
+        longer = make_chain(48)
+        for blk in longer[45:]:
+            self.handle(MSG_BLOCK, blk)
+        delta = self.client.get('/chain?since_hash=a44', headers={'If-None-Match': '"a44"'})
+        self.assertEqual((delta.status_code, delta.get_json()), (200, longer[45:]))
+        self.assertEqual((delta.headers['ETag'], delta.headers['X-Total-Blocks']), ('"a47"', '48'))
+        self.assertEqual(self.client.get('/chain?since_hash=a47', headers={'If-None-Match': '"a47"'}).status_code, 304)
+
+        paged = self.client.get('/chain?since_height=42&per_page=2')
+        self.assertEqual(paged.get_json(), longer[43:45])
+        self.assertEqual(paged.headers['X-Total-Pages'], '3')
+        self.assertEqual(self.client.get('/chain?since_hash=a46&since_height=40').status_code, 409)
+        stale = self.client.get('/chain?since_hash=elsewhere')
+        self.assertEqual((stale.status_code, stale.get_json()["tip_hash"]), (409, "a47"))
+        self.assertEqual(self.peer.requests, [0])
+
+    def test_streamed_and_compressed_replies(self):
+        streamed = self.client.get('/chain?page=2&per_page=20&stream=1')
+        self.assertEqual((streamed.headers['X-Cache'], streamed.get_json()), ('STREAM', self.peer.chain[20:40]))
+        lines = self.client.get('/chain?format=ndjson').data.decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.peer.chain)
+
+        compressed = self.client.get('/chain?page=2&per_page=20', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(compressed.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed.headers['Vary'])
+        self.assertEqual(compressed.headers['ETag'], 'W/"a44"')
+        self.assertEqual(json.loads(gzip.decompress(compressed.data)), self.peer.chain[20:40])
+        again = self.client.get('/chain?page=2&per_page=20', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual((again.headers['X-Cache'], again.data), ('HIT', compressed.data))
+        self.assertEqual(self.client.get('/chain', headers={'If-None-Match': 'W/"a44"'}).status_code, 304)
+
+        # Long replies are always streamed, compressed as they go
+        saved = run_server.STREAM_MIN_BLOCKS
+        run_server.STREAM_MIN_BLOCKS = 10
+        try:
+            long = self.client.get('/chain', headers={'Accept-Encoding': 'gzip'})
+        finally:
+            run_server.STREAM_MIN_BLOCKS = saved
+        self.assertEqual((long.headers['X-Cache'], long.headers['Content-Encoding']), ('STREAM', 'gzip'))
+        self.assertEqual(json.loads(gzip.decompress(long.data)), self.peer.chain)
+        self.assertEqual(run_server.replica.stats()["misses"], 1)
+
+    def test_story_tree_served_in_parts(self):
+        # Positions: p<i> continues p<i // 2>, a binary tree under p1
+        for i, blk in enumerate(self.peer.chain):
+            blk["position_hash"], blk["previous_position_hash"] = f"p{i}", (f"p{i // 2}" if i > 1 else None)
+        self.assertEqual(self.client.get('/chain/tree').get_json(), {"size": 44, "roots": ["p1"], "frontier": 22})
+        structure = self.client.get('/chain/tree?children=1').get_json()
+        self.assertEqual(structure["children"]["p1"], ["p2", "p3"])
+
+        subtree = self.client.get('/chain/tree/p2?depth=1')
+        self.assertEqual([b["index"] for b in subtree.get_json()["blocks"]], [2, 4, 5])
+        self.assertEqual(subtree.get_json()["truncated"], ["p4", "p5"])
+        self.assertEqual(self.client.get('/chain/tree/p2?depth=1').headers['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get('/chain/tree/nowhere').status_code, 404)
+
+        frontier = self.client.get('/chain/tree/frontier?page=2&per_page=10')
+        self.assertEqual([b["index"] for b in frontier.get_json()], list(range(34, 24, -1)))
+        self.assertEqual((frontier.headers['X-Total-Blocks'], frontier.headers['X-Total-Pages']), ('22', '3'))
+
+        # A pushed block is added to the tree without rebuilding it
+        new = {"index": 45, "hash": "a45", "previous_hash": "a44", "position_hash": "p45", "previous_position_hash": "p22"}
+        self.handle(MSG_BLOCK, new)
+        self.assertEqual(self.client.get('/chain/tree/p22').get_json()["children"], {"p22": ["p44", "p45"]})
+
+    def test_blocks_pushed_to_event_streams(self):
+        run_server.replica.ensure_loaded()
+        longer = make_chain(47)
+        resp = self.client.get('/events', buffered=False)
+        self.assertEqual(resp.mimetype, 'text/event-stream')
+        events = iter(resp.response)
+        self.assertTrue(next(events).startswith(b"retry:"))
+
+        # A block broadcast to the observer node goes straight to the browser
+        self.handle(MSG_BLOCK, longer[45])
+        self.assertIn(b"id: a45\nevent: block\n", next(events))
+        self.assertEqual(self.handle(MSG_GETBLOCK, {"hash": "a45"}), (MSG_BLOCK, longer[45]))
+        self.assertEqual(self.client.get('/chain?page=3&per_page=20').get_json(), longer[40:46])
+        resp.close()
+        self.assertEqual(run_server.replica.stats()["subscribers"], 0)
+
+class TestObserver(unittest.TestCase):
+    def test_observer_reports_tip_and_skips_itself(self):
+        peer = FakePeer(make_chain(10))
+        replica = ChainReplica(peer.info, peer.fetch)
+        self.assertIsNone(replica.chain_status())
+        replica.ensure_loaded()
+        self.assertEqual(replica.chain_status(), (9, "a9", peer.info()[0].work))
+
+        tracker = Tracker('127.0.0.1', 0)
+        threading.Thread(target=tracker.start, daemon=True).start()
+        while tracker.port == 0:
+            time.sleep(0.01)
+        try:
+            observer, node = "127.0.0.1:60001", "127.0.0.1:5000"
+            for addr, status in ((observer, replica.chain_status()), (node, (3, "x3", 48))):
+                tracker_command('127.0.0.1', tracker.port, "HEARTBEAT {} {} {} {}".format(addr, *status))
+            with patch.object(run_server, "TRACKER_PORT", tracker.port), \
+                    patch.object(run_server, "self_id", observer):
+                self.assertEqual([p.addr for p in run_server.fetch_peers()], [node])
+        finally:
+            tracker.stop()
+
+class TestFetchChainFromPeer(unittest.TestCase):
+    def test_getchain_fallback_checked(self):
+        bc = Blockchain(difficulty=1)
+        for i in range(3):
+            bc.add_block(f"block {i}")
+        chain = [blk.to_dict() for blk in bc.chain]
+        tampered = [dict(blk) for blk in chain]
+        tampered[2]["data"] = "tampered"
+
+        # A peer that doesn't stream is sent GETCHAIN; its reply is checked
+        # block by block like a stream
+        with patch.object(run_server, "open_stream", return_value=None), \
+                patch.object(run_server, "fetch_chain", side_effect=[tampered, chain]), \
+                patch.object(default_stats, "record_bad_block") as bad:
+            self.assertEqual(run_server.fetch_chain_from_peer("peer:1"), chain)
+        bad.assert_called_once_with("peer:1")
+
+if __name__ == '__main__':
+    unittest.main()
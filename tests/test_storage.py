@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from blockchain.blockchain import Blockchain
+from blockchain.storage import ChainStore
+from blockchain.sqlite_store import SQLiteChainStore
+
+class TestChainStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_reload_chain(self):
+        bc = Blockchain(difficulty=1, store=ChainStore(self.dir))
+        bc.add_block("block A")
+        bc.add_block("block B")
+        hashes = [blk.hash for blk in bc.chain]
+        bc.close()
+
+        # A restarted node picks up exactly where it left off
+        restarted = Blockchain(difficulty=1, store=ChainStore(self.dir))
+        self.assertEqual([blk.hash for blk in restarted.chain], hashes)
+        self.assertIs(restarted.get_block_by_hash(hashes[-1]), restarted.chain[-1])
+        restarted.close()
+
+    def test_chain_replacement_persisted(self):
+        bc = Blockchain(difficulty=1, store=ChainStore(self.dir))
+        bc.add_block("ours")
+        other = Blockchain(difficulty=1)
+        other.add_block("theirs 1")
+        other.add_block("theirs 2")
+        self.assertTrue(bc.resolve_conflicts([[blk.to_dict() for blk in other.chain]]))
+        bc.close()
+
+        restarted = Blockchain(difficulty=1, store=ChainStore(self.dir))
+        self.assertEqual([blk.hash for blk in restarted.chain], [blk.hash for blk in other.chain])
+        restarted.close()
+
+    def test_torn_tail_truncated(self):
+        store = ChainStore(self.dir)
+        for i in range(3):
+            store.append({"index": i, "data": f"block {i}"})
+        store.close()
+
+        # Simulate a crash halfway through writing a fourth record
+        log_path = os.path.join(self.dir, f"{0:012d}.log")
+        size = os.path.getsize(log_path)
+        with open(log_path, "ab") as f:
+            f.write(b"\x40\x00\x00\x00\x00\x00\x00\x00{\"index\": 3")
+
+        store = ChainStore(self.dir)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(os.path.getsize(log_path), size)
+        self.assertEqual(store.read(2)["data"], "block 2")
+
+        # Appending after recovery continues cleanly
+        store.append({"index": 3, "data": "block 3"})
+        self.assertEqual([d["index"] for d in store.load()], [0, 1, 2, 3])
+        store.close()
+
+    def test_segments_and_truncate(self):
+        # Tiny segments so the blocks spread over several files
+        store = ChainStore(self.dir, segment_bytes=64)
+        for i in range(10):
+            store.append({"index": i, "data": f"block {i}"})
+        self.assertGreater(len([n for n in os.listdir(self.dir) if n.endswith(".log")]), 1)
+
+        store.truncate(4)
+        self.assertEqual(len(store), 4)
+        store.append({"index": 4, "data": "replacement"})
+        store.close()
+
+        store = ChainStore(self.dir, segment_bytes=64)
+        self.assertEqual([d["data"] for d in store.load(3)], ["block 3", "replacement"])
+        store.close()
+
+class TestSQLiteChainStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "chain.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_queries(self):
+        bc = Blockchain(difficulty=1, store=SQLiteChainStore(self.path))
+        root = {"book": 1, "chapter": 1, "verse": 1}
+        a = bc.add_block({"content": "root", "author": "alice", "position": root})
+        b = bc.add_block({"content": "branch 1", "author": "bob",
+                          "position": {"book": 1, "chapter": 1, "verse": 2}, "previous_position": root})
+        c = bc.add_block({"content": "branch 2", "author": "alice",
+                          "position": {"book": 1, "chapter": 2, "verse": 1}, "previous_position": root})
+
+        self.assertEqual(bc.blocks_by_author("alice"), [a, c])
+        self.assertEqual(bc.children_of(a.position_hash), [b, c])
+        self.assertEqual(bc.blocks_between(b.timestamp, c.timestamp), [b])
+        bc.close()
+
+        restarted = Blockchain(difficulty=1, store=SQLiteChainStore(self.path))
+        self.assertEqual([blk.hash for blk in restarted.chain], [blk.hash for blk in bc.chain])
+        self.assertEqual([blk.hash for blk in restarted.blocks_by_author("bob")], [b.hash])
+        restarted.close()
+
+if __name__ == "__main__":
+    unittest.main()
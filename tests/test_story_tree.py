@@ -0,0 +1,70 @@
+# tests/test_story_tree.py
+
+import unittest
+import json
+
+from blockchain.story_tree import StoryTree
+
+def make_story(parents):
+    """
+    A chain of block dicts whose block i + 1 is at position "p<i+1>",
+    continuing from position "p<parents[i]>" (a root where that is None).
+    """
+    blocks = [{"index": 0, "hash": "h0", "previous_hash": "0", "position_hash": "p0",
+               "previous_position_hash": None}]
+    for i, parent in enumerate(parents, start=1):
+        blocks.append({"index": i, "hash": f"h{i}", "previous_hash": f"h{i - 1}", "position_hash": f"p{i}",
+                       "previous_position_hash": None if parent is None else f"p{parent}"})
+    return blocks
+
+class TestStoryTree(unittest.TestCase):
+    def test_incremental_tree_matches_rebuild(self):
+        #   p1 -> p2 -> p4       p3 -> p5
+        #      -> p6 (continues p1 again)
+        blocks = make_story([None, 1, None, 2, 3, 1])
+        built = StoryTree()
+        built.reset(blocks)
+        grown = StoryTree()
+        for i in range(len(blocks)):
+            grown.add(blocks[i:i + 1])
+
+        structure = json.loads(grown.structure_json(with_children=True)[0])
+        self.assertEqual(structure, json.loads(built.structure_json(with_children=True)[0]))
+        self.assertEqual(structure, {"size": 6, "roots": ["p1", "p3"], "frontier": 3,
+                                     "children": {"p1": ["p2", "p6"], "p2": ["p4"], "p3": ["p5"]}})
+        # Newest first
+        frontier = json.loads(grown.frontier_json(0, 2)[0])
+        self.assertEqual([b["position_hash"] for b in frontier], ["p6", "p5"])
+        self.assertEqual(grown.frontier_json(2, 4)[1], 3)
+
+    def test_subtree_depth_and_cache(self):
+        blocks = make_story([None, 1, 2, 3, 2])
+        tree = StoryTree()
+        tree.reset(blocks)
+        body, hit = tree.subtree_json("p2", depth=1)
+        subtree = json.loads(body)
+        self.assertFalse(hit)
+        self.assertEqual([b["index"] for b in subtree["blocks"]], [2, 3, 5])
+        self.assertEqual(subtree["children"], {"p2": ["p3", "p5"]})
+        self.assertEqual(subtree["truncated"], ["p3"])
+        self.assertEqual(tree.subtree_json("p2", depth=1), (body, True))
+        self.assertEqual(tree.subtree_json("missing"), (None, False))
+
+        # A new block changes the answer
+        tree.add(make_story([None, 1, 2, 3, 2, 5])[6:])
+        body, hit = tree.subtree_json("p2", depth=1)
+        self.assertFalse(hit)
+        self.assertEqual(json.loads(body)["truncated"], ["p3", "p5"])
+
+    def test_positions_reparented_when_parent_arrives(self):
+        # p1 continues p2, which only turns up in the next block
+        blocks = make_story([2, None])
+        tree = StoryTree()
+        tree.add(blocks[:2])
+        self.assertEqual(json.loads(tree.structure_json()[0])["roots"], ["p1"])
+        tree.add(blocks[2:])
+        structure = json.loads(tree.structure_json(with_children=True)[0])
+        self.assertEqual((structure["roots"], structure["children"]), (["p2"], {"p2": ["p1"]}))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,212 @@
+# tests/test_sync.py
+
+import unittest
+import logging
+import threading
+import socket
+import time
+from unittest.mock import patch
+
+from blockchain.blockchain import Blockchain
+from blockchain.block import Block
+from network.protocol import serve_connection, MSG_GETBLOCKS, MSG_CHAIN, MSG_GETCHAIN, MSG_GETCHAINSTREAM
+from network.sync import headers_first_sync, sync_with_peers, sync_candidates
+from network.peer_stats import default_stats
+from network.tracker import Tracker
+from network.tracker_client import fetch_peer_info, tracker_command, chain_status
+from network.handler import MessageHandler
+
+def serve(handle):
+    """
+    Serve handle(msg_type, payload) on an ephemeral localhost port.
+    Returns the "host:port" peer identifier.
+    """
+    srv = socket.socket()
+    srv.bind(('127.0.0.1', 0))
+    srv.listen()
+
+    def accept_loop():
+        while True:
+            conn, _ = srv.accept()
+            threading.Thread(target=serve_connection, args=(conn, handle), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return f"127.0.0.1:{srv.getsockname()[1]}"
+
+def serve_chain(bc, requests=None):
+    """
+    Serve bc like a node would, recording GETBLOCKS requests in requests.
+    """
+    node = MessageHandler(bc)
+
+    def handle(msg_type, payload):
+        if requests is not None and msg_type == MSG_GETBLOCKS:
+            requests.append(payload["start"])
+        return node(msg_type, payload)
+    return serve(handle)
+
+def build(length, start=None):
+    """
+    A chain of length blocks at a fixed difficulty of 1, optionally
+    continuing from a copy of start's blocks.
+    """
+    bc = Blockchain(difficulty=1)
+    if start is not None:
+        bc.chain = [Block(**blk.to_dict()) for blk in start.chain]
+
+    def mine(block):
+        while not block.hash.startswith("0"):
+            block.nonce += 1
+            block.hash = block.calculate_hash()
+    bc._mine_block = mine
+    while len(bc.chain) < length:
+        bc.add_block(f"block {len(bc.chain)}")
+    return bc
+
+class TestHeadersFirstSync(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger("test")
+
+    def test_bootstrap_from_several_peers(self):
+        source = build(25)
+        requests = []
+        peers = [serve_chain(source, requests) for _ in range(3)]
+
+        fresh = Blockchain(difficulty=1)
+        applied = headers_first_sync(fresh, peers, self.logger, range_size=4)
+        self.assertEqual(applied, 25)
+        self.assertEqual([blk.hash for blk in fresh.chain], [blk.hash for blk in source.chain])
+        # Every range was fetched once, spread over the peers
+        self.assertEqual(sorted(requests), list(range(0, 25, 4)))
+
+        # Nothing left to do once we're caught up
+        self.assertEqual(headers_first_sync(fresh, peers, self.logger, range_size=4), 0)
+
+    def test_extends_and_reorgs_past_fork(self):
+        shared = build(5)
+        ours = build(8, start=shared)
+        theirs = build(12, start=shared)
+        peer = serve_chain(theirs)
+
+        behind = build(5, start=shared)
+        self.assertEqual(headers_first_sync(behind, [peer], self.logger, range_size=3), 7)
+        self.assertEqual(behind.get_latest_block().hash, theirs.get_latest_block().hash)
+
+        self.assertEqual(headers_first_sync(ours, [peer], self.logger, range_size=3), 7)
+        self.assertEqual([blk.hash for blk in ours.chain], [blk.hash for blk in theirs.chain])
+
+    def test_bad_bodies_fetched_elsewhere(self):
+        source = build(10)
+        node = MessageHandler(source)
+
+        def tampering(msg_type, payload):
+            reply = node(msg_type, payload)
+            if reply[0] == MSG_CHAIN:
+                blocks = [dict(b) for b in reply[1]]
+                blocks[-1]["data"] = "tampered"
+                return MSG_CHAIN, blocks
+            return reply
+
+        peers = [serve(tampering), serve_chain(source)]
+        fresh = Blockchain(difficulty=1)
+        self.assertEqual(headers_first_sync(fresh, peers, self.logger, range_size=3), 10)
+        self.assertTrue(fresh.is_valid())
+        self.assertNotIn("tampered", [blk.data for blk in fresh.chain])
+
+class TestSyncCandidates(unittest.TestCase):
+    def test_sync_only_from_peers_ahead(self):
+        source = build(20)
+        stale = build(5)
+        requests = {}
+
+        def recording(name, bc):
+            node = MessageHandler(bc)
+
+            def handle(msg_type, payload):
+                requests.setdefault(name, []).append(msg_type)
+                return node(msg_type, payload)
+            return serve(handle)
+        ahead, behind = recording("ahead", source), recording("behind", stale)
+
+        tracker = Tracker('127.0.0.1', 0)
+        threading.Thread(target=tracker.start, daemon=True).start()
+        while tracker.port == 0:
+            time.sleep(0.01)
+        try:
+            for peer, bc in ((ahead, source), (behind, stale)):
+                tracker_command('127.0.0.1', tracker.port, "HEARTBEAT {} {} {} {}".format(peer, *chain_status(bc)))
+            tracker_command('127.0.0.1', tracker.port, "JOIN old.local:5000")
+            time.sleep(0.1)
+            infos = fetch_peer_info('127.0.0.1', tracker.port, best=True)
+            self.assertEqual([p.addr for p in infos], [ahead, behind, "old.local:5000"])
+            self.assertEqual(infos[0].tip_hash, source.get_latest_block().hash)
+        finally:
+            tracker.stop()
+
+        local = Blockchain(difficulty=1)
+        local.chain = [Block(**blk.to_dict()) for blk in source.chain[:8]]
+        # The stale peer isn't asked; a peer that reported nothing still is
+        self.assertEqual(sync_candidates(local, infos), [ahead, "old.local:5000"])
+        # ...unless it's backed off for misbehaving, like any other peer
+        with patch.object(default_stats, "backed_off", side_effect=lambda peer: peer == "old.local:5000"):
+            self.assertEqual(sync_candidates(local, infos), [ahead])
+        self.assertEqual(headers_first_sync(local, [ahead], logging.getLogger("test")), 12)
+        self.assertNotIn("behind", requests)
+        # At the heaviest reported tip there's nothing to fetch
+        self.assertEqual(sync_candidates(local, infos[:2]), [])
+
+class TestStreamedChain(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger("test")
+
+    def test_streamed_sync(self):
+        source = build(30)
+        requests = []
+        node = MessageHandler(source)
+
+        def handle(msg_type, payload):
+            requests.append(msg_type)
+            return node(msg_type, payload)
+        peer = serve(handle)
+
+        # A fresh node takes the whole stream, a node that is behind only the delta
+        fresh = Blockchain(difficulty=1)
+        self.assertEqual(len(sync_with_peers(fresh, [peer], self.logger).added), 30)
+        behind = Blockchain(difficulty=1)
+        behind.chain = [Block(**blk.to_dict()) for blk in source.chain[:10]]
+        result = sync_with_peers(behind, [peer], self.logger)
+        self.assertEqual((result.fork_height, len(result.added)), (9, 20))
+        for bc in (fresh, behind):
+            self.assertEqual([blk.hash for blk in bc.chain], [blk.hash for blk in source.chain])
+        self.assertNotIn(MSG_GETCHAIN, requests)
+        self.assertEqual(requests, [MSG_GETCHAINSTREAM] * len(requests))
+
+    def test_stream_rejected_at_first_bad_block(self):
+        shared = build(5)
+        ours = build(20, start=shared)
+        theirs = build(30, start=shared)
+        blocks = [blk.to_dict() for blk in theirs.chain]
+        blocks[12]["data"] = "tampered"
+        read = []
+
+        def stream():
+            for blk in blocks:
+                read.append(blk["index"])
+                yield blk
+
+        before = [blk.hash for blk in ours.chain]
+        self.assertIsNone(ours.reorg_stream(stream()))
+        # Nothing past the bad block was read, and our chain is untouched
+        self.assertEqual(read[-1], 12)
+        self.assertEqual([blk.hash for blk in ours.chain], before)
+
+        # A bad block after the stream has overtaken us keeps the good part
+        blocks[12] = theirs.chain[12].to_dict()
+        blocks[25]["data"] = "tampered"
+        result = ours.reorg_stream(stream())
+        self.assertEqual((result.fork_height, len(result.added), len(result.removed)), (4, 20, 15))
+        self.assertEqual(ours.get_latest_block().hash, theirs.chain[24].hash)
+        self.assertTrue(ours.is_valid())
+
+if __name__ == '__main__':
+    unittest.main()
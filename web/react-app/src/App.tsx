@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { BrowserRouter as Router, Routes, Route, Link, Navigate } from 'react-router-dom';
 import { 
   Container, 
@@ -15,7 +15,7 @@ import {
 import RefreshIcon from '@mui/icons-material/Refresh';
 import { ReactFlowProvider } from 'reactflow';
 
-import { fetchBlockchain, Block } from './services/api';
+import { fetchBlockchain, fetchNewBlocks, subscribeToChain, Block } from './services/api';
 import LinearView from './views/LinearView';
 import TreeView from './views/TreeView';
 
@@ -25,6 +25,12 @@ function App() {
   const [error, setError] = useState<string | null>(null);
   const [refreshing, setRefreshing] = useState(false);
   const [lastRefresh, setLastRefresh] = useState<string>('');
+  // Latest blocks, for the pushed-block handler set up on first render
+  const blocksRef = useRef<Block[]>([]);
+
+  useEffect(() => {
+    blocksRef.current = blocks;
+  }, [blocks]);
 
   const loadBlockchain = async () => {
     try {
@@ -32,13 +38,16 @@ function App() {
       setRefreshing(true);
       const data = await fetchBlockchain();
       
-      // Check if we actually have new data to update
+      // Check if we actually have new data to update (against the latest
+      // blocks, as this also runs from the pushed-block handler)
+      const current = blocksRef.current;
       const hasChanged = 
-        blocks.length !== data.length || 
-        (data.length > 0 && blocks.length > 0 && data[data.length-1].hash !== blocks[blocks.length-1].hash);
+        current.length !== data.length || 
+        (data.length > 0 && current.length > 0 && data[data.length-1].hash !== current[current.length-1].hash);
         
       if (hasChanged) {
         console.log('Blockchain data changed, updating view');
+        blocksRef.current = data;
         setBlocks(data);
       } else {
         console.log('No blockchain changes detected');
@@ -58,14 +67,58 @@ function App() {
     }
   };
 
-  // Initial load only - no auto-refresh
+  // Fetch only the blocks added since our tip, falling back to a full
+  // load if the server has switched chains
+  const refreshBlockchain = async () => {
+    const current = blocksRef.current;
+    if (current.length === 0) {
+      return loadBlockchain();
+    }
+    try {
+      setRefreshing(true);
+      const newBlocks = await fetchNewBlocks(current[current.length - 1]);
+      if (newBlocks === null) {
+        await loadBlockchain();
+        return;
+      }
+      if (newBlocks.length > 0 && blocksRef.current === current) {
+        blocksRef.current = [...current, ...newBlocks];
+        setBlocks(blocksRef.current);
+      }
+      setLastRefresh(new Date().toLocaleTimeString());
+      setError(null);
+    } catch (err) {
+      console.error('Failed to refresh blockchain:', err);
+      setError('Failed to load blockchain data. Please try again.');
+    } finally {
+      setRefreshing(false);
+    }
+  };
+
+  // Initial load, then new blocks are pushed by the server
   useEffect(() => {
     loadBlockchain();
-    // No interval for automatic refresh
+    const unsubscribe = subscribeToChain(
+      (block) => {
+        const current = blocksRef.current;
+        const tip = current[current.length - 1];
+        if (tip && block.index === tip.index + 1 && block.previous_hash === tip.hash) {
+          blocksRef.current = [...current, block];
+          setBlocks(blocksRef.current);
+          setLastRefresh(new Date().toLocaleTimeString());
+        } else if (tip && block.index > tip.index) {
+          // We missed something: fetch what's new since our tip
+          refreshBlockchain();
+        }
+        // Otherwise we already have it, or the first load will bring it
+      },
+      () => loadBlockchain()
+    );
+    return unsubscribe;
   }, []);
 
   const handleRefresh = () => {
-    loadBlockchain();
+    refreshBlockchain();
   };
 
   const handleCloseError = () => {
@@ -88,7 +141,7 @@ function App() {
             </Button>
             <Box sx={{ display: 'flex', alignItems: 'center' }}>
               {lastRefresh && (
-                <Tooltip title="Last updated at this time. Manual refresh only.">
+                <Tooltip title="Last updated at this time. New blocks appear as they are mined.">
                   <Typography variant="caption" sx={{ mr: 1, color: 'rgba(255,255,255,0.7)' }}>
                     Last: {lastRefresh}
                   </Typography>
@@ -73,49 +73,23 @@ export const fetchBlockchain = async (): Promise<Block[]> => {
     
     // If we have more blocks to fetch and pagination info is available
     if (totalBlocks > 20 && totalPages > 1) {
-      console.log(`Chain has ${totalBlocks} blocks across ${totalPages} pages, fetching remaining data...`);
+      console.log(`Chain has ${totalBlocks} blocks, fetching the rest...`);
       
       try {
-        // Fetch remaining pages in parallel
-        const pagePromises = [];
-        
-        // Limit to a reasonable number of parallel requests
-        const MAX_PARALLEL_REQUESTS = 3;
-        const BLOCKS_PER_PAGE = 20;
-        
-        // Fetch a few pages at a time to avoid overwhelming the server
-        for (let page = 2; page <= totalPages; page += MAX_PARALLEL_REQUESTS) {
-          const pageGroup = [];
-          
-          // Create a batch of promises for pages
-          for (let i = 0; i < MAX_PARALLEL_REQUESTS && (page + i) <= totalPages; i++) {
-            const currentPage = page + i;
-            console.log(`Fetching page ${currentPage}...`);
-            pageGroup.push(
-              axios.get(`${API_URL}/chain?page=${currentPage}&per_page=${BLOCKS_PER_PAGE}`, options)
-                .then(response => {
-                  console.log(`Received page ${currentPage} with ${response.data.length} blocks`);
-                  return response.data;
-                })
-                .catch(err => {
-                  console.warn(`Error fetching page ${currentPage}:`, err);
-                  return []; // Return empty array for failed pages
-                })
-            );
-          }
-          
-          // Wait for this batch to complete before starting the next
-          const pageResults = await Promise.all(pageGroup);
-          pagePromises.push(...pageResults);
-          
-          // Give the server a small break between batches
-          if (page + MAX_PARALLEL_REQUESTS <= totalPages) {
-            await new Promise(resolve => setTimeout(resolve, 500));
-          }
+        // Everything after the first page in one request, which the server
+        // streams (compressed) as it serialises the blocks
+        const last = allBlocks[allBlocks.length - 1];
+        const restResponse = await axios.get(`${API_URL}/chain?since_hash=${last.hash}`, {
+          ...options,
+          validateStatus: (status: number) => status === 200 || status === 409
+        });
+        let remainingBlocks: Block[] = restResponse.data;
+        if (restResponse.status === 409) {
+          // The chain changed under us: take the whole of it instead
+          console.log('Chain changed while loading, fetching it whole');
+          allBlocks = [];
+          remainingBlocks = (await axios.get(`${API_URL}/chain`, options)).data;
         }
-        
-        // Combine all pages
-        let remainingBlocks = pagePromises.flat();
         console.log(`Fetched ${remainingBlocks.length} additional blocks`);
         
         // Combine with first page, ensuring no duplicates
@@ -133,7 +107,7 @@ export const fetchBlockchain = async (): Promise<Block[]> => {
         
         console.log(`Final blockchain has ${allBlocks.length} blocks`);
       } catch (err) {
-        console.warn('Error fetching additional pages, using partial data:', err);
+        console.warn('Error fetching additional blocks, using partial data:', err);
       }
     } else if (totalBlocks > 0 && totalBlocks !== allBlocks.length) {
       // If headers indicate more blocks but we couldn't fetch pages, try once more with a direct request
@@ -157,42 +131,110 @@ export const fetchBlockchain = async (): Promise<Block[]> => {
     }
     
     // Parse block data and enhance with parsedData property
-    return allBlocks.map((block: Block) => {
-      try {
-        // Parse the block data
-        const parsedData = JSON.parse(block.data);
-        block.parsedData = parsedData;
-        
-        // Make sure storyPosition is properly formatted
-        if (!parsedData.storyPosition && (parsedData.Book || parsedData.Chapter)) {
-          parsedData.storyPosition = {
-            book: parsedData.Book,
-            chapter: parsedData.Chapter,
-            verse: parsedData.Verse
-          };
-        }
-        
-        // Do the same for previousPosition
-        if (!parsedData.previousPosition && parsedData.previousBook) {
-          parsedData.previousPosition = {
-            book: parsedData.previousBook,
-            chapter: parsedData.previousChapter,
-            verse: parsedData.previousVerse
-          };
-        }
-        
-      } catch (e) {
-        console.warn(`Error parsing block #${block.index} data:`, e);
-        block.parsedData = { Content: block.data };
-      }
-      return block;
-    });
+    return allBlocks.map(parseBlock);
   } catch (error) {
     console.error('Error fetching blockchain:', error);
     throw error;
   }
 };
 
+// Blocks fetched per request when catching up
+const DELTA_PAGE_SIZE = 500;
+
+// Fetch the blocks added after tip (the last block we have). Returns null if
+// tip is no longer on the server's chain, in which case the whole chain has
+// to be fetched again. When nothing is new this is one request answered
+// with 304 and no body.
+export const fetchNewBlocks = async (tip: Block): Promise<Block[] | null> => {
+  const newBlocks: Block[] = [];
+  let last = tip;
+  for (;;) {
+    const response = await axios.get(`${API_URL}/chain?since_hash=${last.hash}&per_page=${DELTA_PAGE_SIZE}`, {
+      // The server's ETag is its tip hash
+      headers: { 'If-None-Match': `"${last.hash}"` },
+      validateStatus: status => status === 200 || status === 304 || status === 409
+    });
+    if (response.status === 409) {
+      console.log('Our tip is no longer on the chain, reloading');
+      return null;
+    }
+    if (response.status === 304 || response.data.length === 0) break;
+    for (const block of response.data as Block[]) {
+      // The chain changed between requests
+      if (block.previous_hash !== last.hash) return null;
+      newBlocks.push(parseBlock(block));
+      last = block;
+    }
+    if (response.data.length < DELTA_PAGE_SIZE) break;
+  }
+  console.log(`Fetched ${newBlocks.length} new blocks`);
+  return newBlocks;
+};
+
+// Parse a block's data into its parsedData property
+export const parseBlock = (block: Block): Block => {
+  try {
+    // Parse the block data
+    const parsedData = JSON.parse(block.data);
+    block.parsedData = parsedData;
+    
+    // Make sure storyPosition is properly formatted
+    if (!parsedData.storyPosition && (parsedData.Book || parsedData.Chapter)) {
+      parsedData.storyPosition = {
+        book: parsedData.Book,
+        chapter: parsedData.Chapter,
+        verse: parsedData.Verse
+      };
+    }
+    
+    // Do the same for previousPosition
+    if (!parsedData.previousPosition && parsedData.previousBook) {
+      parsedData.previousPosition = {
+        book: parsedData.previousBook,
+        chapter: parsedData.previousChapter,
+        verse: parsedData.previousVerse
+      };
+    }
+    
+  } catch (e) {
+    console.warn(`Error parsing block #${block.index} data:`, e);
+    block.parsedData = { Content: block.data };
+  }
+  return block;
+};
+
+// Subscribe to new blocks pushed by the server over server-sent events.
+// onBlock gets each block appended to the chain; onReset is called when the
+// server switched to another chain (or we fell behind) and the whole chain
+// should be fetched again. Returns a function that closes the subscription.
+export const subscribeToChain = (
+  onBlock: (block: Block) => void,
+  onReset: () => void
+): (() => void) => {
+  // The browser reconnects by itself, sending the id of the last block it
+  // got so the server can send the ones it missed
+  const source = new EventSource(`${API_URL}/events`);
+  
+  source.addEventListener('block', (event) => {
+    try {
+      onBlock(parseBlock(JSON.parse((event as MessageEvent).data)));
+    } catch (e) {
+      console.warn('Error handling pushed block:', e);
+    }
+  });
+  
+  source.addEventListener('reset', () => {
+    console.log('Server switched chains, reloading');
+    onReset();
+  });
+  
+  source.onerror = () => {
+    console.warn('Block event stream interrupted, reconnecting...');
+  };
+  
+  return () => source.close();
+};
+
 // Helper functions
 export const formatPosition = (position?: Position): string => {
   if (!position) return 'Unknown';
@@ -245,8 +287,72 @@ export const getPositionKey = (position?: Position): string => {
   return JSON.stringify(position);
 };
 
-// Build tree structure from blocks
-export const buildBlockTree = (blocks: Block[]) => {
+// Key of a block's node in the story tree: its position hash, as the
+// server's tree uses
+export const getNodeKey = (block: Block): string => {
+  return block.position_hash || getPositionKey(block.parsedData?.storyPosition);
+};
+
+export interface BlockTree {
+  positionMap: Map<string, Block>;
+  childrenMap: Map<string, string[]>;
+  rootNodes: Block[];
+  // Positions with children that haven't been fetched yet
+  truncated: Set<string>;
+}
+
+// Levels fetched below each root, and below a node when it is expanded
+export const TREE_DEPTH = 4;
+
+// Fetch one subtree from the server and add it to tree (in place)
+const mergeSubtree = async (tree: BlockTree, positionHash: string, depth: number): Promise<void> => {
+  const response = await axios.get(`${API_URL}/chain/tree/${positionHash}?depth=${depth}`);
+  const { blocks, children, truncated } = response.data;
+  blocks.forEach((block: Block) => tree.positionMap.set(getNodeKey(block), parseBlock(block)));
+  Object.entries(children as Record<string, string[]>).forEach(([key, keys]) => {
+    tree.childrenMap.set(key, keys);
+    tree.truncated.delete(key);
+  });
+  truncated.forEach((key: string) => tree.truncated.add(key));
+};
+
+// Fetch the story tree from the server: the roots and TREE_DEPTH levels
+// below them, plus the subtrees under the given expanded positions. Only
+// the blocks in view are downloaded, and only their data is parsed.
+export const fetchBlockTree = async (expanded: string[] = []): Promise<BlockTree> => {
+  const response = await axios.get(`${API_URL}/chain/tree`);
+  const tree: BlockTree = {
+    positionMap: new Map(),
+    childrenMap: new Map(),
+    rootNodes: [],
+    truncated: new Set()
+  };
+  const roots: string[] = response.data.roots;
+  await Promise.all(roots.map(root => mergeSubtree(tree, root, TREE_DEPTH)));
+  for (const key of expanded) {
+    if (tree.truncated.has(key)) {
+      await mergeSubtree(tree, key, TREE_DEPTH);
+    }
+  }
+  tree.rootNodes = roots.map(root => tree.positionMap.get(root)).filter((b): b is Block => !!b);
+  console.log('Fetched tree:', {positions: tree.positionMap.size, roots: roots.length, total: response.data.size});
+  return tree;
+};
+
+// Fetch the levels below a truncated position into a copy of tree
+export const expandBlockTree = async (tree: BlockTree, positionHash: string): Promise<BlockTree> => {
+  const expanded: BlockTree = {
+    positionMap: new Map(tree.positionMap),
+    childrenMap: new Map(tree.childrenMap),
+    rootNodes: tree.rootNodes,
+    truncated: new Set(tree.truncated)
+  };
+  await mergeSubtree(expanded, positionHash, TREE_DEPTH);
+  return expanded;
+};
+
+// Build tree structure from blocks, for when the server's tree can't be fetched
+export const buildBlockTree = (blocks: Block[]): BlockTree => {
   const positionMap = new Map<string, Block>();
   const childrenMap = new Map<string, string[]>();
   const rootNodes: Block[] = [];
@@ -258,7 +364,7 @@ export const buildBlockTree = (blocks: Block[]) => {
     if (block.index === 0) return; // Skip genesis
     
     if (block.parsedData?.storyPosition) {
-      const posKey = getPositionKey(block.parsedData.storyPosition);
+      const posKey = getNodeKey(block);
       // Check if we already have this position (to avoid duplicates)
       if (!positionMap.has(posKey)) {
         positionMap.set(posKey, block);
@@ -275,15 +381,15 @@ export const buildBlockTree = (blocks: Block[]) => {
     if (block.index === 0) return; // Skip genesis
     
     if (block.parsedData?.storyPosition) {
-      const posKey = getPositionKey(block.parsedData.storyPosition);
+      const posKey = getNodeKey(block);
       
       // Check if this is a root node (no previous position)
-      if (!block.parsedData.previousPosition) {
+      if (!block.parsedData.previousPosition && !block.previous_position_hash) {
         console.log(`Found root node: Block #${block.index}`);
         rootNodes.push(block);
       } else {
         // Add as a child to its parent
-        const parentKey = getPositionKey(block.parsedData.previousPosition);
+        const parentKey = block.previous_position_hash || getPositionKey(block.parsedData.previousPosition);
         
         // Only add if parent exists in our map
         if (positionMap.has(parentKey)) {
@@ -308,5 +414,5 @@ export const buildBlockTree = (blocks: Block[]) => {
      rootIndices: rootNodes.map(n => n.index)
     });
   
-  return { positionMap, childrenMap, rootNodes };
+  return { positionMap, childrenMap, rootNodes, truncated: new Set<string>() };
 }; 
\ No newline at end of file
@@ -14,7 +14,15 @@ import ReactFlow, {
   Position
 } from 'reactflow';
 import 'reactflow/dist/style.css';
-import { Block, buildBlockTree, getPositionKey, formatPosition } from '../services/api';
+import {
+  Block,
+  BlockTree,
+  buildBlockTree,
+  fetchBlockTree,
+  expandBlockTree,
+  getNodeKey,
+  formatPosition
+} from '../services/api';
 
 interface FlowWithProviderProps {
   nodes: Node[];
@@ -123,7 +131,7 @@ const CustomNode = ({ data }: { data: any }) => {
     );
   }
   
-  const { block } = data;
+  const { block, truncated, onExpand } = data;
   const { parsedData } = block;
   
   return (
@@ -184,6 +192,11 @@ const CustomNode = ({ data }: { data: any }) => {
           <span>From: {formatPosition(parsedData?.previousPosition)}</span>
         )}
       </div>
+      {truncated && (
+        <Button size="small" fullWidth sx={{ mt: 1 }} onClick={() => onExpand(getNodeKey(block))}>
+          Show continuations
+        </Button>
+      )}
     </div>
   );
 };
@@ -204,46 +217,45 @@ const TreeView: React.FC<TreeViewProps> = ({ blocks, loading }) => {
   // State to track if debugging info should be shown
   const [showDebug, setShowDebug] = useState(false);
   
-  // Track previous block count to avoid unnecessary rebuilds
-  const [prevBlockCount, setPrevBlockCount] = useState(0);
+  // Positions the user expanded, fetched again when the tree is refreshed
+  const [expanded, setExpanded] = useState<string[]>([]);
   
   // Setup initial state for tree data
-  const [treeData, setTreeData] = useState<{
-    positionMap: Map<string, Block>;
-    childrenMap: Map<string, string[]>;
-    rootNodes: Block[];
-  }>({
+  const [treeData, setTreeData] = useState<BlockTree>({
     positionMap: new Map(),
     childrenMap: new Map(),
-    rootNodes: []
+    rootNodes: [],
+    truncated: new Set()
   });
   
-  // Check if we need to rebuild the tree when blocks change
+  // Fetch the tree from the server whenever the chain's tip changes; the
+  // server keeps it up to date, so only the part in view is downloaded
+  const tipHash = blocks.length > 0 ? blocks[blocks.length - 1].hash : '';
   useEffect(() => {
-    // Compare if we have new blocks
-    const currentBlockCount = blocks.length;
-    const hasNewBlocks = currentBlockCount > prevBlockCount;
-    
-    if (hasNewBlocks || (currentBlockCount > 0 && treeData.positionMap.size === 0)) {
-      console.log('Building new tree due to changes:', currentBlockCount);
-      
-      // Build new tree
-      const result = buildBlockTree(blocks);
-      setTreeData(result);
-      setPrevBlockCount(currentBlockCount);
-      
-      // Debug info
-      console.log('Tree structure updated:', {
-        blocks: blocks.length,
-        positionMap: result.positionMap.size,
-        childrenMap: result.childrenMap.size,
-        rootNodes: result.rootNodes.length
+    if (!tipHash) return;
+    let cancelled = false;
+    fetchBlockTree(expanded)
+      .catch(err => {
+        console.warn('Could not fetch the story tree, building it from the chain:', err);
+        return buildBlockTree(blocks);
+      })
+      .then(result => {
+        if (!cancelled) setTreeData(result);
       });
-    }
-  }, [blocks, prevBlockCount, treeData.positionMap.size]);
+    return () => { cancelled = true; };
+    // expanded is read only when the tip changes; expanding fetches on its own
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [tipHash]);
+  
+  const handleExpand = useCallback((positionHash: string) => {
+    setExpanded(current => [...current, positionHash]);
+    expandBlockTree(treeData, positionHash)
+      .then(setTreeData)
+      .catch(err => console.warn(`Could not expand ${positionHash}:`, err));
+  }, [treeData]);
   
   // Use the tree data to create nodes and edges
-  const { positionMap, childrenMap, rootNodes } = treeData;
+  const { positionMap, childrenMap, rootNodes, truncated } = treeData;
   
   // Create nodes and edges for ReactFlow with improved layout
   const { nodes, edges } = useMemo(() => {
@@ -275,13 +287,13 @@ const TreeView: React.FC<TreeViewProps> = ({ blocks, loading }) => {
         return 0;
       }
       
-      const posKey = getPositionKey(block.parsedData.storyPosition);
+      const posKey = getNodeKey(block);
       
       // Create node
       nodes.push({
         id: posKey,
         type: 'customNode',
-        data: { block },
+        data: { block, truncated: truncated.has(posKey), onExpand: handleExpand },
         position: { x, y },
       });
       
@@ -356,7 +368,7 @@ const TreeView: React.FC<TreeViewProps> = ({ blocks, loading }) => {
       let startX = 0;
       rootNodes.forEach((rootNode: Block) => {
         console.log('Building tree from root node:', rootNode.index);
-        const rootWidth = calculateSubtreeWidth(getPositionKey(rootNode.parsedData?.storyPosition || {}));
+        const rootWidth = calculateSubtreeWidth(getNodeKey(rootNode));
         startX += rootWidth / 2;
         buildTree(rootNode, startX, 100);
         startX += rootWidth / 2 + 100; // Add extra space between root trees
@@ -365,7 +377,7 @@ const TreeView: React.FC<TreeViewProps> = ({ blocks, loading }) => {
     
     console.log('Generated flow elements:', { nodes: nodes.length, edges: edges.length });
     return { nodes, edges };
-  }, [rootNodes, childrenMap, positionMap, blocks]);
+  }, [rootNodes, childrenMap, positionMap, truncated, handleExpand, blocks]);
   
   // Handle initial setup
   const onInit = useCallback(() => {